@@ -0,0 +1,243 @@
+"""Agregados del Dashboard mantenidos de forma incremental en PostgreSQL.
+
+Cada resumen (ventas por mes, valor por satélite, por tipo de tela y por
+proveedor) vive en su propia tabla (ver models.py) y se actualiza con triggers
+sobre las tablas de origen: cada INSERT/UPDATE/DELETE resta la contribución
+anterior de las filas y suma la nueva, así las rutas de gráficos leen unas
+pocas filas sin importar el tamaño del histórico. Los triggers son por
+sentencia, con tablas de transición (como en ledger.py): la sentencia suma su
+efecto por clave y actualiza cada fila del resumen una sola vez, en orden de
+clave. Con un orden fijo, dos transacciones que tocan las mismas claves en
+distinto orden (p. ej. dos productos que consumen los mismos materiales) se
+esperan en lugar de bloquearse mutuamente. Un TRUNCATE de la tabla de origen
+pone a cero su resumen y `rebuild` lo recalcula desde cero; `drift` compara
+un resumen con el recálculo sin modificarlo.
+"""
+from sqlalchemy import text
+
+# Cada especificación describe cómo contribuye una tabla de origen a un resumen.
+# En `key` y `value`, `{r}` se reemplaza por la tabla de transición (triggers) o
+# por la tabla; `columns` son las que afectan al resumen.
+# Una clave compuesta se declara con tuplas en `key_column` y `key`.
+SPECS = [
+    {
+        'name': 'ventas_mes', 'source': 'ventas', 'summary': 'resumen_ventas_mes',
+        'key_column': 'mes', 'key': "COALESCE(to_char({r}.sale_date, 'YYYY-MM'), '')",
+        'value': 'COALESCE({r}.total_sale, 0)', 'total': 'total', 'filas': 'filas',
+        'columns': ('sale_date', 'total_sale'),
+    },
+    {
+        'name': 'satelites', 'source': 'asignaciones_satelites', 'summary': 'resumen_satelites',
+        'key_column': 'satellite_name', 'key': "COALESCE({r}.satellite_name, '')",
+        'value': 'COALESCE({r}.total_price, 0)', 'total': 'total', 'filas': 'filas',
+        'columns': ('satellite_name', 'total_price'),
+    },
+    {
+        'name': 'tipos_tela', 'source': 'llegada_telas', 'summary': 'resumen_tipos_tela',
+        'key_column': 'tipo_de_tela', 'key': "COALESCE({r}.tipo_de_tela, '')",
+        'value': 'COALESCE({r}.cantidad_value * {r}.unit_value, 0)', 'total': 'total', 'filas': 'filas',
+        'columns': ('tipo_de_tela', 'cantidad_value', 'unit_value'),
+    },
+    {
+        'name': 'proveedores_telas', 'source': 'llegada_telas', 'summary': 'resumen_proveedores',
+        'key_column': 'proveedor', 'key': "COALESCE({r}.proveedor, '')",
+        'value': 'COALESCE({r}.cantidad_value * {r}.unit_value, 0)', 'total': 'total_telas', 'filas': 'filas_telas',
+        'columns': ('proveedor', 'cantidad_value', 'unit_value'),
+    },
+    {
+        'name': 'proveedores_materiales', 'source': 'llegada_material', 'summary': 'resumen_proveedores',
+        'key_column': 'proveedor', 'key': "COALESCE({r}.supplier, '')",
+        'value': 'COALESCE({r}.quantity_value * {r}.unit_value, 0)', 'total': 'total_materiales', 'filas': 'filas_materiales',
+        'columns': ('supplier', 'quantity_value', 'unit_value'),
+    },
+    {
+        'name': 'saldos_material', 'source': 'llegada_material', 'summary': 'saldos_material',
+        'key_column': ('material_name', 'size_value', 'size_unit', 'quantity_type'),
+        'key': (
+            "COALESCE({r}.material_name, '')", "COALESCE({r}.size_value, '')",
+            "COALESCE({r}.size_unit, '')", "COALESCE({r}.quantity_type, '')",
+        ),
+        'value': 'COALESCE({r}.quantity_value, 0)', 'total': 'total', 'filas': 'filas',
+        'columns': ('material_name', 'size_value', 'size_unit', 'quantity_type', 'quantity_value'),
+    },
+]
+
+
+def _as_tuple(value):
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _key_columns(spec):
+    return ', '.join(_as_tuple(spec['key_column']))
+
+
+def _key_values(spec, row):
+    return ', '.join(key.format(r=row) for key in _as_tuple(spec['key']))
+
+
+# Filas de transición que aporta cada operación, con su signo y la tabla de
+# transición opuesta (en un UPDATE se omiten las filas cuyas `columns` no cambiaron)
+_TRANSITIONS = {
+    'INSERT': (('nuevas', '', None),),
+    'UPDATE': (('anteriores', '-', 'nuevas'), ('nuevas', '', 'anteriores')),
+    'DELETE': (('anteriores', '-', None),),
+}
+SOURCE_ID = 'id'
+
+
+def _contributions(spec, alias, sign, other):
+    keys = _as_tuple(spec['key_column'])
+    values = ', '.join(f'{value} AS {key}' for key, value in zip(keys, _as_tuple(spec['key'])))
+    sql = f"SELECT {values}, {sign}{spec['value']} AS total, {sign}1 AS filas FROM {{r}}".format(r=alias)
+    if other is not None:
+        columns = ', '.join(spec['columns'])
+        sql += (
+            f" WHERE NOT EXISTS (SELECT 1 FROM {other} o WHERE o.{SOURCE_ID} = {alias}.{SOURCE_ID}"
+            f" AND (o.{columns.replace(', ', ', o.')}) IS NOT DISTINCT FROM"
+            f" ({alias}.{columns.replace(', ', f', {alias}.')}))"
+        )
+    return sql
+
+
+def _upsert(spec, op):
+    contributions = ' UNION ALL '.join(
+        _contributions(spec, alias, sign, other) for alias, sign, other in _TRANSITIONS[op]
+    )
+    return (
+        f"INSERT INTO {spec['summary']} AS s ({_key_columns(spec)}, {spec['total']}, {spec['filas']}) "
+        f"SELECT {_key_columns(spec)}, SUM(total), SUM(filas) FROM ({contributions}) d "
+        f"GROUP BY {_key_columns(spec)} "
+        f"ORDER BY {_key_columns(spec)} "
+        f"ON CONFLICT ({_key_columns(spec)}) DO UPDATE SET "
+        f"{spec['total']} = s.{spec['total']} + EXCLUDED.{spec['total']}, "
+        f"{spec['filas']} = s.{spec['filas']} + EXCLUDED.{spec['filas']};"
+    )
+
+
+def trigger_ddl(spec):
+    """Sentencias que crean (o reemplazan) los triggers de una especificación."""
+    function = f"damar_resumen_{spec['name']}"
+    # Una tabla de transición solo se admite en triggers de un único evento y sin lista de columnas
+    triggers = [
+        ('alta', 'INSERT', 'NEW TABLE AS nuevas'),
+        ('cambio', 'UPDATE', 'OLD TABLE AS anteriores NEW TABLE AS nuevas'),
+        ('baja', 'DELETE', 'OLD TABLE AS anteriores'),
+    ]
+    statements = [
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {_upsert(spec, 'INSERT')}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {_upsert(spec, 'UPDATE')}
+            ELSE
+                {_upsert(spec, 'DELETE')}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {function}_truncate() RETURNS trigger AS $$
+        BEGIN
+            UPDATE {spec['summary']} SET {spec['total']} = 0, {spec['filas']} = 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Trigger por fila de versiones anteriores
+        f"DROP TRIGGER IF EXISTS {function} ON {spec['source']};",
+    ]
+    for suffix, event, referencing in triggers:
+        statements += [
+            f"DROP TRIGGER IF EXISTS {function}_{suffix} ON {spec['source']};",
+            f"""
+            CREATE TRIGGER {function}_{suffix}
+            AFTER {event} ON {spec['source']} REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+            """,
+        ]
+    statements += [
+        f"DROP TRIGGER IF EXISTS {function}_truncate ON {spec['source']};",
+        f"""
+        CREATE TRIGGER {function}_truncate
+        AFTER TRUNCATE ON {spec['source']}
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}_truncate();
+        """,
+    ]
+    return statements
+
+
+def rebuild_sql(spec):
+    """Sentencias que recalculan desde cero la contribución de una especificación."""
+    source = spec['source']
+    return [
+        f"UPDATE {spec['summary']} SET {spec['total']} = 0, {spec['filas']} = 0;",
+        f"""
+        INSERT INTO {spec['summary']} ({_key_columns(spec)}, {spec['total']}, {spec['filas']})
+        SELECT {_key_values(spec, source)}, SUM({spec['value'].format(r=source)}), COUNT(*)
+        FROM {source} GROUP BY {_key_values(spec, source)}
+        ON CONFLICT ({_key_columns(spec)}) DO UPDATE SET
+            {spec['total']} = EXCLUDED.{spec['total']}, {spec['filas']} = EXCLUDED.{spec['filas']};
+        """,
+    ]
+
+
+def install(connection):
+    """Crea o actualiza los triggers de todos los resúmenes."""
+    for spec in SPECS:
+        for statement in trigger_ddl(spec):
+            connection.exec_driver_sql(statement)
+
+
+def drift_sql(spec):
+    """Consulta con las claves cuyo total o conteo difiere del recálculo desde la tabla de origen."""
+    source = spec['source']
+    keys = _as_tuple(spec['key_column'])
+    expected = ', '.join(f"{value} AS {key}" for key, value in zip(keys, _as_tuple(spec['key'])))
+    return f"""
+        WITH esperado AS (
+            SELECT {expected.format(r=source)}, SUM({spec['value'].format(r=source)}) AS total, COUNT(*) AS filas
+            FROM {source} GROUP BY {_key_values(spec, source)}
+        )
+        SELECT {', '.join(f'COALESCE(e.{key}, s.{key}) AS {key}' for key in keys)},
+               COALESCE(s.{spec['total']}, 0) AS total_guardado, COALESCE(e.total, 0) AS total_esperado,
+               COALESCE(s.{spec['filas']}, 0) AS filas_guardadas, COALESCE(e.filas, 0) AS filas_esperadas
+        FROM esperado e
+        FULL JOIN {spec['summary']} s ON {' AND '.join(f's.{key} = e.{key}' for key in keys)}
+        -- Tolerancia relativa: las sumas incrementales y el recálculo redondean distinto
+        WHERE abs(COALESCE(s.{spec['total']}, 0) - COALESCE(e.total, 0)) > 1e-6 * GREATEST(1, abs(COALESCE(e.total, 0)))
+           OR COALESCE(s.{spec['filas']}, 0) <> COALESCE(e.filas, 0)
+        ORDER BY {', '.join(f'{i + 1}' for i in range(len(keys)))}
+    """
+
+
+def _specs(names):
+    if names is None:
+        return SPECS
+    unknown = set(names) - {spec['name'] for spec in SPECS}
+    if unknown:
+        raise ValueError(f"Resúmenes desconocidos: {', '.join(sorted(unknown))}")
+    return [spec for spec in SPECS if spec['name'] in names]
+
+
+def rebuild(connection, names=None):
+    """Recalcula los resúmenes `names` (todos si es None) desde las tablas de origen."""
+    for spec in _specs(names):
+        for statement in rebuild_sql(spec):
+            connection.exec_driver_sql(statement)
+
+
+def drift(connection, names=None):
+    """Devuelve `{nombre: filas con diferencias}` comparando cada resumen con su recálculo."""
+    return {spec['name']: connection.exec_driver_sql(drift_sql(spec)).mappings().all() for spec in _specs(names)}
+
+
+def summary_tables():
+    return sorted({spec['summary'] for spec in SPECS})
+
+
+def lock(connection):
+    """Serializa la instalación entre procesos que arrancan a la vez."""
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('damar_aggregates'))"))
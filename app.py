@@ -1,10 +1,20 @@
 import os
 import logging
 import json
-from flask import Flask, request, jsonify, send_from_directory
+import math
+import base64
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from sqlalchemy import func, desc
+from sqlalchemy import event, func, desc, or_, and_, select, text, tuple_, Integer, Float, JSON, values as sa_values, column as sa_column
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import datetime
+import click
 from psycopg2.errors import UniqueViolation as PgUniqueViolation 
 from sqlalchemy.exc import IntegrityError # Importación de error de SQLAlchemy
 
@@ -13,16 +23,30 @@ from models import (
     db, Usuario, Empleado, Cliente, Proveedor, Banco, LlegadaMaterial, 
     LlegadaTela, HistorialTela, ProductoTerminado, ProgramacionCorte, 
     AsignacionSatelite, EntregaSatelite, PagoSatelite, Venta, 
-    ProveedorHistorial, DynamicCode
+    ProveedorHistorial, DynamicCode, ResumenVentasMes, ResumenSatelite, ResumenTipoTela,
+    ResumenProveedor, SaldoMaterial
 )
+import aggregates
+import compression
+import events
+import filters
+import ledger
+import migrations
+import pooling
+import sales
+import static_assets
+import sync
+import usage
+import versions
+from serializers import serializer_for, build_all as build_serializers, dumps as fast_dumps
 
 # --- Configuración de Logging ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Configuración de la Aplicación Flask ---
-app = Flask(__name__, static_folder='.', static_url_path='')
-CORS(app, resources={r"/*": {"origins": "*"}})
+app = Flask(__name__, static_folder=None)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor', 'Link', 'ETag'])
 
 # --- Configuración de la Base de Datos ---
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -37,38 +61,483 @@ app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 
+# --- Pool de conexiones ---
+# Un pool por proceso (worker de gunicorn). Por defecto tiene una conexión por
+# hilo del worker (GUNICORN_THREADS, ver gunicorn.conf.py) más un pequeño
+# desborde; el total en PostgreSQL es workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# más una conexión LISTEN por worker para /events. DB_STATEMENT_TIMEOUT_MS
+# corta las consultas desbocadas (0 lo desactiva; las migraciones lo anulan).
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 5)))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'poolclass': pooling.InstrumentedQueuePool,
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': True,
+    'connect_args': {
+        'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}',
+        'application_name': os.environ.get('DB_APPLICATION_NAME', 'damar-app'),
+    },
+}
+
 # --- Vincula la base de datos con la aplicación ---
 db.init_app(app)
 
-# --- Función Auxiliar para convertir modelos a diccionarios ---
+# --- Serialización de modelos ---
+# Los serializadores se precompilan una vez por modelo (ver serializers.py) y
+# `jsonify` usa el codificador rápido (orjson cuando está instalado).
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return fast_dumps(obj, default=self.default)
+
+app.json = FastJSONProvider(app)
+build_serializers(db.Model)
+
 def model_to_dict(model_instance):
     """Convierte una instancia de modelo SQLAlchemy a un diccionario."""
     if model_instance is None:
         return None
-    d = {}
-    for column in model_instance.__table__.columns:
-        value = getattr(model_instance, column.name)
-        if isinstance(value, (datetime.datetime, datetime.date)):
-            d[column.name] = value.isoformat()
-        elif isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
-            try:
-                d[column.name] = json.loads(value)
-            except json.JSONDecodeError:
-                d[column.name] = value
-        else:
-            d[column.name] = value
-    return d
+    return serializer_for(type(model_instance))(model_instance)
+
+# --- Paginación por cursor (keyset) para las rutas de colecciones ---
+# Todas las rutas GET de colecciones devuelven como máximo `limit` filas ordenadas
+# de forma estable (clave primaria o timestamp + clave primaria). El cuerpo sigue
+# siendo un arreglo JSON; el cursor de la siguiente página viaja en las cabeceras
+# `X-Next-Cursor` y `Link`. La respuesta completa sin paginar solo se obtiene
+# pidiéndola explícitamente con `?all=true`.
+PAGE_LIMIT_DEFAULT = int(os.environ.get('PAGE_LIMIT_DEFAULT', 500))
+PAGE_LIMIT_MAX = int(os.environ.get('PAGE_LIMIT_MAX', 5000))
+
+class PaginationError(ValueError):
+    """Parámetros de paginación inválidos; se responde con un 400."""
+
+@app.errorhandler(PaginationError)
+def handle_pagination_error(e):
+    return jsonify({'success': False, 'message': str(e)}), 400
+
+def arg_flag(name):
+    """Interpreta un parámetro de query string como booleano (`?all=true`, `?all=1`)."""
+    return request.args.get(name, '').strip().lower() in ('1', 'true', 'yes', 'si', 'sí')
+
+def _parse_limit():
+    raw = request.args.get('limit')
+    if raw is None or raw == '':
+        return PAGE_LIMIT_DEFAULT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError('El parámetro "limit" debe ser un número entero.')
+    if limit < 1:
+        raise PaginationError('El parámetro "limit" debe ser mayor que cero.')
+    return min(limit, PAGE_LIMIT_MAX)
+
+def encode_cursor(values):
+    """Codifica los valores de la última fila de una página como cursor opaco."""
+    raw = json.dumps([v.isoformat() if isinstance(v, (datetime.datetime, datetime.date)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Decodifica un cursor generado por `encode_cursor` para las columnas dadas."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        decoded = []
+        for column, value in zip(columns, values):
+            if value is not None and isinstance(column.type, db.DateTime):
+                value = datetime.datetime.fromisoformat(value)
+            elif value is not None and isinstance(column.type, db.Date):
+                value = datetime.date.fromisoformat(value)
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError):
+        raise PaginationError('El cursor "after" no es válido.')
+
+def _keyset_order(columns, descending):
+    if len(columns) == 1:
+        return [columns[0].desc() if descending else columns[0].asc()]
+    order_col, pk = columns
+    return [
+        (order_col.desc() if descending else order_col.asc()).nullslast(),
+        pk.desc() if descending else pk.asc(),
+    ]
+
+def _keyset_filter(columns, values, descending):
+    """Condición "filas posteriores al cursor" coherente con `_keyset_order` (NULLS LAST).
+
+    Con columna de orden y clave primaria es una comparación de filas
+    `(col, pk) < (v, p)` (o `>` ascendente), que el índice sobre `(col, pk)`
+    resuelve como un rango: las páginas profundas no recorren las anteriores.
+    Esa comparación deja fuera las filas con `col` NULL, que van al final;
+    las agrega `_null_tail` cuando se agotan las demás. Con el cursor ya en la
+    cola NULL la condición es `col IS NULL AND pk < p`.
+    """
+    if len(columns) == 1:
+        return columns[0] < values[0] if descending else columns[0] > values[0]
+    order_col, pk = columns
+    order_value, pk_value = values
+    if order_value is None:
+        return and_(order_col.is_(None), pk < pk_value if descending else pk > pk_value)
+    row, cursor = tuple_(order_col, pk), tuple_(order_value, pk_value)
+    return row < cursor if descending else row > cursor
+
+def _null_tail(columns, values):
+    """Condición de la cola NULL que sigue a un cursor con valor de orden no nulo (o None)."""
+    if len(columns) == 2 and values[0] is not None:
+        return columns[0].is_(None)
+    return None
+
+# --- Filtros, orden y búsqueda (`?campo=`, `?campo__gte=`, `?order_by=`, `?q=`) ---
+# Gramática común a todas las rutas de colecciones (ver filters.py); se aplica
+# antes de paginar, así una búsqueda devuelve solo la página pedida de las filas
+# que coinciden. `route_args` son los parámetros propios de la ruta.
+COLLECTION_ARGS = ('limit', 'after', 'all', 'stream', 'since')
+
+@app.errorhandler(filters.FilterError)
+def handle_filter_error(e):
+    return jsonify({'success': False, 'message': str(e)}), 400
+
+def _next_page_url(cursor):
+    args = request.args.to_dict(flat=False)
+    args['after'] = [cursor]
+    return f"{request.base_url}?{urlencode(args, doseq=True)}"
+
+# --- Respuestas JSON en streaming ---
+# Con `?stream=true` la colección se lee del servidor por bloques (cursor del lado
+# del servidor vía `yield_per`) y el arreglo JSON se emite a medida que llegan las
+# filas, así la memoria por petición no depende del tamaño de la tabla.
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 1000))
+
+def stream_json_array(query, serializer=model_to_dict, chunk_size=None):
+    """Emite el resultado de `query` como un arreglo JSON incremental."""
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+
+    def generate():
+        yield '['
+        first = True
+        buffer = []
+        for item in query.yield_per(chunk_size):
+            buffer.append(fast_dumps(serializer(item)))
+            if len(buffer) >= chunk_size:
+                yield ('' if first else ',') + ','.join(buffer)
+                first = False
+                buffer = []
+        if buffer:
+            yield ('' if first else ',') + ','.join(buffer)
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+# --- Respuestas condicionales (ETag) ---
+# El ETag de una colección se deriva de la versión de sus tablas (ver
+# versions.py) y de la URL pedida, así que leerlo cuesta una lectura del índice
+# de table_changes. Con `If-None-Match` vigente se responde 304 sin ejecutar la consulta
+# principal; `Cache-Control: no-cache` hace que el navegador revalide siempre.
+# ETAG_SALT permite invalidar todos los ETag al desplegar cambios de formato.
+ETAG_SALT = os.environ.get('ETAG_SALT', '')
+
+def collection_etag(tables):
+    """ETag débil de la petición actual según la versión de `tables`."""
+    table_versions = versions.current_versions(db.session, tables)
+    digest = hashlib.sha1(ETAG_SALT.encode('utf-8'))
+    digest.update(request.full_path.encode('utf-8'))
+    for table in sorted(table_versions):
+        digest.update(f'|{table}:{table_versions[table]}'.encode('utf-8'))
+    return digest.hexdigest()
+
+def _with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def collection_response(query, model, order_column=None, descending=False, serializer=model_to_dict, tables=None,
+                        route_args=()):
+    """Responde una colección paginada por cursor (`?limit=&after=`).
+
+    El orden es estable: por `order_column` (si se indica) desempatando por la
+    clave primaria, o solo por la clave primaria; `?order_by=` lo reemplaza y
+    los demás parámetros que no son de paginación ni de `route_args` filtran
+    la colección (ver filters.py). Con `?all=true` se devuelve la
+    colección completa, como antes de la paginación, y con `?stream=true` se
+    emite en streaming desde el cursor `after` (sin límite salvo que se pida).
+
+    La respuesta lleva un ETag según la versión de `tables` (por defecto la
+    tabla del modelo) y se contesta 304 si el cliente ya la tiene.
+    """
+    etag = collection_etag(tables or (model.__table__.name,))
+    if request.if_none_match.contains_weak(etag):
+        return _with_etag(Response(status=304), etag)
+    return _with_etag(_collection_body(query, model, order_column, descending, serializer, route_args), etag)
+
+def _collection_body(query, model, order_column, descending, serializer, route_args=()):
+    pk = getattr(model, model.__mapper__.primary_key[0].key)
+    ignore = COLLECTION_ARGS + tuple(route_args)
+    if request.args.get('since') is not None:
+        # Un filtro no puede informar las filas que dejan de cumplirlo: la copia local quedaría desfasada
+        if filters.requested(request.args, ignore):
+            raise filters.FilterError('La sincronización con "since" no admite filtros, orden ni búsqueda.')
+        return sync_response(query, model, pk, serializer)
+    query = filters.apply(query, model, request.args, ignore)
+    if request.args.get(filters.ORDER_ARG):
+        order_column, descending = filters.ordering(model, request.args[filters.ORDER_ARG])
+        if order_column is pk:
+            order_column = None
+    columns = [order_column, pk] if order_column is not None else [pk]
+    query = query.order_by(*_keyset_order(columns, descending))
+
+    page, tail = query, None
+    after = request.args.get('after')
+    if after:
+        values = decode_cursor(after, columns)
+        keyset, tail = _keyset_filter(columns, values, descending), _null_tail(columns, values)
+        page = query.filter(keyset)
+
+    if arg_flag('stream') or arg_flag('all'):
+        rest = page if tail is None else query.filter(or_(keyset, tail))
+        if arg_flag('stream'):
+            if request.args.get('limit'):
+                rest = rest.limit(_parse_limit())
+            return stream_json_array(rest, serializer)
+        return jsonify([serializer(item) for item in rest.all()])
+
+    limit = _parse_limit()
+    items = page.limit(limit + 1).all()
+    if tail is not None and len(items) <= limit:
+        items += query.filter(tail).limit(limit + 1 - len(items)).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    response = jsonify([serializer(item) for item in items])
+    if has_more:
+        last = items[-1]
+        cursor = encode_cursor([getattr(last, c.key) for c in columns])
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{_next_page_url(cursor)}>; rel="next"'
+    return response
+
+# --- Sincronización incremental (`?since=<cursor>`) ---
+# Devuelve solo las filas escritas y las claves borradas desde el cursor (ver
+# sync.py), junto con el cursor para la siguiente consulta. `?since=0` entrega
+# la colección completa para inicializar la copia local; `reset: true` indica
+# que el cliente debe reemplazar su copia con `changes` (primera carga, TRUNCATE
+# o lápidas podadas).
+def _parse_since():
+    try:
+        since = int(request.args['since'])
+    except ValueError:
+        raise PaginationError('El cursor "since" no es válido.')
+    if since < 0:
+        raise PaginationError('El cursor "since" no es válido.')
+    return since
+
+def sync_response(query, model, pk, serializer=model_to_dict):
+    since = _parse_since()
+    # El cursor se toma antes de leer: lo escrito por transacciones abiertas se reenvía la próxima vez
+    cursor = sync.snapshot_cursor(db.session)
+    if since and sync.needs_reset(db.session, model, since):
+        since = 0
+    items = query.filter(model.updated_xid >= since).order_by(model.updated_xid, pk).all()
+    return jsonify({
+        'cursor': cursor,
+        'reset': since == 0,
+        'changes': [serializer(item) for item in items],
+        'deleted': sync.deleted_ids(db.session, model, since) if since else [],
+    })
+
+# --- Compresión de las respuestas de la API ---
+# Las respuestas JSON/texto que superan COMPRESS_MIN_SIZE bytes se comprimen con
+# la mejor codificación aceptada por el cliente (zstd, br o gzip, ver
+# compression.py); las de `?stream=true` se comprimen bloque a bloque. Cada
+# ruta puede ajustar el umbral y los niveles, o desactivarla, con `@compress_route`.
+COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVELS = {
+    encoding: int(os.environ.get(f'COMPRESS_LEVEL_{encoding.upper()}', level))
+    for encoding, level in compression.DYNAMIC_LEVELS.items()
+}
+COMPRESSIBLE_MIMETYPES = frozenset({'application/json', 'text/plain', 'text/csv', 'text/html'})
+
+def compress_route(enabled=True, min_size=None, levels=None):
+    """Ajusta la compresión de una ruta: `levels` es `{codificación: nivel}`."""
+    def decorator(view):
+        view.compression = {'enabled': enabled, 'min_size': min_size, 'levels': levels or {}}
+        return view
+    return decorator
+
+@app.after_request
+def compress_response(response):
+    view = app.view_functions.get(request.endpoint)
+    settings = getattr(view, 'compression', None) or {}
+    if (not COMPRESS_ENABLED or not settings.get('enabled', True) or request.method == 'HEAD'
+            or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    min_size = settings.get('min_size') or COMPRESS_MIN_SIZE
+    if not response.is_streamed and (response.content_length or 0) < min_size:
+        return response
+    encoding = compression.negotiate(
+        request.headers.get('Accept-Encoding'),
+        compression.available_encodings(compression.DYNAMIC_PREFERENCE),
+        compression.DYNAMIC_PREFERENCE,
+    )
+    if encoding is None:
+        return response
+
+    level = settings.get('levels', {}).get(encoding, COMPRESS_LEVELS[encoding])
+    if response.is_streamed:
+        response.response = compression.compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compression.compress(response.get_data(), encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# --- Seguimiento de escrituras confirmadas ---
+# Cada sesión acumula los nombres de las tablas que escribe (flush del ORM y
+# sentencias INSERT/UPDATE/DELETE ejecutadas con `db.session.execute`). Al
+# confirmar la transacción se avisa a los oyentes registrados con
+# `on_tables_committed`, que usan las cachés para invalidarse.
+_COMMIT_LISTENERS = []
+
+def on_tables_committed(callback):
+    """Registra `callback(tablas)`, llamado tras cada commit con las tablas escritas."""
+    _COMMIT_LISTENERS.append(callback)
+    return callback
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(instance, '__table__', None)
+        if table is not None:
+            _changed_tables(session).add(table.name)
+
+# --- Eventos en tiempo real (`/events`) ---
+# Las escrituras sobre estos modelos publican un evento por tema (ver
+# events.py) con los campos indicados: `{campo del evento: atributo}`.
+EVENT_MODELS = {
+    LlegadaTela: ('stock', 'fabrics', {'id': 'id', 'stock': 'cantidad_value'}),
+    LlegadaMaterial: ('stock', 'materials', {'id': 'id', 'stock': 'quantity_value'}),
+    ProductoTerminado: ('stock', 'products', {'id': 'id', 'stock': 'cantidad'}),
+    Venta: ('sales', 'sales', {'id': 'id', 'sale_date': 'sale_date', 'total_sale': 'total_sale'}),
+    AsignacionSatelite: ('satellites', 'assignments', {
+        'id': 'id', 'satellite_name': 'satellite_name', 'status': 'status', 'assigned_quantity': 'assigned_quantity',
+    }),
+    EntregaSatelite: ('satellites', 'deliveries', {
+        'id': 'id', 'satellite_name': 'satellite_name', 'product_lote': 'product_lote', 'delivered_quantity': 'delivered_quantity',
+    }),
+}
+events_broker = events.Broker(DATABASE_URL)
+
+def publish_changes(model, items, op='upsert', connection=None):
+    """Publica en la transacción actual el cambio de `items` (objetos o dicts) de `model`."""
+    spec = EVENT_MODELS.get(model)
+    if spec is None or not items:
+        return
+    topic, resource, fields = spec
+    if op == 'delete':
+        payload = [{'id': item if not isinstance(item, dict) else item['id']} for item in items]
+    else:
+        payload = [
+            {name: (item.get(attr) if isinstance(item, dict) else getattr(item, attr)) for name, attr in fields.items()}
+            for item in items
+        ]
+    events.publish(connection or db.session, topic, resource, op, payload)
+
+@event.listens_for(Session, 'after_flush')
+def _publish_flushed_events(session, flush_context):
+    changes = {}
+    for op, instances in (('upsert', list(session.new) + list(session.dirty)), ('delete', list(session.deleted))):
+        for instance in instances:
+            if type(instance) in EVENT_MODELS:
+                changes.setdefault((type(instance), op), []).append(instance if op == 'upsert' else instance.id)
+    for (model, op), items in changes.items():
+        publish_changes(model, items, op, connection=session.connection())
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if getattr(table, 'name', None):
+            _changed_tables(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed_tables(session):
+    tables = session.info.pop('changed_tables', None)
+    if not tables:
+        return
+    for callback in _COMMIT_LISTENERS:
+        try:
+            callback(frozenset(tables))
+        except Exception as e:
+            logger.error(f"Error en oyente de commit {callback.__name__}: {e}")
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_rolled_back_tables(session, previous_transaction):
+    if getattr(previous_transaction, 'parent', None) is None:
+        session.info.pop('changed_tables', None)
 
 # --- RUTAS DE LA APLICACIÓN ---
 
 # Sirve el index.html y otros archivos estáticos
+# Páginas precomprimidas en memoria con ETag y caché larga (ver static_assets.py).
+# STATIC_BUILD_DIR usa lo generado por `flask build-static`; con STATIC_ACCEL_PREFIX
+# nginx envía el archivo (X-Accel-Redirect) y el worker queda libre de inmediato.
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR')
+STATIC_ACCEL_PREFIX = os.environ.get('STATIC_ACCEL_PREFIX')
+static_store = static_assets.AssetStore(STATIC_ROOT, STATIC_BUILD_DIR)
+
+def static_response(filename):
+    asset = static_store.get(filename)
+    if asset is None:
+        return jsonify({'success': False, 'message': 'Recurso no encontrado.'}), 404
+
+    if request.args.get('v') == asset.version:
+        cache_control = static_assets.IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = static_assets.REVALIDATE_CACHE_CONTROL
+
+    if STATIC_ACCEL_PREFIX:
+        response = Response(mimetype=asset.mimetype)
+        response.headers['X-Accel-Redirect'] = STATIC_ACCEL_PREFIX.rstrip('/') + '/' + filename
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    encoding = compression.negotiate(request.headers.get('Accept-Encoding'), asset.offered_encodings())
+    etag = asset.etag(encoding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.body(encoding), mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if asset.compressible:
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/')
+@compress_route(enabled=False)
 def index():
-    return send_from_directory('.', 'index.html')
+    return static_response('index.html')
 
 @app.route('/<path:filename>')
+@compress_route(enabled=False)
 def serve_static(filename):
-    return send_from_directory('.', filename)
+    return static_response(filename)
     
 # --- RUTA DE HEALTH CHECK ---
 @app.route('/health', methods=['GET'])
@@ -107,8 +576,10 @@ def handle_login():
 @app.route('/users', methods=['GET', 'POST'])
 def handle_usuarios():
     if request.method == 'GET':
-        items = Usuario.query.all()
-        return jsonify([{'id': item.id, 'usuario': item.usuario, 'rol': item.rol} for item in items])
+        return collection_response(
+            Usuario.query, Usuario,
+            serializer=lambda item: {'id': item.id, 'usuario': item.usuario, 'rol': item.rol}
+        )
     
     if request.method == 'POST':
         data = request.get_json()
@@ -149,8 +620,7 @@ def handle_usuario(username):
 @app.route('/employees', methods=['GET', 'POST']) 
 def handle_empleados():
     if request.method == 'GET':
-        items = Empleado.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(Empleado.query, Empleado)
     
     if request.method == 'POST':
         data = request.get_json()
@@ -200,8 +670,7 @@ def delete_empleados_bulk():
 @app.route('/clientes', methods=['GET', 'POST'])
 def handle_clientes():
     if request.method == 'GET':
-        items = Cliente.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(Cliente.query, Cliente)
     if request.method == 'POST':
         data = request.get_json()
         new_item = Cliente(**data)
@@ -240,8 +709,7 @@ def delete_clientes_bulk():
 @app.route('/proveedores', methods=['GET', 'POST'])
 def handle_proveedores():
     if request.method == 'GET':
-        items = Proveedor.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(Proveedor.query, Proveedor)
     if request.method == 'POST':
         data = request.get_json()
         new_item = Proveedor(**data)
@@ -279,8 +747,10 @@ def delete_proveedores_bulk():
 @app.route('/proveedores/history', methods=['GET', 'POST'])
 def handle_providers_history():
     if request.method == 'GET':
-        items = ProveedorHistorial.query.order_by(ProveedorHistorial.timestamp.desc()).all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(
+            ProveedorHistorial.query, ProveedorHistorial,
+            order_column=ProveedorHistorial.timestamp, descending=True
+        )
     if request.method == 'POST':
         data = request.get_json()
         data['timestamp'] = datetime.datetime.utcnow()
@@ -293,8 +763,7 @@ def handle_providers_history():
 @app.route('/bancos', methods=['GET', 'POST'])
 def handle_bancos():
     if request.method == 'GET':
-        items = Banco.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(Banco.query, Banco)
     if request.method == 'POST':
         data = request.get_json()
         data['fecha_registro'] = datetime.datetime.utcnow()
@@ -334,8 +803,7 @@ def delete_bancos_bulk():
 @app.route('/materials', methods=['GET', 'POST'])
 def handle_materials():
     if request.method == 'GET':
-        items = LlegadaMaterial.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(LlegadaMaterial.query, LlegadaMaterial)
     if request.method == 'POST':
         data = request.get_json()
         new_item = LlegadaMaterial(**data)
@@ -367,6 +835,7 @@ def delete_materials_bulk():
     ids_to_delete = data.get('ids', [])
     if not ids_to_delete: return jsonify({'success': False, 'message': 'No se proporcionaron IDs.'}), 400
     LlegadaMaterial.query.filter(LlegadaMaterial.id.in_(ids_to_delete)).delete(synchronize_session=False)
+    publish_changes(LlegadaMaterial, ids_to_delete, 'delete')
     db.session.commit()
     return jsonify({'success': True, 'message': 'Material(es) eliminado(s).'})
 
@@ -374,8 +843,7 @@ def delete_materials_bulk():
 @app.route('/fabrics', methods=['GET', 'POST'])
 def handle_fabrics():
     if request.method == 'GET':
-        items = LlegadaTela.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(LlegadaTela.query, LlegadaTela)
     if request.method == 'POST':
         data = request.get_json()
         new_item = LlegadaTela(**data)
@@ -406,49 +874,94 @@ def delete_fabrics_bulk():
     ids_to_delete = data.get('ids', [])
     if not ids_to_delete: return jsonify({'success': False, 'message': 'No se proporcionaron IDs.'}), 400
     LlegadaTela.query.filter(LlegadaTela.id.in_(ids_to_delete)).delete(synchronize_session=False)
+    publish_changes(LlegadaTela, ids_to_delete, 'delete')
     db.session.commit()
     return jsonify({'success': True, 'message': 'Tela(s) eliminada(s).'})
     
 # --- Historial Tela ---
+# Libro de movimientos de los rollos: lo escriben triggers sobre llegada_telas
+# (ver ledger.py). Las filas de tipo 'Saldo' son puntos de control y solo se
+# listan con `?checkpoints=true`.
 @app.route('/inventory/fabrics-history', methods=['GET'])
 def get_fabrics_history():
-    items = HistorialTela.query.order_by(HistorialTela.timestamp.desc()).all()
-    return jsonify([model_to_dict(item) for item in items])
+    query = HistorialTela.query
+    if not arg_flag('checkpoints'):
+        query = query.filter(or_(HistorialTela.type.is_(None), HistorialTela.type != ledger.CHECKPOINT_TYPE))
+    return collection_response(
+        query, HistorialTela,
+        order_column=HistorialTela.timestamp, descending=True, route_args=('checkpoints',)
+    )
+
+@app.route('/inventory/fabrics/<int:fabric_id>/history', methods=['GET'])
+def get_fabric_history(fabric_id):
+    return collection_response(
+        HistorialTela.query.filter(HistorialTela.fabric_id == fabric_id), HistorialTela,
+        order_column=HistorialTela.timestamp, descending=True
+    )
+
+@app.route('/inventory/fabrics/<int:fabric_id>/balance', methods=['GET'])
+def get_fabric_balance(fabric_id):
+    """Stock del rollo a una fecha (`?at=AAAA-MM-DD` incluye todo ese día; sin `at`, el último movimiento)."""
+    raw = request.args.get('at')
+    try:
+        if not raw:
+            at = None
+        elif 'T' in raw or ' ' in raw:
+            at = datetime.datetime.fromisoformat(raw)
+        else:
+            at = datetime.datetime.combine(datetime.date.fromisoformat(raw) + datetime.timedelta(days=1), datetime.time())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'El parámetro "at" debe ser una fecha ISO (AAAA-MM-DD).'}), 400
+    row = db.session.execute(ledger.balance_query(fabric_id, at)).first()
+    if row is None:
+        return jsonify({'success': False, 'message': 'El rollo no tiene saldos registrados hasta esa fecha.'}), 404
+    return jsonify({'fabric_id': fabric_id, 'at': raw, 'balance': row.balance, 'movement_id': row.id,
+                    'movement_at': row.timestamp.isoformat() if row.timestamp else None})
+
+@app.route('/inventory/fabrics/register-exit', methods=['POST'])
+def register_fabric_exit():
+    data = request.get_json() or {}
+    try:
+        fabric_id = int(data.get('id'))
+        quantity = float(data.get('exit_quantity'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Se requieren el ID de la tela y la cantidad a descontar.'}), 400
+    if quantity <= 0:
+        return jsonify({'success': False, 'message': 'La cantidad a descontar debe ser mayor que cero.'}), 400
+    ledger.set_reason(db.session, 'Salida', data.get('details'))
+    missing = deduct_stock(LlegadaTela, LlegadaTela.cantidad_value, {fabric_id: quantity})
+    if missing:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Stock insuficiente o tela ID {fabric_id} no encontrada.'}), 400
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'Salida de tela registrada.'})
 
 
 @app.route('/products', methods=['GET', 'POST'])
 def handle_products():
     if request.method == 'GET':
-        items = ProductoTerminado.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(ProductoTerminado.query, ProductoTerminado)
     if request.method == 'POST':
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'message': 'Se esperaba un objeto JSON con los datos del producto.'}), 400
         
-        # 1. Intentamos leer el ID del CSV, si no viene, es None.
-        # Lo eliminamos inmediatamente para que SQLAlchemy no se confunda si es None
+        # 1. El ID del CSV se respeta si está libre. Si no viene (o ya existe),
+        # lo asigna la secuencia de la base de datos: no se consulta el máximo actual.
         initial_id = data.pop('id', None)
-        
-        # Intentaremos la inserción con ID generado manualmente, con reintentos en caso de colisión
-        MAX_RETRIES = 5
-        for attempt in range(MAX_RETRIES):
+        try:
+            initial_id = _coerce_value(ProductoTerminado.__table__.c.id, initial_id)
+        except (ValueError, TypeError, OverflowError):
+            return jsonify({'success': False, 'message': f'El ID del producto debe ser un número entero: {initial_id}'}), 400
+        candidate_ids = [initial_id, None] if initial_id is not None else [None]
+
+        for product_id in candidate_ids:
             db.session.begin_nested() # Inicia sub-transacción para rollback en caso de colisión de ID
 
             try:
                 temp_data = data.copy()
-
-                # 2. Lógica de generación de ID (PRIORIDAD AL ID DEL CSV)
-                if initial_id is not None:
-                    # Usamos el ID del CSV si es el primer intento
-                    if attempt == 0:
-                        temp_data['id'] = int(initial_id)
-                    else:
-                        # Si hay colisión en el ID del CSV, generamos uno nuevo único (falló la asunción del usuario)
-                        max_id = db.session.query(func.max(ProductoTerminado.id)).scalar()
-                        temp_data['id'] = int(max_id or 0) + 100
-                else:
-                    # Generación de ID normal si no viene en el CSV (o si es reintento y no tenía ID inicial)
-                    max_id = db.session.query(func.max(ProductoTerminado.id)).scalar()
-                    temp_data['id'] = int(max_id or 0) + 100
+                if product_id is not None:
+                    temp_data['id'] = product_id
                 
                 # --- CONVERSIÓN ROBUSTA DE TIPOS ---
                 # Limpiamos 'lote' y 'fecha' si vienen nulos
@@ -458,7 +971,7 @@ def handle_products():
                 if 'fecha' in temp_data and temp_data['fecha'] is None:
                     del temp_data['fecha']
                 
-                for key in ['medida_trazo', 'trazos', 'cantidad', 'valor_confeccion', 'ganancia_percent', 'valor_total', 'valor_venta']:
+                for key in PRODUCT_NUMERIC_FIELDS:
                     if key in temp_data and isinstance(temp_data[key], str):
                         try:
                             temp_data[key] = float(temp_data[key])
@@ -471,66 +984,45 @@ def handle_products():
                 fabrics_used = temp_data.get('fabrics_used', [])
                 if isinstance(fabrics_used, str): fabrics_used = json.loads(fabrics_used)
 
+                material_usage, fabric_usage = usage.parse_list(materials_used), usage.parse_list(fabrics_used)
+
                 # --- VALIDACIÓN Y DEDUCCIÓN DE STOCK ---
+                # Un único UPDATE por tabla valida y descuenta todo el consumo (IDs repetidos agregados).
+                missing = deduct_stock(LlegadaMaterial, LlegadaMaterial.quantity_value, aggregate_usage(material_usage))
+                if missing:
+                    db.session.rollback() # Rollback de la sub-transacción
+                    return jsonify({'success': False, 'message': f"Stock insuficiente para material ID {', '.join(map(str, missing))}"}), 400
+
+                ledger.set_reason(db.session, 'Salida por producción', f"Producto serial {temp_data.get('serial') or 'sin serial'}")
+                missing = deduct_stock(LlegadaTela, LlegadaTela.cantidad_value, aggregate_usage(fabric_usage))
+                if missing:
+                    db.session.rollback() # Rollback de la sub-transacción
+                    return jsonify({'success': False, 'message': f"Stock insuficiente para tela ID {', '.join(map(str, missing))}"}), 400
                 
-                # Deducción de Materiales
-                for item_mat in materials_used:
-                    material = LlegadaMaterial.query.get(item_mat['id'])
-                    quantity_used = float(item_mat.get('quantity_used', 0))
-                    
-                    if not material or material.quantity_value < quantity_used:
-                        db.session.rollback() # Rollback de la sub-transacción
-                        return jsonify({'success': False, 'message': f"Stock insuficiente para material ID {str(item_mat['id'])}"}), 400
-                    material.quantity_value -= quantity_used
-                
-                # Deducción de Telas
-                for item_fab in fabrics_used:
-                    tela = LlegadaTela.query.get(item_fab['id'])
-                    quantity_used_fab = float(item_fab.get('quantity_used', 0))
-
-                    if not tela or tela.cantidad_value < quantity_used_fab:
-                        db.session.rollback() # Rollback de la sub-transacción
-                        return jsonify({'success': False, 'message': f"Stock insuficiente para tela ID {str(item_fab['id'])}"}), 400
-                    tela.cantidad_value -= quantity_used_fab
-                
-                # Serializar listas de uso a JSON string antes de guardar
-                temp_data['materials_used'] = json.dumps(materials_used)
-                temp_data['fabrics_used'] = json.dumps(fabrics_used)
+                # Las listas de uso se guardan tal cual (columnas JSON) y, por elemento, en las tablas de uso
+                temp_data['materials_used'] = materials_used
+                temp_data['fabrics_used'] = fabrics_used
 
                 # Crear y registrar el nuevo producto.
                 new_item = ProductoTerminado(**temp_data)
                 db.session.add(new_item)
+                db.session.flush()
+                usage.insert(db.session, [(new_item.id, material_usage, fabric_usage)])
                 db.session.commit() # Confirma la sub-transacción
+                if product_id is not None:
+                    advance_product_id_sequence(product_id)
                 db.session.commit() # Confirma la transacción principal
-                return jsonify({'success': True, 'message': 'Producto registrado y stock actualizado.'}), 201
+                return jsonify({'success': True, 'message': 'Producto registrado y stock actualizado.', 'id': new_item.id}), 201
 
             except IntegrityError as e:
                 db.session.rollback() # Rollback de la sub-transacción
                 
                 message = "Error de clave única. El registro ya existe. Revise su hoja de cálculo."
                 
-                # Manejo de colisión de ID (pkey)
-                if "productos_terminados_pkey" in str(e):
-                    if initial_id is not None:
-                         # Si falló al usar el ID del CSV, reintenta (solo si quedan intentos)
-                        if attempt < MAX_RETRIES - 1:
-                            logger.warning(f"Colisión de ID ({temp_data['id']}) proporcionado por CSV en intento {attempt+1}/{MAX_RETRIES}. Generando nuevo ID...")
-                            continue 
-                        else:
-                             message = f"Error de ID: El ID {temp_data.get('id', 'generado')} proporcionado por CSV ya existe y no se pudo generar uno nuevo."
-                             logger.error("Máximo de reintentos alcanzado para colisión de ID.")
-                             db.session.commit()
-                             return jsonify({'success': False, 'message': message}), 409
-                    else:
-                        # Si es un ID generado automáticamente que choca, reintentamos inmediatamente
-                        if attempt < MAX_RETRIES - 1:
-                            logger.warning(f"Colisión de ID ({temp_data['id']}) en intento {attempt+1}/{MAX_RETRIES}. Reintentando con nuevo ID.")
-                            continue 
-                        else:
-                            message = "Fallo al generar un ID único después de varios intentos. Intente nuevamente."
-                            logger.error(message)
-                            db.session.commit()
-                            return jsonify({'success': False, 'message': message}), 500
+                # Colisión del ID proporcionado por el CSV: se reintenta con un ID de la secuencia
+                if "productos_terminados_pkey" in str(e) and product_id is not None:
+                    logger.warning(f"El ID {product_id} proporcionado por CSV ya existe. Se asigna un ID de la secuencia.")
+                    continue
 
                 # Manejo de colisión de Serial (productos_terminados_serial_key)
                 elif "productos_terminados_serial_key" in str(e):
@@ -551,9 +1043,507 @@ def handle_products():
                 db.session.commit()
                 return jsonify({'success': False, 'message': 'Error interno al registrar producto.'}), 500
 
-        # Si el bucle termina sin éxito (esto solo ocurre si se rompe el continue en el último intento)
-        return jsonify({'success': False, 'message': 'Fallo al generar un ID único después de varios intentos. Intente nuevamente.'}), 500
+        return jsonify({'success': False, 'message': 'No se pudo asignar un ID único al producto. Intente nuevamente.'}), 500
+
+
+# --- Asignación de IDs de productos ---
+# Los IDs de ProductoTerminado salen de la secuencia `productos_terminados_id_seq`.
+# Los IDs explícitos (p. ej. del CSV) se respetan y adelantan la secuencia para
+# que nunca vuelva a entregarlos; las importaciones masivas reservan bloques.
+PRODUCT_ID_SEQUENCE = ProductoTerminado.__table__.c.id.default.name
+
+def reserve_product_ids(count):
+    """Reserva `count` IDs nuevos de la secuencia en una sola consulta."""
+    if count <= 0:
+        return []
+    rows = db.session.execute(
+        text("SELECT nextval(CAST(:seq AS regclass)) FROM generate_series(1, :n)"),
+        {'seq': PRODUCT_ID_SEQUENCE, 'n': count}
+    )
+    return [row[0] for row in rows]
+
+def advance_product_id_sequence(min_id):
+    """Adelanta la secuencia hasta `min_id` si todavía no lo ha alcanzado."""
+    db.session.execute(
+        text(f"SELECT setval(CAST(:seq AS regclass), :id) WHERE :id > (SELECT last_value FROM {PRODUCT_ID_SEQUENCE})"),
+        {'seq': PRODUCT_ID_SEQUENCE, 'id': int(min_id)}
+    )
+
+# --- Tipos de las filas de los lotes ---
+# Las rutas por lotes convierten cada valor al tipo de su columna antes de
+# armar el INSERT de varias filas: un valor que PostgreSQL rechazaría (texto en
+# un número, una fecha mal escrita, un texto demasiado largo) haría fallar la
+# sentencia completa, y con ella el lote entero. Así se reporta en su fila.
+PG_INTEGER_RANGE = (-2**31, 2**31 - 1)
+PG_BIGINT_RANGE = (-2**63, 2**63 - 1)
+
+def _coerce_value(column, value):
+    """`value` (de un cuerpo JSON) convertido al tipo de `column`; ValueError si no corresponde."""
+    column_type = column.type
+    if value is None or isinstance(column_type, JSON):
+        return value
+    if isinstance(column_type, db.Boolean):
+        if isinstance(value, bool):
+            return value
+        lowered = str(value).strip().lower()
+        if lowered not in filters.TRUE_VALUES + filters.FALSE_VALUES:
+            raise ValueError(value)
+        return lowered in filters.TRUE_VALUES
+    if isinstance(value, (bool, dict, list)):
+        raise ValueError(value)
+    if isinstance(column_type, Integer):
+        number = value if isinstance(value, int) else float(value)
+        if isinstance(number, float) and not number.is_integer():
+            raise ValueError(value)
+        low, high = PG_BIGINT_RANGE if isinstance(column_type, db.BigInteger) else PG_INTEGER_RANGE
+        if not low <= int(number) <= high:
+            raise ValueError(value)
+        return int(number)
+    if isinstance(column_type, Float):
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(value)
+        return number
+    if isinstance(column_type, db.DateTime):
+        return datetime.datetime.fromisoformat(value.strip())
+    if isinstance(column_type, db.Date):
+        return datetime.date.fromisoformat(value.strip()[:10])
+    if isinstance(column_type, db.String):
+        return str(value)
+    return value
+
+def coerce_row(table, row):
+    """Convierte los valores de `row` al tipo de sus columnas en `table` (las demás claves quedan igual).
+
+    Lanza ValueError con el mensaje para el reporte de la fila.
+    """
+    for key, value in row.items():
+        if key not in table.c:
+            continue
+        column = table.c[key]
+        try:
+            coerced = _coerce_value(column, value)
+        except (ValueError, TypeError, AttributeError, OverflowError):
+            raise ValueError(f'Valor inválido para "{key}": {value}')
+        length = getattr(column.type, 'length', None)
+        if isinstance(coerced, str) and length and len(coerced) > length:
+            raise ValueError(f'"{key}" supera los {length} caracteres.')
+        row[key] = coerced
+    return row
+
+# --- Importación masiva de productos ---
+# `POST /products/batch` recibe muchas filas en una sola petición. El stock se
+# valida y descuenta de forma agregada para todo el lote (una lectura bloqueante
+# y un UPDATE por tabla) y los productos se insertan en bloque.
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 5000))
+BATCH_MODES = ('all_or_nothing', 'best_effort')
+PRODUCT_NUMERIC_FIELDS = ['medida_trazo', 'trazos', 'cantidad', 'valor_confeccion', 'ganancia_percent', 'valor_total', 'valor_venta']
+
+def parse_batch_request(data):
+    """Extrae `(filas, modo)` del cuerpo de una petición por lotes.
+
+    Acepta un arreglo de filas o `{"rows": [...], "mode": "..."}`; el modo
+    también puede venir como `?mode=`. Lanza ValueError si el cuerpo no es válido.
+    """
+    mode = request.args.get('mode', 'all_or_nothing')
+    if isinstance(data, dict):
+        mode = data.get('mode', mode)
+        data = data.get('rows')
+    if not isinstance(data, list) or not data:
+        raise ValueError('Se esperaba una lista de filas no vacía.')
+    if len(data) > BATCH_MAX_ROWS:
+        raise ValueError(f'El lote supera el máximo de {BATCH_MAX_ROWS} filas.')
+    if mode not in BATCH_MODES:
+        raise ValueError(f'Modo inválido "{mode}". Use uno de: {", ".join(BATCH_MODES)}.')
+    return data, mode
+
+def batch_report_response(mode, results):
+    """Respuesta estándar de las rutas por lotes con el reporte fila por fila.
+
+    En `best_effort` una petición válida responde 2xx aunque fallen todas las
+    filas (201 si se insertó alguna, 200 si no): los errores van en `results`.
+    """
+    inserted = sum(1 for r in results if r['success'])
+    failed = len(results) - inserted
+    if failed and mode == 'all_or_nothing':
+        for r in results:
+            if r['success'] or not r.get('message'):
+                r.update({'success': False, 'message': 'No insertada: el lote se canceló por errores en otras filas.'})
+                r.pop('id', None)
+        return jsonify({
+            'success': False, 'mode': mode, 'inserted': 0, 'failed': len(results),
+            'message': f'{failed} fila(s) con errores; no se insertó ningún registro.',
+            'results': results
+        }), 400
+    return jsonify({
+        'success': failed == 0, 'mode': mode, 'inserted': inserted, 'failed': failed,
+        'message': f'{inserted} registro(s) insertado(s), {failed} fila(s) con errores.',
+        'results': results
+    }), 201 if inserted else 200
+
+def normalize_product_row(data):
+    """Limpia una fila de producto como lo hace `POST /products`.
+
+    Devuelve `(fila, materials_used, fabrics_used)`; lanza ValueError si la
+    fila trae columnas desconocidas, valores que no corresponden al tipo de su
+    columna (números, `fecha`) o consumos mal formados.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('La fila debe ser un objeto JSON.')
+    row = dict(data)
+    columns = ProductoTerminado.__table__.columns
+    unknown = [key for key in row if key not in columns]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+    for key in ('lote', 'fecha'):
+        if key in row and row[key] is None:
+            del row[key]
+    coerce_row(ProductoTerminado.__table__, row)
+    materials_used = usage.parse_list(row.get('materials_used'))
+    fabrics_used = usage.parse_list(row.get('fabrics_used'))
+    row['materials_used'] = materials_used
+    row['fabrics_used'] = fabrics_used
+    return row, materials_used, fabrics_used
+
+def aggregate_usage(usage):
+    """Suma las cantidades usadas por ID (`[{id, quantity_used}]` -> `{id: total}`)."""
+    totals = {}
+    for item in usage:
+        totals[item['id']] = totals.get(item['id'], 0.0) + item['quantity_used']
+    return totals
+
+def lock_stock(model, column, ids):
+    """Lee y bloquea (FOR UPDATE) el stock de `ids` en una sola consulta: `{id: stock}`."""
+    if not ids:
+        return {}
+    rows = db.session.query(model.id, column).filter(model.id.in_(list(ids))).with_for_update().all()
+    return {row[0]: float(row[1] or 0) for row in rows}
+
+def apply_stock_deltas(model, column, deltas):
+    """Suma `deltas` (`{id: cantidad}`, negativa para descontar) en un único UPDATE ... FROM (VALUES ...).
+
+    Devuelve el conjunto de IDs actualizados (los que no existen se omiten).
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return set()
+    table = model.__table__
+    delta_values = sa_values(
+        sa_column('id', Integer), sa_column('delta', Float), name='deltas'
+    ).data(list(deltas.items()))
+    stmt = table.update().values(
+        {column.key: func.coalesce(table.c[column.key], 0) + delta_values.c.delta}
+    ).where(table.c.id == delta_values.c.id).returning(table.c.id, table.c[column.key])
+    rows = db.session.execute(stmt).fetchall()
+    publish_changes(model, [{'id': row[0], column.key: row[1]} for row in rows])
+    return {row[0] for row in rows}
+
+def deduct_stock(model, column, quantities):
+    """Valida y descuenta `quantities` (`{id: cantidad}`) en un único UPDATE ... FROM (VALUES ...) RETURNING.
+
+    Solo se actualizan las filas con stock suficiente; devuelve los IDs que no
+    existen o no alcanzan (lista vacía si todo se descontó). Si la lista no está
+    vacía el llamador debe hacer rollback.
+    """
+    if not quantities:
+        return []
+    table = model.__table__
+    requested = sa_values(
+        sa_column('id', Integer), sa_column('qty', Float), name='requested'
+    ).data(list(quantities.items()))
+    stmt = table.update().values(
+        {column.key: table.c[column.key] - requested.c.qty}
+    ).where(table.c.id == requested.c.id).where(table.c[column.key] >= requested.c.qty).returning(table.c.id, table.c[column.key])
+    rows = db.session.execute(stmt).fetchall()
+    publish_changes(model, [{'id': row[0], column.key: row[1]} for row in rows])
+    return sorted(set(quantities) - {row[0] for row in rows})
+
+def _allocate_product_ids(rows):
+    """Asigna IDs a las filas que no los traen, respetando los IDs explícitos libres.
+
+    Los IDs nuevos se reservan en bloque de la secuencia y la secuencia se
+    adelanta por encima del mayor ID explícito aceptado.
+    """
+    explicit = [row['id'] for row in rows if row.get('id') is not None]
+    taken = set()
+    if explicit:
+        taken = {pid for (pid,) in db.session.query(ProductoTerminado.id).filter(ProductoTerminado.id.in_(explicit))}
+    seen, pending = set(), []
+    for row in rows:
+        pid = row.get('id')
+        if pid is None or pid in taken or pid in seen:
+            pending.append(row)
+        else:
+            seen.add(pid)
+    if seen:
+        advance_product_id_sequence(max(seen))
+    for row, pid in zip(pending, reserve_product_ids(len(pending))):
+        row['id'] = pid
+
+@app.route('/products/batch', methods=['POST'])
+def create_products_batch():
+    try:
+        raw_rows, mode = parse_batch_request(request.get_json())
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    results = [{'index': i, 'success': False} for i in range(len(raw_rows))]
+    candidates = []  # (índice, fila, consumo de materiales, consumo de telas)
+    for i, raw in enumerate(raw_rows):
+        try:
+            candidates.append((i,) + normalize_product_row(raw))
+        except (ValueError, TypeError, KeyError) as e:
+            results[i]['message'] = f'Fila inválida: {e}'
+
+    # Seriales repetidos dentro del lote o ya existentes (una sola consulta).
+    serials = [row['serial'] for _, row, _, _ in candidates if row.get('serial')]
+    existing_serials = set()
+    if serials:
+        existing_serials = {
+            serial for (serial,) in db.session.query(ProductoTerminado.serial).filter(ProductoTerminado.serial.in_(serials))
+        }
+    seen_serials = set()
+    valid = []
+    for candidate in candidates:
+        i, row = candidate[0], candidate[1]
+        serial = row.get('serial')
+        if serial and (serial in existing_serials or serial in seen_serials):
+            results[i]['message'] = f'El número de serial {serial} ya existe.'
+            continue
+        if serial:
+            seen_serials.add(serial)
+        valid.append(candidate)
+
+    try:
+        material_stock = lock_stock(
+            LlegadaMaterial, LlegadaMaterial.quantity_value,
+            {item['id'] for _, _, mats, _ in valid for item in mats}
+        )
+        fabric_stock = lock_stock(
+            LlegadaTela, LlegadaTela.cantidad_value,
+            {item['id'] for _, _, _, fabs in valid for item in fabs}
+        )
+
+        # Reserva del stock fila por fila sobre la instantánea bloqueada.
+        material_deltas, fabric_deltas, accepted = {}, {}, []
+        for i, row, mats, fabs in valid:
+            needed_mats, needed_fabs = aggregate_usage(mats), aggregate_usage(fabs)
+            missing = [f'material ID {mid}' for mid, qty in needed_mats.items() if material_stock.get(mid, -1) < qty]
+            missing += [f'tela ID {fid}' for fid, qty in needed_fabs.items() if fabric_stock.get(fid, -1) < qty]
+            if missing:
+                results[i]['message'] = f"Stock insuficiente para {', '.join(missing)}"
+                continue
+            for mid, qty in needed_mats.items():
+                material_stock[mid] -= qty
+                material_deltas[mid] = material_deltas.get(mid, 0.0) - qty
+            for fid, qty in needed_fabs.items():
+                fabric_stock[fid] -= qty
+                fabric_deltas[fid] = fabric_deltas.get(fid, 0.0) - qty
+            accepted.append((i, row, mats, fabs))
+
+        if len(accepted) < len(raw_rows) and mode == 'all_or_nothing':
+            db.session.rollback()
+            return batch_report_response(mode, results)
+
+        rows = [row for _, row, _, _ in accepted]
+        if rows:
+            _allocate_product_ids(rows)
+            apply_stock_deltas(LlegadaMaterial, LlegadaMaterial.quantity_value, material_deltas)
+            ledger.set_reason(db.session, 'Salida por producción', f"Lote de {len(rows)} producto(s)")
+            apply_stock_deltas(LlegadaTela, LlegadaTela.cantidad_value, fabric_deltas)
+            column_keys = [c.key for c in ProductoTerminado.__table__.columns if c.server_default is None]
+            db.session.execute(
+                ProductoTerminado.__table__.insert(),
+                [{key: row.get(key) for key in column_keys} for row in rows]
+            )
+            usage.insert(db.session, [(row['id'], mats, fabs) for _, row, mats, fabs in accepted])
+            publish_changes(ProductoTerminado, rows)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.error(f"Error de integridad en /products/batch: {e}")
+        return jsonify({'success': False, 'message': 'Conflicto de clave única al insertar el lote. Reintente la importación.'}), 409
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error en /products/batch: {e}")
+        return jsonify({'success': False, 'message': 'Error interno al registrar el lote de productos.'}), 500
+
+    for i, row, _, _ in accepted:
+        results[i].update({'success': True, 'id': row['id'], 'serial': row.get('serial')})
+    return batch_report_response(mode, results)
+
+# --- Creación masiva genérica (`POST <colección>/batch`) ---
+# Inserta un arreglo de filas con INSERT de múltiples filas dentro de una sola
+# transacción. Las filas sin clave primaria reciben IDs reservados de la
+# secuencia de la tabla, así cada fila del lote se identifica por su clave.
+# Los conflictos con la clave primaria y con columnas únicas (`serial_rollo`,
+# `factura`, `aprobacion`) se detectan con una consulta IN por columna y, ante
+# carreras con otras peticiones, con ON CONFLICT DO NOTHING; se reportan fila
+# por fila. Los IDs explícitos adelantan la secuencia para que no los vuelva a
+# entregar. Los valores se convierten antes al tipo de su columna
+# (`coerce_row`): una fila con un valor inválido se reporta sola.
+BULK_INSERT_CHUNK = int(os.environ.get('BULK_INSERT_CHUNK', 500))
+
+def _validate_bulk_row(table, row):
+    if not row:
+        return 'La fila está vacía.'
+    unknown = [key for key in row if key not in table.c]
+    if unknown:
+        return f"Columnas desconocidas: {', '.join(unknown)}"
+    missing = [
+        c.key for c in table.columns
+        if not c.nullable and not c.primary_key and c.server_default is None and row.get(c.key) is None
+    ]
+    if missing:
+        return f"Campos obligatorios vacíos: {', '.join(missing)}"
+    return None
+
+def _serial_sequence(table, pk):
+    """Nombre de la secuencia de la clave primaria de `table` (None si no tiene)."""
+    return db.session.execute(
+        text("SELECT pg_get_serial_sequence(:table, :column)"), {'table': table.name, 'column': pk}
+    ).scalar()
+
+def bulk_create_response(model, prepare=None):
+    """Crea en bloque las filas del cuerpo de la petición y responde el reporte por fila.
+
+    `prepare` recibe cada fila (dict) y devuelve la fila a insertar, para
+    completar campos como lo hace la ruta POST individual del recurso.
+    """
+    try:
+        raw_rows, mode = parse_batch_request(request.get_json())
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    table = model.__table__
+    pk = model.__mapper__.primary_key[0].key
+    pk_column = table.c[pk]
+    unique_columns = [c for c in table.columns if c.unique]
+    results = [{'index': i, 'success': False} for i in range(len(raw_rows))]
+
+    candidates = []
+    for i, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            results[i]['message'] = 'La fila debe ser un objeto JSON.'
+            continue
+        row = prepare(dict(raw)) if prepare else dict(raw)
+        error = _validate_bulk_row(table, row)
+        if error:
+            results[i]['message'] = error
+            continue
+        try:
+            coerce_row(table, row)
+        except ValueError as e:
+            results[i]['message'] = str(e)
+            continue
+        candidates.append((i, row))
+
+    for column in [pk_column] + unique_columns:
+        values = [row[column.key] for _, row in candidates if row.get(column.key) is not None]
+        existing = set()
+        if values:
+            existing = {value for (value,) in db.session.query(column).filter(column.in_(values))}
+        seen, kept = set(), []
+        for i, row in candidates:
+            value = row.get(column.key)
+            if value is not None and (value in existing or value in seen):
+                results[i]['message'] = f'Conflicto de unicidad: {column.key} "{value}" ya existe.'
+                continue
+            if value is not None:
+                seen.add(value)
+            kept.append((i, row))
+        candidates = kept
+
+    if len(candidates) < len(raw_rows) and mode == 'all_or_nothing':
+        return batch_report_response(mode, results)
+
+    inserted = []
+    try:
+        sequence = _serial_sequence(table, pk)
+        explicit_ids = [row[pk] for _, row in candidates if row.get(pk) is not None]
+        without_pk = [row for _, row in candidates if row.get(pk) is None]
+        if without_pk and sequence is None:
+            raise ValueError(f'{table.name} no tiene secuencia para asignar {pk}.')
+        if without_pk:
+            reserved = db.session.execute(
+                text("SELECT nextval(CAST(:seq AS regclass)) FROM generate_series(1, :n)"),
+                {'seq': sequence, 'n': len(without_pk)}
+            )
+            for row, (new_id,) in zip(without_pk, reserved):
+                row[pk] = new_id
+
+        keys = sorted({key for _, row in candidates for key in row})
+        for start in range(0, len(candidates), BULK_INSERT_CHUNK):
+            chunk = candidates[start:start + BULK_INSERT_CHUNK]
+            stmt = pg_insert(table).values([{key: row.get(key) for key in keys} for _, row in chunk])
+            stmt = stmt.on_conflict_do_nothing().returning(pk_column)
+            # Las filas omitidas por conflicto no aparecen en RETURNING: se identifican por su clave
+            returned = {new_id for (new_id,) in db.session.execute(stmt)}
+            for i, row in chunk:
+                if row[pk] in returned:
+                    results[i].update({'success': True, 'id': row[pk]})
+                    inserted.append(row)
+                else:
+                    results[i]['message'] = 'Conflicto de unicidad con un registro insertado simultáneamente.'
+
+        if explicit_ids and sequence is not None:
+            db.session.execute(
+                text(f"SELECT setval(CAST(:seq AS regclass), :id) WHERE :id > (SELECT last_value FROM {sequence})"),
+                {'seq': sequence, 'id': max(explicit_ids)}
+            )
+
+        if mode == 'all_or_nothing' and not all(r['success'] for r in results):
+            db.session.rollback()
+        else:
+            publish_changes(model, inserted)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error en creación masiva de {table.name}: {e}")
+        return jsonify({'success': False, 'message': f'Error interno al registrar el lote en {table.name}.'}), 500
+
+    return batch_report_response(mode, results)
 
+@app.route('/fabrics/batch', methods=['POST'])
+def create_fabrics_batch():
+    return bulk_create_response(LlegadaTela)
+
+@app.route('/materials/batch', methods=['POST'])
+def create_materials_batch():
+    return bulk_create_response(LlegadaMaterial)
+
+@app.route('/dynamic-codes/<string:type>/<string:category>/batch', methods=['POST'])
+def create_dynamic_codes_batch(type, category):
+    def prepare(data):
+        return {
+            'type': type, 'category': category,
+            'code': data.get('code'), 'description': data.get('description'),
+            'costo_venta': data.get('costo_venta'), 'costo_confeccion': data.get('costo_confeccion')
+        }
+    return bulk_create_response(DynamicCode, prepare)
+
+@app.route('/payments/batch', methods=['POST'])
+def create_payments_batch():
+    return bulk_create_response(PagoSatelite)
+
+@app.route('/deliveries/batch', methods=['POST'])
+def create_deliveries_batch():
+    return bulk_create_response(EntregaSatelite)
+
+@app.route('/clientes/batch', methods=['POST'])
+def create_clientes_batch():
+    return bulk_create_response(Cliente)
+
+@app.route('/proveedores/batch', methods=['POST'])
+def create_proveedores_batch():
+    return bulk_create_response(Proveedor)
+
+@app.route('/bancos/batch', methods=['POST'])
+def create_bancos_batch():
+    def prepare(data):
+        data['fecha_registro'] = datetime.datetime.utcnow()
+        return data
+    return bulk_create_response(Banco, prepare)
 
 @app.route('/products/last', methods=['GET'])
 def get_last_product():
@@ -567,27 +1557,51 @@ def get_last_product():
         logger.error(f"Error en /products/last: {e}")
         return jsonify({"message": "Error interno"}), 500
 
+def delete_products_restoring_stock(ids):
+    """Elimina los productos `ids` y repone su consumo de materiales y telas.
+
+    El consumo se suma por material y por tela entre todos los productos desde
+    las tablas de uso (ver usage.py), se repone con un UPDATE por tabla y los
+    productos se borran con un solo DELETE (sus filas de uso, en cascada).
+    Devuelve `(eliminados, resumen)`; el llamador confirma la transacción.
+    """
+    product_ids = [
+        product_id for (product_id,) in
+        db.session.query(ProductoTerminado.id).filter(ProductoTerminado.id.in_(ids)).with_for_update()
+    ]
+    materials_to_return, fabrics_to_return = usage.totals(db.session, product_ids) if product_ids else ({}, {})
+
+    restored_materials = apply_stock_deltas(LlegadaMaterial, LlegadaMaterial.quantity_value, materials_to_return)
+    ledger.set_reason(
+        db.session, 'Reversión por eliminación de producto',
+        f"Producto(s) ID {', '.join(map(str, product_ids[:20]))}{'…' if len(product_ids) > 20 else ''}"
+    )
+    restored_fabrics = apply_stock_deltas(LlegadaTela, LlegadaTela.cantidad_value, fabrics_to_return)
+
+    deleted = 0
+    if product_ids:
+        deleted = ProductoTerminado.query.filter(ProductoTerminado.id.in_(product_ids)).delete(synchronize_session=False)
+        publish_changes(ProductoTerminado, product_ids, 'delete')
+
+    summary = {
+        'materials': [{'id': mid, 'quantity': qty} for mid, qty in sorted(materials_to_return.items()) if mid in restored_materials],
+        'fabrics': [{'id': fid, 'quantity': qty} for fid, qty in sorted(fabrics_to_return.items()) if fid in restored_fabrics],
+        'missing_materials': sorted(mid for mid, qty in materials_to_return.items() if qty and mid not in restored_materials),
+        'missing_fabrics': sorted(fid for fid, qty in fabrics_to_return.items() if qty and fid not in restored_fabrics),
+    }
+    return deleted, summary
+
 @app.route('/products/bulk', methods=['DELETE'])
 def delete_products_bulk():
     ids = request.get_json().get('ids', [])
     if not ids: return jsonify({'success': False, 'message': 'No se proporcionaron IDs.'}), 400
     try:
-        products = ProductoTerminado.query.filter(ProductoTerminado.id.in_(ids)).all()
-        for p in products:
-            try:
-                for mat in json.loads(p.materials_used or '[]'):
-                    m = LlegadaMaterial.query.get(mat['id'])
-                    if m: m.quantity_value += float(mat['quantity_used'])
-                for fab in json.loads(p.fabrics_used or '[]'):
-                    f = LlegadaTela.query.get(fab['id'])
-                    if f: f.cantidad_value += float(fab['quantity_used'])
-            except Exception as e:
-                logger.warning(f"No se pudo reponer stock para producto ID {p.id}: {e}")
-            db.session.delete(p)
+        deleted, restored = delete_products_restoring_stock(ids)
         db.session.commit()
-        return jsonify({'success': True, 'message': f'{len(products)} producto(s) eliminado(s).'})
+        return jsonify({'success': True, 'message': f'{deleted} producto(s) eliminado(s).', 'restored': restored})
     except Exception as e:
         db.session.rollback()
+        logger.error(f"Error eliminando productos: {e}")
         return jsonify({'success': False, 'message': 'Error al eliminar productos.'}), 500
         
 
@@ -598,32 +1612,37 @@ def handle_product(product_id):
 
     if request.method == 'PUT':
         data = request.get_json()
-        if 'materials_used' in data and isinstance(data['materials_used'], list):
-            data['materials_used'] = json.dumps(data['materials_used'])
-        if 'fabrics_used' in data and isinstance(data['fabrics_used'], list):
-            data['fabrics_used'] = json.dumps(data['fabrics_used'])
+        usage_lists = {}
+        for key in usage.KINDS:
+            if key in data:
+                try:
+                    if isinstance(data[key], str):
+                        data[key] = json.loads(data[key]) if data[key] else []
+                    usage_lists[key] = usage.parse_list(data[key])
+                except (ValueError, TypeError, KeyError) as e:
+                    return jsonify({'success': False, 'message': f'Consumos inválidos en "{key}": {e}'}), 400
             
         for key, value in data.items():
             if hasattr(item, key) and key != 'id': setattr(item, key, value)
+        if usage_lists:
+            # Las filas de uso siguen a las listas del producto (sin mover stock, como antes)
+            try:
+                current = {
+                    key: usage_lists[key] if key in usage_lists else usage.parse_list(getattr(item, key))
+                    for key in usage.KINDS
+                }
+            except (ValueError, TypeError, KeyError) as e:
+                db.session.rollback()
+                return jsonify({'success': False, 'message': f'El producto tiene consumos mal formados: {e}'}), 400
+            usage.replace(db.session, [(item.id, current['materials_used'], current['fabrics_used'])])
         db.session.commit()
         return jsonify({'success': True, 'message': 'Producto actualizado.'})
 
     if request.method == 'DELETE':
         try:
-            materials_to_return = json.loads(item.materials_used) if isinstance(item.materials_used, str) and item.materials_used else []
-            fabrics_to_return = json.loads(item.fabrics_used) if isinstance(item.fabrics_used, str) and item.fabrics_used else []
-
-            for mat_item in materials_to_return:
-                material = LlegadaMaterial.query.get(mat_item['id'])
-                if material: material.quantity_value += float(mat_item['quantity_used'])
-            
-            for fab_item in fabrics_to_return:
-                tela = LlegadaTela.query.get(fab_item['id'])
-                if tela: tela.cantidad_value += float(fab_item['quantity_used'])
-
-            db.session.delete(item)
+            _, restored = delete_products_restoring_stock([item.id])
             db.session.commit()
-            return jsonify({'success': True, 'message': 'Producto eliminado y stock repuesto.'})
+            return jsonify({'success': True, 'message': 'Producto eliminado y stock repuesto.', 'restored': restored})
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error eliminando producto: {e}")
@@ -633,8 +1652,7 @@ def handle_product(product_id):
 @app.route('/payments', methods=['GET', 'POST'])
 def handle_payments():
     if request.method == 'GET':
-        items = PagoSatelite.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(PagoSatelite.query, PagoSatelite)
     if request.method == 'POST':
         data = request.get_json()
         new_item = PagoSatelite(**data)
@@ -646,23 +1664,29 @@ def handle_payments():
 @app.route('/sales', methods=['GET', 'POST'])
 def handle_sales():
     if request.method == 'GET':
-        items = Venta.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(Venta.query, Venta)
     if request.method == 'POST':
         data = request.get_json()
         try:
             products_sold = data.get('products_sold', [])
             if isinstance(products_sold, str): products_sold = json.loads(products_sold)
+            items = sales.parse_items(products_sold)
 
-            for p_sold in products_sold:
-                producto = ProductoTerminado.query.get(p_sold['id'])
-                if not producto or producto.cantidad < float(p_sold['quantity']):
-                    return jsonify({'success': False, 'message': f"Stock insuficiente para producto ID {p_sold['id']}"}), 400
-                producto.cantidad -= float(p_sold['quantity'])
+            quantities = {}
+            for item in items:
+                quantities[item['id']] = quantities.get(item['id'], 0.0) + item['quantity']
+
+            missing = deduct_stock(ProductoTerminado, ProductoTerminado.cantidad, quantities)
+            if missing:
+                db.session.rollback()
+                return jsonify({'success': False, 'message': f"Stock insuficiente para producto ID {', '.join(map(str, missing))}"}), 400
             
-            data['products_sold'] = json.dumps(products_sold)
+            # La lista se guarda tal cual (columna JSON) y, por elemento, en venta_lineas
+            data['products_sold'] = products_sold
             new_item = Venta(**data)
             db.session.add(new_item)
+            db.session.flush()
+            sales.insert(db.session, [(new_item.id, new_item.sale_date, items)])
             db.session.commit()
             return jsonify({'success': True, 'message': 'Venta registrada y stock actualizado.'}), 201
         except Exception as e:
@@ -670,12 +1694,29 @@ def handle_sales():
             logger.error(f"Error en venta: {e}")
             return jsonify({'success': False, 'message': 'Error al registrar venta.'}), 500
 
+@app.route('/sales/report', methods=['GET'])
+def get_sales_report():
+    """Unidades e ingresos por producto, referencia o lote (`?group=`), con `?from=&to=` por fecha de venta."""
+    group = request.args.get('group', 'product')
+    if group not in sales.GROUPS:
+        return jsonify({'success': False, 'message': f'Agrupación inválida "{group}". Use una de: {", ".join(sales.GROUPS)}.'}), 400
+    try:
+        date_from, date_to = (
+            datetime.date.fromisoformat(request.args[name]) if request.args.get(name) else None
+            for name in ('from', 'to')
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Las fechas "from" y "to" deben tener formato AAAA-MM-DD.'}), 400
+    rows = db.session.execute(sales.report_query(group, date_from, date_to)).all()
+    return jsonify([
+        {group: row.key, 'quantity': row.quantity, 'revenue': row.revenue, 'sales': row.sales} for row in rows
+    ])
+
 # --- Cortes ---
 @app.route('/cuts', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def handle_cuts():
     if request.method == 'GET':
-        items = ProgramacionCorte.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(ProgramacionCorte.query, ProgramacionCorte)
     
     if request.method == 'POST':
         data = request.get_json()
@@ -708,8 +1749,7 @@ def handle_cuts():
 @app.route('/assignments', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def handle_assignments():
     if request.method == 'GET':
-        items = AsignacionSatelite.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(AsignacionSatelite.query, AsignacionSatelite)
     if request.method == 'POST':
         data = request.get_json()
         if not data.get('total_price'):
@@ -736,6 +1776,7 @@ def handle_assignments():
         ids_to_delete = data.get('ids', [])
         if not ids_to_delete: return jsonify({'success': False, 'message': 'No se proporcionaron IDs.'}), 400
         AsignacionSatelite.query.filter(AsignacionSatelite.id.in_(ids_to_delete)).delete(synchronize_session=False)
+        publish_changes(AsignacionSatelite, ids_to_delete, 'delete')
         db.session.commit()
         return jsonify({'success': True, 'message': 'Asignación(es) eliminada(s).'})
 
@@ -743,8 +1784,7 @@ def handle_assignments():
 @app.route('/deliveries', methods=['GET', 'POST'])
 def handle_deliveries():
     if request.method == 'GET':
-        items = EntregaSatelite.query.all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(EntregaSatelite.query, EntregaSatelite)
     if request.method == 'POST':
         data = request.get_json()
         new_item = EntregaSatelite(**data)
@@ -755,50 +1795,74 @@ def handle_deliveries():
 # --- Rutas de Inventario ---
 @app.route('/inventory/summary', methods=['GET'])
 def get_inventory_summary():
-    summary = db.session.query(
-        LlegadaMaterial.material_name,
-        LlegadaMaterial.size_value,
-        LlegadaMaterial.size_unit,
-        LlegadaMaterial.quantity_type,
-        func.sum(LlegadaMaterial.quantity_value).label('total_quantity')
-    ).group_by(
-        LlegadaMaterial.material_name,
-        LlegadaMaterial.size_value,
-        LlegadaMaterial.size_unit,
-        LlegadaMaterial.quantity_type
+    # Lee los saldos mantenidos por triggers (ver aggregates.py); '' es "sin valor"
+    etag = collection_etag([SaldoMaterial.__tablename__])
+    if request.if_none_match.contains_weak(etag):
+        return _with_etag(Response(status=304), etag)
+    summary = SaldoMaterial.query.filter(SaldoMaterial.filas > 0).order_by(
+        SaldoMaterial.material_name, SaldoMaterial.size_value, SaldoMaterial.size_unit, SaldoMaterial.quantity_type
     ).all()
-    return jsonify([{
-        'material_name': r.material_name, 'size_value': r.size_value, 'size_unit': r.size_unit,
-        'quantity_type': r.quantity_type, 'total_quantity': float(r.total_quantity or 0)
-    } for r in summary])
+    return _with_etag(jsonify([{
+        'material_name': r.material_name or None, 'size_value': r.size_value or None, 'size_unit': r.size_unit or None,
+        'quantity_type': r.quantity_type or None, 'total_quantity': r.total
+    } for r in summary]), etag)
 
 @app.route('/inventory/history', methods=['GET'])
 def get_inventory_history():
-    items = LlegadaMaterial.query.with_entities(
-        LlegadaMaterial.entry_date.label('date'),
-        LlegadaMaterial.material_name,
-        LlegadaMaterial.quantity_value,
-        LlegadaMaterial.quantity_type,
-        LlegadaMaterial.supplier
-    ).all()
-    results = [dict(row._mapping) for row in items]
-    for r in results:
-        r['type'] = 'Ingreso'
-        if isinstance(r['date'], (datetime.datetime, datetime.date)):
-            r['date'] = r['date'].isoformat()
-    return jsonify(results)
+    def to_history_row(item):
+        return {
+            'date': item.entry_date.isoformat() if item.entry_date else None,
+            'material_name': item.material_name,
+            'quantity_value': item.quantity_value,
+            'quantity_type': item.quantity_type,
+            'supplier': item.supplier,
+            'type': 'Ingreso',
+        }
+    query = LlegadaMaterial.query.options(load_only(
+        LlegadaMaterial.entry_date, LlegadaMaterial.material_name, LlegadaMaterial.quantity_value,
+        LlegadaMaterial.quantity_type, LlegadaMaterial.supplier
+    ))
+    return collection_response(query, LlegadaMaterial, serializer=to_history_row)
 
 @app.route('/inventory/fabrics', methods=['GET'])
 def get_inventory_fabrics():
-    items = LlegadaTela.query.all()
-    return jsonify([model_to_dict(item) for item in items])
+    return collection_response(LlegadaTela.query, LlegadaTela)
+
+# --- Consumo por insumo ---
+# Productos que usaron un rollo o un material y la cantidad total, desde las
+# tablas de uso (ver usage.py). `?from=&to=` (AAAA-MM-DD) filtran por la fecha
+# del producto.
+def usage_report(field, item_id):
+    try:
+        date_from, date_to = (
+            datetime.date.fromisoformat(request.args[name]) if request.args.get(name) else None
+            for name in ('from', 'to')
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Las fechas "from" y "to" deben tener formato AAAA-MM-DD.'}), 400
+    rows = db.session.execute(usage.consumers_query(field, item_id, date_from, date_to)).all()
+    return jsonify({
+        'id': item_id,
+        'total_used': sum(row.quantity_used or 0 for row in rows),
+        'products': [{
+            'id': row.id, 'serial': row.serial, 'referencia': row.referencia, 'lote': row.lote,
+            'fecha': row.fecha.isoformat() if row.fecha else None, 'quantity_used': row.quantity_used,
+        } for row in rows],
+    })
+
+@app.route('/inventory/fabrics/<int:fabric_id>/usage', methods=['GET'])
+def get_fabric_usage(fabric_id):
+    return usage_report('fabrics_used', fabric_id)
+
+@app.route('/inventory/materials/<int:material_id>/usage', methods=['GET'])
+def get_material_usage(material_id):
+    return usage_report('materials_used', material_id)
 
 # --- Dynamic Codes (Referencias y Códigos de Barras) ---
 @app.route('/dynamic-codes/<string:type>/<string:category>', methods=['GET', 'POST', 'DELETE'])
 def handle_dynamic_codes(type, category):
     if request.method == 'GET':
-        items = DynamicCode.query.filter_by(type=type, category=category).all()
-        return jsonify([model_to_dict(item) for item in items])
+        return collection_response(DynamicCode.query.filter_by(type=type, category=category), DynamicCode)
         
     if request.method == 'POST':
         data = request.get_json()
@@ -851,57 +1915,138 @@ def handle_dynamic_code_item(type, category, item_id):
 # --- CORRECCIÓN CLAVE ---
 @app.route('/dynamic-codes/all-references', methods=['GET'])
 def get_all_references():
-    items = DynamicCode.query.filter_by(type='reference').all()
-    return jsonify([model_to_dict(item) for item in items])
+    return collection_response(DynamicCode.query.filter_by(type='reference'), DynamicCode)
 
 # --- CORRECCIÓN CLAVE ---
 @app.route('/dynamic-codes/all-barcodes', methods=['GET'])
 def get_all_barcodes():
     return jsonify([])
 
-# --- RUTAS DE LÓGICA DE NEGOCIO Y DASHBOARD ---
-
-# --- KPIs ---
-@app.route('/api/kpis', methods=['GET'])
-def get_kpis():
+# --- Eventos en tiempo real (Server-Sent Events) ---
+# `GET /events?topics=stock,sales,satellites` mantiene la conexión abierta y
+# emite los eventos publicados por las escrituras (ver EVENT_MODELS). Todas las
+# conexiones de un proceso comparten un único LISTEN en la base de datos. Con
+# un worker que no es asíncrono, o pasado EVENT_MAX_SUBSCRIPTIONS por proceso,
+# se responde 503 para no quitarle hilos a la API.
+def _events_unavailable():
+    """503 con `retry:` para que el cliente vuelva a intentar más tarde."""
+    return Response(f'retry: {events.EVENT_RETRY_MS}\n\n', status=503, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache', 'Retry-After': str(max(1, events.EVENT_RETRY_MS // 1000)),
+    })
+
+@app.route('/events', methods=['GET'])
+@compress_route(enabled=False)
+def stream_events():
+    requested = {t.strip() for t in request.args.get('topics', '').split(',') if t.strip()}
+    unknown = requested - events.TOPICS
+    if unknown:
+        return jsonify({'success': False, 'message': f"Temas desconocidos: {', '.join(sorted(unknown))}"}), 400
+    if not events.streaming_supported(request.environ):
+        logger.warning("/events rechazado: el worker no es asíncrono (ver GUNICORN_WORKER_CLASS).")
+        return _events_unavailable()
     try:
-        kpis = {}
-        deuda_c = db.session.query(func.sum(Cliente.valor - Cliente.abono)).scalar()
-        kpis['deuda_clientes'] = float(deuda_c or 0)
-
-        deuda_p = db.session.query(func.sum(Proveedor.valor - Proveedor.abono)).scalar()
-        kpis['deuda_proveedores'] = float(deuda_p or 0)
+        subscription = events_broker.subscribe(frozenset(requested or events.TOPICS))
+    except events.SubscriptionLimit:
+        return _events_unavailable()
 
-        total_v = db.session.query(func.sum(Venta.total_sale)).scalar()
-        kpis['total_ventas'] = float(total_v or 0)
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.next_message(events.EVENT_HEARTBEAT)
+                yield message if message is not None else ': ping\n\n'
+        finally:
+            events_broker.unsubscribe(subscription)
 
-        val_telas = db.session.query(func.sum(LlegadaTela.cantidad_value * LlegadaTela.unit_value)).scalar()
-        kpis['valor_inventario_telas'] = float(val_telas or 0)
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no',
+    })
 
-        val_mats = db.session.query(func.sum(LlegadaMaterial.quantity_value * LlegadaMaterial.unit_value)).scalar()
-        kpis['valor_inventario_materiales'] = float(val_mats or 0)
+# --- RUTAS DE LÓGICA DE NEGOCIO Y DASHBOARD ---
 
-        val_prod = db.session.query(func.sum(AsignacionSatelite.total_price)).filter(AsignacionSatelite.status == 'Asignado').scalar()
-        kpis['valor_en_produccion'] = float(val_prod or 0)
-        
-        kpis['total_empleados'] = Empleado.query.count()
+# --- KPIs ---
+# Los KPIs se calculan en una sola consulta y se sirven desde una instantánea en
+# memoria. Las escrituras hechas por la API sobre las tablas involucradas la
+# invalidan; KPI_CACHE_TTL (segundos) acota lo desactualizada que puede estar
+# ante escrituras de otros procesos (otros workers, import_data.py).
+KPI_CACHE_TTL = float(os.environ.get('KPI_CACHE_TTL', 60))
+KPI_TABLES = frozenset({
+    'clientes', 'proveedores', 'ventas', 'llegada_telas', 'llegada_material',
+    'asignaciones_satelites', 'empleados',
+})
+_kpi_snapshot = {'value': None, 'computed_at': 0.0, 'generation': 0}
+_kpi_lock = threading.Lock()
+
+def compute_kpis():
+    """Calcula todos los KPIs del Dashboard en un solo viaje a la base de datos."""
+    row = db.session.execute(select(
+        select(func.sum(Cliente.valor - Cliente.abono)).scalar_subquery().label('deuda_clientes'),
+        select(func.sum(Proveedor.valor - Proveedor.abono)).scalar_subquery().label('deuda_proveedores'),
+        select(func.sum(Venta.total_sale)).scalar_subquery().label('total_ventas'),
+        select(func.sum(LlegadaTela.cantidad_value * LlegadaTela.unit_value)).scalar_subquery().label('valor_inventario_telas'),
+        select(func.sum(LlegadaMaterial.quantity_value * LlegadaMaterial.unit_value)).scalar_subquery().label('valor_inventario_materiales'),
+        select(func.sum(AsignacionSatelite.total_price)).where(AsignacionSatelite.status == 'Asignado').scalar_subquery().label('valor_en_produccion'),
+        select(func.count()).select_from(Empleado).scalar_subquery().label('total_empleados'),
+    )).one()
+    kpis = {key: float(value or 0) for key, value in row._mapping.items()}
+    kpis['total_empleados'] = int(kpis['total_empleados'])
+    return kpis
+
+@on_tables_committed
+def _invalidate_kpi_snapshot(tables):
+    if tables & KPI_TABLES:
+        _kpi_snapshot['generation'] += 1
+        _kpi_snapshot['value'] = None
+
+def get_kpi_snapshot():
+    """Devuelve `(kpis, antigüedad en segundos)`, recalculando solo si hace falta."""
+    snapshot = _kpi_snapshot
+    age = time.monotonic() - snapshot['computed_at']
+    if snapshot['value'] is not None and age < KPI_CACHE_TTL:
+        return snapshot['value'], age
+    with _kpi_lock:
+        # Otro hilo pudo recalcularla mientras esperábamos el candado
+        age = time.monotonic() - snapshot['computed_at']
+        if snapshot['value'] is not None and age < KPI_CACHE_TTL:
+            return snapshot['value'], age
+        generation = snapshot['generation']
+        kpis = compute_kpis()
+        # Si hubo una escritura durante el cálculo, no se guarda un valor que ya puede estar viejo
+        if snapshot['generation'] == generation:
+            snapshot['value'], snapshot['computed_at'] = kpis, time.monotonic()
+        return kpis, 0.0
 
-        return jsonify(kpis)
+@app.route('/api/kpis', methods=['GET'])
+def get_kpis():
+    try:
+        kpis, age = get_kpi_snapshot()
+        response = jsonify(kpis)
+        response.headers['X-Snapshot-Age'] = f'{age:.1f}'
+        return response
     except Exception as e:
         logger.error(f"Error en /api/kpis: {e}")
         return jsonify({"error": f"Error al calcular KPIs: {e}"}), 500
 
+@app.route('/api/pool-stats', methods=['GET'])
+@compress_route(enabled=False)
+def get_pool_stats():
+    """Estado del pool de conexiones de este worker (cada worker tiene el suyo)."""
+    pool = db.engine.pool
+    stats = pool.stats() if isinstance(pool, pooling.InstrumentedQueuePool) else {'pool': pool.status()}
+    stats.update({'pid': os.getpid(), 'statement_timeout_ms': DB_STATEMENT_TIMEOUT_MS})
+    return jsonify(stats)
+
 # --- Gráficos del Dashboard ---
 @app.route('/api/charts/sales-trend', methods=['GET'])
 def get_chart_sales_trend():
     try:
-        results = db.session.query(
-            func.to_char(Venta.sale_date, 'YYYY-MM'), 
-            func.sum(Venta.total_sale)
-        ).group_by(func.to_char(Venta.sale_date, 'YYYY-MM')).order_by(func.to_char(Venta.sale_date, 'YYYY-MM')).all()
+        # Lee el resumen mensual mantenido por triggers (ver aggregates.py)
+        results = db.session.query(ResumenVentasMes.mes, ResumenVentasMes.total).filter(
+            ResumenVentasMes.filas > 0
+        ).order_by(ResumenVentasMes.mes == '', ResumenVentasMes.mes).all()
         
         return jsonify({
-            'labels': [r[0] for r in results],
+            'labels': [r[0] or None for r in results],
             'data': [float(r[1] or 0) for r in results]
         })
     except Exception as e:
@@ -923,12 +2068,11 @@ def get_chart_cuts_status():
 @app.route('/api/charts/production-by-satellite', methods=['GET'])
 def get_chart_production_by_satellite():
     try:
-        results = db.session.query(
-            AsignacionSatelite.satellite_name, 
-            func.sum(AsignacionSatelite.total_price)
-        ).group_by(AsignacionSatelite.satellite_name).order_by(func.sum(AsignacionSatelite.total_price).desc()).all()
+        results = db.session.query(ResumenSatelite.satellite_name, ResumenSatelite.total).filter(
+            ResumenSatelite.filas > 0
+        ).order_by(ResumenSatelite.total.desc()).all()
         return jsonify({
-            'labels': [r[0] for r in results],
+            'labels': [r[0] or None for r in results],
             'data': [float(r[1] or 0) for r in results]
         })
     except Exception as e:
@@ -939,12 +2083,11 @@ def get_chart_production_by_satellite():
 def get_chart_fabrics_by_value():
     try:
         top_fabrics = db.session.query(
-            LlegadaTela.tipo_de_tela,
-            func.sum(LlegadaTela.cantidad_value * LlegadaTela.unit_value).label('total_value')
-        ).group_by(LlegadaTela.tipo_de_tela).order_by(func.sum(LlegadaTela.cantidad_value * LlegadaTela.unit_value).desc()).limit(5).all()
+            ResumenTipoTela.tipo_de_tela, ResumenTipoTela.total.label('total_value')
+        ).filter(ResumenTipoTela.filas > 0).order_by(ResumenTipoTela.total.desc()).limit(5).all()
         
         return jsonify({
-            'labels': [r.tipo_de_tela for r in top_fabrics],
+            'labels': [r.tipo_de_tela or None for r in top_fabrics],
             'data': [float(r.total_value or 0) for r in top_fabrics]
         })
     except Exception as e:
@@ -954,37 +2097,115 @@ def get_chart_fabrics_by_value():
 @app.route('/api/charts/inventory-by-supplier', methods=['GET'])
 def get_chart_inventory_by_supplier():
     try:
-        fabrics_value = db.session.query(
-            LlegadaTela.proveedor,
-            func.sum(LlegadaTela.cantidad_value * LlegadaTela.unit_value).label('total')
-        ).group_by(LlegadaTela.proveedor).subquery()
-        
-        materials_value = db.session.query(
-            LlegadaMaterial.supplier.label('proveedor'),
-            func.sum(LlegadaMaterial.quantity_value * LlegadaMaterial.unit_value).label('total')
-        ).group_by(LlegadaMaterial.supplier).subquery()
-        
-        from sqlalchemy import union_all
-        all_inventory = union_all(fabrics_value.select(), materials_value.select()).alias('all_inventory')
-        
-        results = db.session.query(
-            all_inventory.c.proveedor,
-            func.sum(all_inventory.c.total).label('grand_total')
-        ).group_by(all_inventory.c.proveedor).order_by(func.sum(all_inventory.c.total).desc()).limit(10).all()
+        grand_total = (ResumenProveedor.total_telas + ResumenProveedor.total_materiales).label('grand_total')
+        results = db.session.query(ResumenProveedor.proveedor, grand_total).filter(
+            ResumenProveedor.filas_telas + ResumenProveedor.filas_materiales > 0
+        ).order_by(grand_total.desc()).limit(10).all()
 
         return jsonify({
-            'labels': [r.proveedor for r in results],
+            'labels': [r.proveedor or None for r in results],
             'data': [float(r.grand_total or 0) for r in results]
         })
     except Exception as e:
         logger.error(f"Error en chart/inventory-by-supplier: {e}")
         return jsonify({"error": "Error al procesar inventario por proveedor"}), 500
 
-# --- Creación de las tablas ---
-with app.app_context():
-    logger.info("Verificando y creando tablas de la base de datos si es necesario...")
-    db.create_all()
-    logger.info("Tablas listas.")
+# --- Migraciones y mantenimiento del esquema ---
+# Importar la app no toca la base de datos: el esquema se actualiza con
+# `flask db-upgrade` en el paso de release/despliegue, o una sola vez al
+# arrancar gunicorn con MIGRATE_ON_START=true (ver gunicorn.conf.py).
+@app.cli.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='Versión máxima a aplicar.')
+def db_upgrade_command(target):
+    """Aplica las migraciones pendientes (ver migrations.py)."""
+    applied = migrations.upgrade(db.engine, target)
+    for version, name in applied:
+        click.echo(f"Aplicada {version:04d}_{name}")
+    click.echo("Esquema al día." if not applied else f"{len(applied)} migración(es) aplicada(s).")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """Muestra las migraciones pendientes."""
+    pending = migrations.pending_migrations(db.engine)
+    for version, name in pending:
+        click.echo(f"Pendiente {version:04d}_{name}")
+    click.echo(f"{len(pending)} migración(es) pendiente(s).")
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Verifica con EXPLAIN que las consultas frecuentes usan sus índices."""
+    failures = 0
+    for name, expected, used in migrations.check_indexes(db.engine):
+        ok = expected in used
+        failures += 0 if ok else 1
+        click.echo(f"[{'OK' if ok else 'FALLA'}] {name}: esperado {expected}, usados {', '.join(used) or 'ninguno'}")
+    if failures:
+        raise SystemExit(f"{failures} consulta(s) frecuente(s) no usan su índice.")
+
+@app.cli.command('rebuild-aggregates')
+def rebuild_aggregates_command():
+    """Recalcula desde cero las tablas de resumen del Dashboard."""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        aggregates.lock(connection)
+        aggregates.rebuild(connection)
+    click.echo("Tablas de resumen recalculadas.")
+
+@app.cli.command('check-stock-balances')
+@click.option('--fix', is_flag=True, help='Recalcular los saldos si hay diferencias.')
+def check_stock_balances_command(fix):
+    """Compara los saldos de materiales con un recálculo desde llegada_material."""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        # Sin escrituras concurrentes mientras se compara (y se corrige)
+        connection.exec_driver_sql(f"LOCK TABLE {LlegadaMaterial.__tablename__} IN SHARE MODE")
+        rows = aggregates.drift(connection, ['saldos_material'])['saldos_material']
+        for row in rows:
+            identity = ' / '.join(row[key] or '-' for key in ('material_name', 'size_value', 'size_unit', 'quantity_type'))
+            click.echo(
+                f"[DIFERENCIA] {identity}: guardado {row['total_guardado']:.4f} ({row['filas_guardadas']} filas), "
+                f"esperado {row['total_esperado']:.4f} ({row['filas_esperadas']} filas)"
+            )
+        if rows and fix:
+            aggregates.rebuild(connection, ['saldos_material'])
+    if not rows:
+        click.echo("Los saldos de materiales coinciden con llegada_material.")
+    elif fix:
+        click.echo(f"{len(rows)} saldo(s) con diferencias; recalculados.")
+    else:
+        raise SystemExit(f"{len(rows)} saldo(s) con diferencias. Use --fix para recalcularlos.")
+
+@app.cli.command('prune-tombstones')
+@click.option('--days', type=int, default=30, show_default=True, help='Antigüedad mínima de las lápidas a borrar.')
+def prune_tombstones_command(days):
+    """Poda las lápidas viejas del feed `?since=` (los clientes atrasados recargan)."""
+    with db.engine.begin() as connection:
+        pruned = sync.prune(connection, days)
+    click.echo(f"Lápidas podadas en: {', '.join(pruned)}" if pruned else "No había lápidas para podar.")
+
+@app.cli.command('compact-table-changes')
+def compact_table_changes_command():
+    """Reduce a una fila por tabla los cambios terminados que alimentan los ETag."""
+    with db.engine.begin() as connection:
+        compacted = versions.compact(connection)
+    click.echo(f"Cambios compactados en: {', '.join(compacted)}" if compacted else "No había cambios para compactar.")
+
+@app.cli.command('ledger-checkpoint')
+def ledger_checkpoint_command():
+    """Registra en el historial de telas el saldo de los rollos sin saldo o con un saldo distinto."""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        fabric_ids = ledger.checkpoint(connection)
+    click.echo(f"Saldo registrado para {len(fabric_ids)} rollo(s)." if fabric_ids else "Todos los rollos tienen su saldo al día.")
+
+@app.cli.command('build-static')
+@click.option('--out', 'out_dir', required=True, type=click.Path(file_okay=False), help='Directorio de salida.')
+def build_static_command(out_dir):
+    """Genera las páginas versionadas con sus variantes .gz/.br para nginx o una CDN."""
+    files = static_store.build(out_dir)
+    for name, entry in sorted(files.items()):
+        click.echo(f"{name} v={entry['version']} {' '.join(entry['encodings']) or '(sin comprimir)'}")
+    click.echo(f"{len(files)} archivo(s) en {out_dir}.")
 
 # --- Ejecución Principal ---
 if __name__ == '__main__':
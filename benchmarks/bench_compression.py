@@ -0,0 +1,78 @@
+"""Benchmark: bytes en la red y CPU de la compresión de respuestas de la API.
+
+Genera una respuesta tipo `/products` (filas de `ProductoTerminado` con sus
+arreglos `materials_used`/`fabrics_used`) con el serializador de la app y mide,
+para cada codificación disponible y algunos niveles, el tamaño comprimido y el
+tiempo de CPU; también la variante en streaming (un vaciado por bloque de
+STREAM_CHUNK_SIZE filas, como `?stream=true`).
+
+Uso:
+    python benchmarks/bench_compression.py [--rows 20000] [--chunk 1000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression  # noqa: E402
+from bench_serializers import make_rows  # noqa: E402
+from models import ProductoTerminado  # noqa: E402
+from serializers import serializer_for, dumps  # noqa: E402
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 5, 11), 'zstd': (1, 3, 9)}
+
+
+def cpu_time(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def stream_chunks(items, chunk):
+    yield '['
+    for start in range(0, len(items), chunk):
+        yield ('' if start == 0 else ',') + ','.join(items[start:start + chunk])
+    yield ']'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    serialize = serializer_for(ProductoTerminado)
+    items = [dumps(serialize(row)) for row in make_rows(args.rows)]
+    payload = ('[' + ','.join(items) + ']').encode('utf-8')
+    size = len(payload)
+    print(f'{args.rows} filas, {size / 1024:.1f} KiB sin comprimir, mejor de {args.repeat} corridas\n')
+    print(f"{'codificación':<14}{'nivel':>6}{'KiB':>10}{'ratio':>8}{'CPU ms':>10}{'MiB/s':>9}"
+          f"{'stream KiB':>12}{'stream ms':>11}")
+
+    for encoding in compression.available_encodings(compression.DYNAMIC_PREFERENCE):
+        for level in LEVELS[encoding]:
+            elapsed, body = cpu_time(lambda: compression.compress(payload, encoding, level), args.repeat)
+            stream_elapsed, stream_body = cpu_time(
+                lambda: b''.join(compression.compress_stream(stream_chunks(items, args.chunk), encoding, level)),
+                args.repeat,
+            )
+            marker = ' *' if compression.DYNAMIC_LEVELS[encoding] == level else ''
+            print(f'{encoding:<14}{level:>6}{len(body) / 1024:>10.1f}{size / len(body):>8.1f}'
+                  f'{elapsed * 1000:>10.1f}{size / 1048576 / max(elapsed, 1e-9):>9.1f}'
+                  f'{len(stream_body) / 1024:>12.1f}{stream_elapsed * 1000:>11.1f}{marker}')
+
+    missing = [e for e in compression.DYNAMIC_PREFERENCE if e not in compression.COMPRESSORS]
+    print('\n* nivel por defecto para respuestas de la API (COMPRESS_LEVEL_<CODIFICACIÓN>)')
+    if missing:
+        print(f"No instaladas (se omiten): {', '.join(missing)}")
+
+
+if __name__ == '__main__':
+    main()
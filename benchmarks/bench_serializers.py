@@ -0,0 +1,93 @@
+"""Micro-benchmark: `model_to_dict` original vs. serializadores precompilados.
+
+Serializa 100.000 instancias de `ProductoTerminado` (sin base de datos) con la
+implementación anterior de `model_to_dict` + `json.dumps` y con el serializador
+precompilado + el codificador rápido, e imprime tiempos y aceleración.
+
+Uso:
+    python benchmarks/bench_serializers.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import ProductoTerminado  # noqa: E402
+from serializers import serializer_for, dumps  # noqa: E402
+
+
+def legacy_model_to_dict(model_instance):
+    """Implementación previa de app.model_to_dict, copiada como referencia."""
+    if model_instance is None:
+        return None
+    d = {}
+    for column in model_instance.__table__.columns:
+        value = getattr(model_instance, column.name)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            d[column.name] = value.isoformat()
+        elif isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
+            try:
+                d[column.name] = json.loads(value)
+            except json.JSONDecodeError:
+                d[column.name] = value
+        else:
+            d[column.name] = value
+    return d
+
+
+def make_rows(n):
+    fecha = datetime.date(2024, 1, 1)
+    materials = json.dumps([{'id': 1, 'quantity_used': 2.5}, {'id': 7, 'quantity_used': 10}])
+    fabrics = json.dumps([{'id': 3, 'quantity_used': 12.75}])
+    return [
+        ProductoTerminado(
+            id=i, lote=f'L-{i // 50}', fecha=fecha, referencia=f'REF-{i % 300}',
+            codigo_barras=f'770{i:09d}', medida_trazo=1.85, trazos=12, cantidad=40.0,
+            tipo_tela='Drill', satellite='Satélite Norte', serial=str(7300 + i),
+            observacion='[pendiente] revisar costuras', valor_confeccion=3500.0,
+            ganancia_percent=30.0, valor_total=140000.0, valor_venta=182000.0,
+            materials_used=materials, fabrics_used=fabrics, has_sample=False, sample_code=None,
+        )
+        for i in range(n)
+    ]
+
+
+def timed(label, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<45} {best * 1000:10.1f} ms')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    serialize = serializer_for(ProductoTerminado)
+    print(f'{args.rows} filas de ProductoTerminado, mejor de {args.repeat} corridas\n')
+
+    legacy_dict = timed('model_to_dict original', lambda: [legacy_model_to_dict(r) for r in rows], args.repeat)
+    fast_dict = timed('serializador precompilado', lambda: [serialize(r) for r in rows], args.repeat)
+    legacy_json = timed(
+        'model_to_dict original + json.dumps',
+        lambda: json.dumps([legacy_model_to_dict(r) for r in rows]), args.repeat,
+    )
+    fast_json = timed('precompilado + dumps rápido', lambda: dumps([serialize(r) for r in rows]), args.repeat)
+
+    print(f'\nAceleración (dict):          x{legacy_dict / fast_dict:.2f}')
+    print(f'Aceleración (dict + JSON):   x{legacy_json / fast_json:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark: arranque en frío, desde el import de la app hasta la primera respuesta.
+
+Cada corrida es un proceso nuevo (como un worker recién creado tras un deploy o
+un autoescalado) que mide por separado:
+
+- import: `import app` (configuración, modelos, serializadores).
+- primera petición: la primera respuesta de `--path` con el cliente de pruebas
+  de Flask (incluye abrir la primera conexión del pool si la ruta usa la base).
+
+Con `--gunicorn` mide en cambio el tiempo real desde lanzar
+`gunicorn app:app` (con gunicorn.conf.py) hasta el primer 200 en `--path`.
+
+Requiere DATABASE_URL. Uso:
+    python benchmarks/bench_startup.py [--runs 5] [--path /health] [--gunicorn]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'total_ms': (served - start) * 1000,
+}))
+'''
+
+
+def run_in_process(path):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, path], cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(path, timeout=60):
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY='1', GUNICORN_ACCESSLOG='')
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app'], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=1) as response:
+                    if response.status == 200:
+                        return {'status': 200, 'total_ms': (time.perf_counter() - start) * 1000}
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f'gunicorn no respondió {path} en {timeout}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(label, values):
+    print(f'{label:<22} mediana {statistics.median(values):8.1f} ms   '
+          f'mín {min(values):8.1f} ms   máx {max(values):8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/health')
+    parser.add_argument('--gunicorn', action='store_true', help='Medir con gunicorn real hasta el primer 200.')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL no está configurada.')
+
+    results = [run_gunicorn(args.path) if args.gunicorn else run_in_process(args.path) for _ in range(args.runs)]
+    print(f"{args.runs} arranque(s) en frío, primera petición: GET {args.path} "
+          f"({'gunicorn' if args.gunicorn else 'cliente de pruebas'})\n")
+    if not args.gunicorn:
+        summarize('import app', [r['import_ms'] for r in results])
+        summarize('primera petición', [r['first_request_ms'] for r in results])
+    summarize('total', [r['total_ms'] for r in results])
+    failed = [r['status'] for r in results if r['status'] != 200]
+    if failed:
+        print(f'\nAtención: {len(failed)} corrida(s) respondieron {sorted(set(failed))}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Negociación de `Accept-Encoding` y compresión de respuestas.
+
+gzip viene con Python; brotli (`brotli`) y zstd (`zstandard`) son opcionales y
+solo se ofrecen si están instalados. Las páginas estáticas se comprimen una vez
+al máximo nivel (ver static_assets.py); las respuestas de la API se comprimen
+en cada petición con niveles rápidos (DYNAMIC_LEVELS) y, si se emiten en
+streaming, bloque a bloque con un vaciado por bloque para que el cliente reciba
+los datos sin esperar al final.
+"""
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard es opcional
+    zstandard = None
+
+# Orden de preferencia del servidor ante calidades iguales
+PREFERENCE = ('br', 'gzip')
+DYNAMIC_PREFERENCE = ('zstd', 'br', 'gzip')
+
+# Niveles por defecto para respuestas generadas en cada petición: buena
+# relación tamaño/CPU, lejos de los máximos que se usan con los estáticos.
+DYNAMIC_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+
+
+def _compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+def _compress_br(data, level):
+    return brotli.compress(data, quality=11 if level is None else level)
+
+
+def _compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=19 if level is None else level).compress(data)
+
+
+COMPRESSORS = {'gzip': _compress_gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = _compress_br
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _compress_zstd
+
+
+def available_encodings(preference=PREFERENCE):
+    return [encoding for encoding in preference if encoding in COMPRESSORS]
+
+
+def parse_accept_encoding(header):
+    """`{codificación: calidad}` según la cabecera `Accept-Encoding`."""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header, offered, preference=PREFERENCE):
+    """Elige la mejor codificación de `offered` aceptada por el cliente, o None (identidad)."""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in preference:
+        if encoding not in offered:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=None):
+    """Comprime `data` (bytes) con `encoding`; `level` None usa el máximo."""
+    return COMPRESSORS[encoding](data, level)
+
+
+# --- Compresión en streaming ---
+class _GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+_STREAMS = {'gzip': _GzipStream, 'br': _BrotliStream, 'zstd': _ZstdStream}
+
+
+def compress_stream(chunks, encoding, level=None):
+    """Comprime un iterable de bloques (str o bytes), vaciando el compresor tras cada uno."""
+    stream = _STREAMS[encoding](DYNAMIC_LEVELS[encoding] if level is None else level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield stream.compress(chunk)
+        yield stream.finish()
+    finally:
+        # Cierra el generador original (libera su contexto y su cursor de base de datos)
+        if hasattr(chunks, 'close'):
+            chunks.close()
@@ -0,0 +1,191 @@
+"""Eventos de cambio en tiempo real (Server-Sent Events).
+
+Las rutas de escritura publican eventos compactos con `pg_notify` dentro de su
+transacción, así PostgreSQL solo los entrega si la transacción se confirma (y
+en orden de commit). Cada proceso de la app mantiene una única conexión con
+`LISTEN` en un hilo y reparte cada notificación a las colas de los clientes
+suscritos: abrir más pestañas no agrega consultas a la base de datos.
+
+Formato de un evento:
+    {"topic": "stock", "resource": "fabrics", "op": "upsert", "items": [{"id": 7, "stock": 12.5}]}
+
+`op` es `upsert` o `delete`. Los eventos son avisos: el cliente que necesite la
+fila completa la pide con `?since=` (ver sync.py).
+
+Cada conexión abierta ocupa a quien la atiende mientras dure la pestaña: con
+workers de gevent es una corrutina, pero con workers de hilos (gthread) o
+síncronos es un hilo o el worker entero, y unas pocas pestañas dejarían a la
+API sin capacidad. Por eso `streaming_supported` solo admite el stream bajo
+gunicorn con gevent (o fuera de gunicorn, con el servidor de desarrollo), y
+cada proceso acepta como máximo EVENT_MAX_SUBSCRIPTIONS conexiones; pasado el
+tope `subscribe` lanza SubscriptionLimit y la app responde 503 con `retry:`.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'damar_eventos'
+# pg_notify admite hasta 8000 bytes por mensaje; los eventos grandes se parten
+MAX_PAYLOAD = 7000
+TOPICS = frozenset({'stock', 'sales', 'satellites'})
+
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 256))
+EVENT_HEARTBEAT = float(os.environ.get('EVENT_HEARTBEAT', 15))
+EVENT_MAX_SUBSCRIPTIONS = int(os.environ.get('EVENT_MAX_SUBSCRIPTIONS', 100))
+# Espera sugerida a los clientes rechazados antes de reintentar (milisegundos)
+EVENT_RETRY_MS = int(os.environ.get('EVENT_RETRY_MS', 30000))
+
+# Mensaje que reciben los clientes que pudieron perder eventos (reconexión del
+# oyente o cola llena): deben resincronizarse con `?since=`.
+RESYNC = 'event: resync\ndata: {}\n\n'
+
+
+class SubscriptionLimit(Exception):
+    """El proceso ya atiende EVENT_MAX_SUBSCRIPTIONS conexiones de eventos."""
+
+
+def streaming_supported(environ):
+    """Si el servidor que atiende la petición puede mantener conexiones SSE largas."""
+    if not environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        return True
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def _payloads(topic, resource, op, items):
+    """Codifica el evento en uno o más mensajes de menos de MAX_PAYLOAD bytes."""
+    encoded = [json.dumps(item, default=str, separators=(',', ':')) for item in items]
+    head = json.dumps({'topic': topic, 'resource': resource, 'op': op}, separators=(',', ':'))[:-1] + ',"items":['
+    chunk, size = [], len(head) + 2
+    for item in encoded:
+        if chunk and size + len(item) + 1 > MAX_PAYLOAD:
+            yield head + ','.join(chunk) + ']}'
+            chunk, size = [], len(head) + 2
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield head + ','.join(chunk) + ']}'
+
+
+def publish(connection, topic, resource, op, items):
+    """Encola el evento en la transacción de `connection` (conexión o sesión)."""
+    for payload in _payloads(topic, resource, op, items):
+        connection.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': CHANNEL, 'payload': payload})
+
+
+class Subscription:
+    """Cola de mensajes SSE de un cliente, filtrada por temas."""
+
+    def __init__(self, topics):
+        self.topics = topics
+        self.queue = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Cliente lento: se descarta lo pendiente y se le pide resincronizar
+            self.overflowed = True
+
+    def next_message(self, timeout):
+        """Siguiente mensaje SSE, o None si no hubo eventos en `timeout` segundos."""
+        if self.overflowed:
+            self.overflowed = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return RESYNC
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Reparte las notificaciones de PostgreSQL entre las suscripciones del proceso."""
+
+    def __init__(self, dsn, max_subscriptions=None):
+        self.dsn = dsn
+        self.max_subscriptions = max_subscriptions or EVENT_MAX_SUBSCRIPTIONS
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscriptions:
+                raise SubscriptionLimit(self.max_subscriptions)
+            self._subscriptions.add(subscription)
+            # El hilo se arranca en el proceso que atiende (tras el fork de gunicorn)
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._listen, name='damar-eventos', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _dispatch(self, payload):
+        try:
+            topic = json.loads(payload)['topic']
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Evento inválido en {CHANNEL}: {payload[:200]}")
+            return
+        message = f'event: {topic}\ndata: {payload}\n\n'
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if topic in subscription.topics:
+                subscription.deliver(message)
+
+    def _broadcast(self, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def _listen(self):
+        backoff = 1
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {CHANNEL}")
+                if connected_before:
+                    self._broadcast(RESYNC)
+                connected_before, backoff = True, 1
+                logger.info(f"Escuchando eventos en el canal {CHANNEL}.")
+                while True:
+                    if select.select([connection], [], [], EVENT_HEARTBEAT) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._dispatch(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Conexión de eventos perdida ({e}); reintentando en {backoff}s.")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
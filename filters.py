@@ -0,0 +1,223 @@
+"""Filtros, orden y búsqueda por query string en las rutas de colecciones.
+
+Los nombres son los de las columnas del modelo de la ruta:
+
+- `campo=valor` / `campo__eq=valor`: igualdad.
+- `campo__gte=`, `campo__lte=`, `campo__gt=`, `campo__lt=`: rangos. En las
+  columnas de fecha y hora una fecha sola (`AAAA-MM-DD`) abarca el día completo.
+- `campo__in=a,b,c`: alguno de los valores.
+- `order_by=campo` / `order_by=-campo` (descendente): reemplaza el orden de la
+  ruta; la paginación por cursor sigue desempatando por la clave primaria.
+- `q=texto`: cada palabra debe aparecer en alguna de las columnas de texto del
+  modelo (SEARCH_COLUMNS), como subcadena o como una palabra parecida
+  (similitud de trigramas de pg_trgm, tolera errores de tipeo). Lo resuelve un
+  índice GIN de trigramas sobre la concatenación de esas columnas.
+
+Los valores se convierten según el tipo de la columna. Un campo u operador
+desconocido, o un valor que no corresponde al tipo, lanza FilterError (la app
+responde 400). Las columnas JSON y las ocultas no se filtran ni ordenan. Los
+parámetros que empiezan con `_` (p. ej. el `_=` antecaché de jQuery) se ignoran.
+"""
+import datetime
+import operator
+
+from sqlalchemy import JSON, Boolean, Date, DateTime, Float, Integer, and_, func, or_
+from sqlalchemy.dialects import postgresql
+
+from models import (
+    Usuario, Empleado, Cliente, Proveedor, Banco, LlegadaMaterial, LlegadaTela, HistorialTela,
+    ProductoTerminado, ProgramacionCorte, AsignacionSatelite, EntregaSatelite, PagoSatelite,
+    Venta, ProveedorHistorial, DynamicCode,
+)
+
+ORDER_ARG = 'order_by'
+RESERVED_PREFIX = '_'
+SEARCH_ARG = 'q'
+LIST_SEPARATOR = ','
+HIDDEN_COLUMNS = frozenset({'contraseña'})
+COMPARISONS = {
+    'eq': operator.eq, 'gte': operator.ge, 'gt': operator.gt, 'lte': operator.le, 'lt': operator.lt,
+}
+TRUE_VALUES = ('1', 'true', 'yes', 'si', 'sí')
+FALSE_VALUES = ('0', 'false', 'no')
+
+# Columnas de texto en las que busca `q=` (el índice de búsqueda sigue este orden)
+SEARCH_COLUMNS = {
+    Usuario: ('usuario', 'rol'),
+    Empleado: ('codigo_empleado', 'name', 'cedula', 'role'),
+    Cliente: ('factura', 'referencia'),
+    Proveedor: ('proveedor', 'factura', 'tela'),
+    Banco: ('banco', 'punto_venta', 'aprobacion', 'descripcion'),
+    LlegadaMaterial: ('material_name', 'barcode', 'supplier'),
+    LlegadaTela: ('serial_rollo', 'barcode', 'tipo_de_tela', 'referencia_de_tela', 'proveedor', 'invoice_number'),
+    HistorialTela: ('serial_rollo', 'type', 'tipo_de_tela', 'referencia_de_tela', 'proveedor', 'details'),
+    ProductoTerminado: ('referencia', 'serial', 'lote', 'codigo_barras', 'tipo_tela', 'satellite', 'sample_code'),
+    ProgramacionCorte: ('reference', 'colors', 'distribute_to', 'status'),
+    AsignacionSatelite: ('satellite_name', 'product_lote', 'sample_code', 'status'),
+    EntregaSatelite: ('satellite_name', 'product_serial', 'product_lote'),
+    PagoSatelite: ('satellite_name', 'product_serial', 'reference', 'details'),
+    Venta: ('invoice_number', 'punto_venta', 'banco_consignacion'),
+    ProveedorHistorial: ('proveedor', 'factura', 'type', 'details'),
+    DynamicCode: ('code', 'description'),
+}
+
+
+class FilterError(ValueError):
+    """Filtro, orden o búsqueda inválidos; se responde con un 400."""
+
+
+def _columns(model):
+    return {
+        key: column for key, column in model.__mapper__.columns.items()
+        if key not in HIDDEN_COLUMNS and not isinstance(column.type, JSON)
+    }
+
+
+def _attribute(model, name):
+    if name not in _columns(model):
+        raise FilterError(f'No se puede filtrar ni ordenar por "{name}".')
+    return getattr(model, name)
+
+
+# --- Conversión de valores ---
+def _is_date_only(raw):
+    return len(raw) == 10 and 'T' not in raw and ' ' not in raw
+
+
+def _convert(name, column_type, raw):
+    try:
+        if isinstance(column_type, Boolean):
+            lowered = raw.strip().lower()
+            if lowered not in TRUE_VALUES + FALSE_VALUES:
+                raise ValueError(raw)
+            return lowered in TRUE_VALUES
+        if isinstance(column_type, Integer):
+            return int(raw)
+        if isinstance(column_type, Float):
+            return float(raw)
+        if isinstance(column_type, DateTime):
+            return datetime.datetime.fromisoformat(raw)
+        if isinstance(column_type, Date):
+            return datetime.date.fromisoformat(raw)
+    except ValueError:
+        raise FilterError(f'Valor inválido para "{name}": {raw}')
+    return raw
+
+
+def _day_condition(attribute, comparison, raw):
+    """Condición sobre una columna de fecha y hora con una fecha sola: el día completo."""
+    try:
+        start = datetime.datetime.combine(datetime.date.fromisoformat(raw), datetime.time())
+    except ValueError:
+        raise FilterError(f'Valor inválido para "{attribute.key}": {raw}')
+    end = start + datetime.timedelta(days=1)
+    return {
+        'eq': and_(attribute >= start, attribute < end),
+        'gte': attribute >= start,
+        'gt': attribute >= end,
+        'lte': attribute < end,
+        'lt': attribute < start,
+    }[comparison]
+
+
+def _condition(model, name, comparison, raw):
+    attribute = _attribute(model, name)
+    column_type = attribute.property.columns[0].type
+    if comparison == 'in':
+        values = [value.strip() for value in raw.split(LIST_SEPARATOR) if value.strip()]
+        if not values:
+            raise FilterError(f'La lista de "{name}__in" está vacía.')
+        if isinstance(column_type, DateTime):
+            return or_(*(_condition(model, name, 'eq', value) for value in values))
+        return attribute.in_([_convert(name, column_type, value) for value in values])
+    if isinstance(column_type, DateTime) and _is_date_only(raw):
+        return _day_condition(attribute, comparison, raw)
+    return COMPARISONS[comparison](attribute, _convert(name, column_type, raw))
+
+
+def conditions(model, args, ignore=()):
+    """Condiciones de filtro de `args` (un MultiDict de la query string).
+
+    Se omiten `order_by`, `q`, los parámetros de `ignore` (paginación y los
+    propios de la ruta) y los que empiezan con `_`; un parámetro repetido
+    agrega una condición por valor.
+    """
+    result = []
+    for key, values in args.lists():
+        if key in ignore or key in (ORDER_ARG, SEARCH_ARG) or key.startswith(RESERVED_PREFIX):
+            continue
+        name, _, comparison = key.partition('__')
+        if comparison and comparison not in (*COMPARISONS, 'in'):
+            raise FilterError(f'Operador de filtro desconocido: "{comparison}".')
+        for raw in values:
+            result.append(_condition(model, name, comparison or 'eq', raw))
+    return result
+
+
+def ordering(model, raw):
+    """`(columna, descendente)` de `order_by=campo` / `order_by=-campo`."""
+    raw = raw.strip()
+    descending = raw.startswith('-')
+    return _attribute(model, raw.lstrip('-')), descending
+
+
+# --- Búsqueda de texto ---
+def search_index_name(model):
+    return f'ix_{model.__tablename__}_busqueda'
+
+
+def search_expression(model):
+    """Concatenación de las columnas de búsqueda; la misma expresión del índice de trigramas."""
+    columns = [func.coalesce(getattr(model, name), '') for name in SEARCH_COLUMNS[model]]
+    expression = columns[0]
+    for column in columns[1:]:
+        expression = expression + ' ' + column
+    return expression
+
+
+def _escape_like(term):
+    # La barra invertida es el carácter de escape por defecto de LIKE en PostgreSQL
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_condition(model, raw):
+    """Condición de `q=`: cada palabra como subcadena o palabra parecida (`%>`)."""
+    if model not in SEARCH_COLUMNS:
+        raise FilterError('Esta colección no admite búsqueda de texto.')
+    terms = raw.split()
+    if not terms:
+        return None
+    expression = search_expression(model)
+    return and_(*(
+        or_(
+            expression.ilike(f'%{_escape_like(term)}%'),
+            expression.op('%>', is_comparison=True)(term),
+        )
+        for term in terms
+    ))
+
+
+def search_index_ddl(model):
+    """CREATE INDEX del índice GIN de trigramas que respalda `q=` en la tabla del modelo."""
+    expression = search_expression(model).compile(
+        dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True, 'include_table': False}
+    )
+    return (
+        f"CREATE INDEX IF NOT EXISTS {search_index_name(model)} "
+        f"ON {model.__tablename__} USING gin (({expression}) gin_trgm_ops)"
+    )
+
+
+def apply(query, model, args, ignore=()):
+    """Agrega a `query` los filtros y la búsqueda `q=` de `args`."""
+    filters = conditions(model, args, ignore)
+    if args.get(SEARCH_ARG):
+        search = search_condition(model, args[SEARCH_ARG])
+        if search is not None:
+            filters.append(search)
+    return query.filter(*filters) if filters else query
+
+
+def requested(args, ignore=()):
+    """Si `args` pide algún filtro, orden o búsqueda."""
+    return any(key not in ignore and not key.startswith(RESERVED_PREFIX) for key in args)
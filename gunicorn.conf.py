@@ -0,0 +1,67 @@
+"""Perfil de producción de gunicorn (se carga solo con `gunicorn app:app`).
+
+Todo se ajusta por variables de entorno:
+
+- GUNICORN_WORKER_CLASS: `gevent` (por defecto) o `gthread`. Con gevent las
+  conexiones SSE de /events cuestan una corrutina y GUNICORN_WORKER_CONNECTIONS
+  acota el total por worker; EVENT_MAX_SUBSCRIPTIONS (por defecto la mitad)
+  deja el resto para la API. Con gthread cada worker atiende GUNICORN_THREADS
+  peticiones a la vez y una conexión de /events ocuparía un hilo por pestaña,
+  así que la app responde 503 a /events y las páginas funcionan sin cambios
+  en tiempo real.
+- WEB_CONCURRENCY: número de workers (procesos).
+- DB_POOL_SIZE / DB_MAX_OVERFLOW: pool por worker (ver app.py). Por defecto
+  una conexión por hilo.
+- MIGRATE_ON_START: si es `true`, el proceso maestro aplica las migraciones
+  pendientes una vez antes de crear los workers. Lo recomendado es correr
+  `flask db-upgrade` como paso de release y dejarlo desactivado.
+
+Conexiones a PostgreSQL en el peor caso:
+    WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1)
+(el +1 es la conexión LISTEN de /events); se registra al arrancar.
+"""
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+# El pool de la app se dimensiona a partir de los hilos del worker
+os.environ.setdefault('GUNICORN_THREADS', str(threads if worker_class == 'gthread' else 10))
+os.environ.setdefault('EVENT_MAX_SUBSCRIPTIONS', str(max(1, worker_connections // 2)))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Reciclar workers de vez en cuando acota el crecimiento de memoria
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def on_starting(server):
+    if os.environ.get('MIGRATE_ON_START', '').lower() in ('1', 'true', 'yes'):
+        import migrations
+        applied = migrations.upgrade_from_url(os.environ['DATABASE_URL'])
+        server.log.info(f"{len(applied)} migración(es) aplicada(s) al arrancar.")
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 bloquea el hilo en cada consulta salvo que se le enseñe a ceder a gevent
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def when_ready(server):
+    pool_size = int(os.environ.get('DB_POOL_SIZE', os.environ['GUNICORN_THREADS']))
+    max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    server.log.info(
+        f"{workers} worker(s) {worker_class}; hasta {workers * (pool_size + max_overflow + 1)} "
+        f"conexiones a PostgreSQL (pool {pool_size} + desborde {max_overflow} + LISTEN, por worker)."
+    )
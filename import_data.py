@@ -1,13 +1,19 @@
 import os
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import datetime
+import json
 import logging
-from datetime import datetime
-from flask import Flask
+import time
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from sqlalchemy import create_engine, MetaData, Integer, Float, Boolean, Date, DateTime, JSON
+from sqlalchemy.pool import NullPool
 
-# --- 1. Importa la base de datos y los modelos desde models.py ---
-from models import db, Usuario, Empleado, Cliente, Proveedor, Banco, LlegadaMaterial, LlegadaTela, HistorialTela, ProductoTerminado, ProgramacionCorte, AsignacionSatelite, EntregaSatelite, PagoSatelite, Venta, ProveedorHistorial, DynamicCode
+# --- 1. Migraciones y resúmenes del esquema de la app ---
+import aggregates
+import ledger
+import migrations
+import sales
+import usage
 
 # --- Configuración de Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,7 +25,11 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
+# Sin pool: cada proceso de carga abre su propia conexión
+engine = create_engine(DATABASE_URL, poolclass=NullPool)
+
+# Procesos de carga en paralelo (uno por núcleo por defecto; cada uno usa una conexión)
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', os.cpu_count() or 1))
 
 # --- 3. Mapeo de Hojas de Excel a Nombres de Tablas ---
 SHEET_TO_TABLE_MAP = {
@@ -40,80 +50,320 @@ SHEET_TO_TABLE_MAP = {
     'ProveedoresHistorial': 'proveedores_historial'
 }
 
-# --- 4. Función Principal de Importación ---
-def import_sheet_to_table(excel_path, sheet_name, table_name):
+# Encabezados del Excel que no coinciden con el nombre de la columna
+HEADER_RENAMES = {'banco _consignacion': 'banco_consignacion'}
+
+# --- 4. Esquema de las tablas (reflejado una sola vez) ---
+_SCHEMA = {}
+
+def table_schema(connection, table_name):
+    """Devuelve la tabla reflejada; la primera llamada refleja todas las tablas destino."""
+    if not _SCHEMA:
+        meta = MetaData()
+        meta.reflect(bind=connection, only=sorted(set(SHEET_TO_TABLE_MAP.values())))
+        _SCHEMA.update(meta.tables)
+    return _SCHEMA[table_name]
+
+# --- 5. Conversión de celdas al formato de texto de COPY ---
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_NULL = '\\N'
+
+def _as_text(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).translate(_COPY_ESCAPES)
+
+def _as_integer(value):
+    # Como PostgreSQL al asignar un float8 a una columna entera: redondea (al par en los empates), no trunca
+    return str(round(value)) if isinstance(value, (int, float)) and not isinstance(value, bool) else _as_text(value)
+
+def _as_float(value):
+    return repr(float(value)) if isinstance(value, (int, float)) else _as_text(value)
+
+def _as_boolean(value):
+    if isinstance(value, (bool, int, float)):
+        return 't' if value else 'f'
+    return _as_text(value)
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.isoformat() if isinstance(value, datetime.date) else _as_text(value)
+
+def _as_datetime(value):
+    return value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else _as_text(value)
+
+def _as_json(value):
+    # Igual que el tipo JSON de SQLAlchemy: el valor (incluida una cadena) se codifica como JSON
+    return json.dumps(value, default=str).translate(_COPY_ESCAPES)
+
+def converter_for(column_type):
+    for types, converter in (
+        (Boolean, _as_boolean), (Integer, _as_integer), (Float, _as_float),
+        (DateTime, _as_datetime), (Date, _as_date), (JSON, _as_json),
+    ):
+        if isinstance(column_type, types):
+            return converter
+    return _as_text
+
+class CopyStream:
+    """Objeto tipo archivo que produce líneas de COPY a medida que psycopg2 las lee."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._pending = ''
+        self.rows = 0
+
+    def read(self, size=-1):
+        parts, length = [self._pending], len(self._pending)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+            self.rows += 1
+        data = ''.join(parts)
+        if size < 0:
+            self._pending = ''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+    readline = read
+
+# --- 6. Carga de una hoja con COPY FROM STDIN ---
+def copy_lines(rows, converters):
+    """Convierte las filas de la hoja (tuplas de celdas) en líneas de COPY; omite las vacías."""
+    for row in rows:
+        if row is None or all(value is None for value in row):
+            continue
+        fields = []
+        for index, convert in converters:
+            value = row[index] if index < len(row) else None
+            if isinstance(value, str):
+                value = value.strip() or None
+            fields.append(COPY_NULL if value is None else convert(value))
+        yield '\t'.join(fields) + '\n'
+
+def staging_table(table_name):
+    """Tabla UNLOGGED donde se carga la hoja antes de pasar a `table_name` (ver `publish`)."""
+    return f'importacion_{table_name}'
+
+def create_staging(connection, tables):
+    """Crea (vacías) las tablas de carga, con las columnas y valores por defecto de sus tablas."""
+    for table in tables:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging_table(table)}"')
+        connection.exec_driver_sql(
+            f'CREATE UNLOGGED TABLE "{staging_table(table)}" (LIKE "{table}" INCLUDING DEFAULTS)'
+        )
+
+def drop_staging(connection, tables):
+    for table in tables:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging_table(table)}"')
+
+def load_sheet(connection, worksheet, table_name):
+    """Carga la hoja en la tabla de carga de `table_name`; devuelve las filas cargadas.
+
+    La tabla de carga se vacía en la misma transacción, lo que permite COPY
+    FREEZE, y no tiene triggers ni llaves foráneas; las filas pasan a la tabla
+    real en `publish`, solo si todas las hojas se cargaron.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header:
+        logging.warning(f"La hoja '{worksheet.title}' está vacía.")
+        return 0
+
+    table = table_schema(connection, table_name)
+    converters, column_names, ignored = [], [], []
+    for index, cell in enumerate(header):
+        if cell is None:
+            continue
+        name = str(cell).strip().lower()
+        name = HEADER_RENAMES.get(name, name)
+        if name in table.c and name not in column_names:
+            column_names.append(name)
+            converters.append((index, converter_for(table.c[name].type)))
+        else:
+            ignored.append(cell)
+    if ignored:
+        logging.info(f"'{worksheet.title}': columnas ignoradas (no existen en '{table_name}'): {ignored}")
+    if not column_names:
+        logging.warning(f"La hoja '{worksheet.title}' no tiene columnas de '{table_name}'.")
+        return 0
+
+    staging = staging_table(table_name)
+    columns = ', '.join(f'"{name}"' for name in column_names)
+    stream = CopyStream(copy_lines(rows, converters))
+    connection.exec_driver_sql(f'TRUNCATE TABLE ONLY "{staging}"')
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(f'COPY "{staging}" ({columns}) FROM STDIN WITH (FORMAT text, FREEZE)', stream)
+    return stream.rows
+
+def finalize(connection, table_names):
+    """Alinea las secuencias de IDs y reconstruye los datos derivados (resúmenes, saldos de rollos, tablas de uso, líneas de venta)."""
+    for table_name in table_names:
+        pk = list(table_schema(connection, table_name).primary_key.columns)
+        if len(pk) != 1 or not isinstance(pk[0].type, Integer):
+            continue
+        connection.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table_name}', '{pk[0].name}'), "
+            f"COALESCE(MAX(\"{pk[0].name}\"), 0) + 1, false) FROM \"{table_name}\""
+        )
+    migrations.sync_product_id_sequence(connection)
+    aggregates.lock(connection)
+    aggregates.rebuild(connection)
+    # El COPY no pasa por los triggers del libro de telas: se registra el saldo cargado de cada rollo
+    ledger.checkpoint(connection)
+    # Las tablas de uso y las líneas de venta se vacían en cascada con sus tablas: se reconstruyen desde el JSON
+    processed, skipped = usage.backfill(connection)
+    logging.info(f"Tablas de uso: {processed} producto(s), {len(skipped)} con consumos mal formados.")
+    processed, skipped = sales.backfill(connection)
+    logging.info(f"Líneas de venta: {processed} venta(s), {len(skipped)} con productos vendidos mal formados.")
+
+# --- 7. Plan de dependencias entre tablas ---
+def build_plan(connection, tables):
+    """Ordena las tablas a cargar según las llaves foráneas entre ellas.
+
+    Devuelve `(order, cascaded)`:
+    - `order`: las tablas con cada una después de las que referencia (orden de `publish`).
+    - `cascaded`: tablas fuera del plan que el TRUNCATE ... CASCADE también vacía.
+    """
+    meta = MetaData()
+    meta.reflect(bind=connection)
+    planned = set(tables)
+    depends_on = {table: set() for table in tables}
+    cascaded = set()
+    for child in meta.sorted_tables:
+        for fk in child.foreign_keys:
+            parent = fk.column.table.name
+            if parent not in planned or parent == child.name:
+                continue
+            if child.name in planned:
+                depends_on[child.name].add(parent)
+            else:
+                cascaded.add(child.name)
+    order, pending = [], dict(depends_on)
+    while pending:
+        ready = sorted(table for table, parents in pending.items() if parents <= set(order))
+        if not ready:
+            raise RuntimeError(f"Dependencias circulares entre las tablas: {sorted(pending)}")
+        order += ready
+        for table in ready:
+            del pending[table]
+    return order, cascaded
+
+def publish(connection, order, cascaded):
+    """Reemplaza el contenido de las tablas del plan por el de sus tablas de carga.
+
+    Corre en una sola transacción junto con `finalize`: si algo falla, las
+    tablas conservan sus datos anteriores. Las tablas se vacían de una vez
+    (el CASCADE solo alcanza tablas fuera del plan, y se avisa cuáles) y se
+    llenan en `order`, padres antes que hijos. Los triggers de usuario
+    (resúmenes, versiones, sincronización) se desactivan durante el INSERT: el
+    TRUNCATE ya dejó la marca de recarga para los clientes y los resúmenes se
+    recalculan en `finalize`.
+    """
+    if cascaded:
+        logging.warning(f"TRUNCATE ... CASCADE también vacía tablas que no están en el libro: {sorted(cascaded)}")
+    names = ', '.join(f'"{table}"' for table in order)
+    connection.exec_driver_sql(f'TRUNCATE TABLE {names} RESTART IDENTITY CASCADE')
+    for table in order:
+        connection.exec_driver_sql(f'ALTER TABLE "{table}" DISABLE TRIGGER USER')
+        connection.exec_driver_sql(f'INSERT INTO "{table}" SELECT * FROM "{staging_table(table)}"')
+        connection.exec_driver_sql(f'ALTER TABLE "{table}" ENABLE TRIGGER USER')
+
+# --- 8. Carga en paralelo ---
+# Libro abierto por proceso de carga: openpyxl en modo solo lectura no lee las
+# hojas hasta iterarlas, así que abrirlo es barato y cada proceso lo reutiliza.
+_WORKBOOKS = {}
+
+def _workbook(excel_path):
+    if excel_path not in _WORKBOOKS:
+        _WORKBOOKS[excel_path] = load_workbook(excel_path, read_only=True, data_only=True)
+    return _WORKBOOKS[excel_path]
+
+def load_task(excel_path, sheet, table):
+    """Carga una hoja en su tabla de carga, con su propia conexión; devuelve su línea del resumen."""
+    start = time.perf_counter()
     try:
-        logging.info(f"Procesando hoja '{sheet_name}' para la tabla '{table_name}'...")
-        df = pd.read_excel(excel_path, sheet_name=sheet_name)
-        df.columns = df.columns.str.strip().str.lower()
-        df.rename(columns={'banco _consignacion': 'banco_consignacion'}, inplace=True)
-        
-        # Reemplazar NaN por None para compatibilidad con la base de datos
-        df = df.where(pd.notna(df), None)
-        
-        data = df.to_dict(orient='records')
-
-        if not data:
-            logging.warning(f"No hay datos para importar en la hoja '{sheet_name}'.")
-            return
-
-        logging.info(f"Insertando {len(data)} registros en la tabla '{table_name}'...")
-        with engine.connect() as connection:
-            trans = connection.begin()
-            try:
-                # Limpiar la tabla antes de insertar
-                truncate_command = text(f'TRUNCATE TABLE "{table_name}" RESTART IDENTITY CASCADE;')
-                connection.execute(truncate_command)
-                
-                # Obtener la estructura de la tabla para insertar solo columnas válidas
-                from sqlalchemy import Table, MetaData
-                meta = MetaData()
-                meta.reflect(bind=connection)
-                table_obj = meta.tables[table_name]
-                
-                # Filtrar los datos para que solo contengan columnas que existen en la tabla
-                valid_data = []
-                for row in data:
-                    valid_row = {k: v for k, v in row.items() if k in table_obj.c}
-                    valid_data.append(valid_row)
-
-                if valid_data:
-                    # Inserción masiva
-                    connection.execute(table_obj.insert(), valid_data)
-                
-                trans.commit()
-                logging.info(f"¡Éxito! Datos de '{sheet_name}' importados a '{table_name}'.")
-            except Exception as e:
-                trans.rollback()
-                logging.error(f"FALLÓ la importación para '{sheet_name}'. Error: {e}")
+        with engine.begin() as connection:
+            rows = load_sheet(connection, _workbook(excel_path)[sheet], table)
     except Exception as e:
-        logging.error(f"FALLÓ la lectura de la hoja '{sheet_name}'. Error: {e}")
+        logging.error(f"FALLÓ la importación para '{sheet}'. Error: {e}")
+        return (sheet, table, 0, time.perf_counter() - start, str(e))
+    elapsed = time.perf_counter() - start
+    logging.info(f"'{sheet}' -> '{table}': {rows} filas en {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} filas/s)")
+    return (sheet, table, rows, elapsed, None)
+
+def run_import(excel_path, workers=IMPORT_WORKERS):
+    """Carga todas las hojas del libro; devuelve el resumen `[(hoja, tabla, filas, segundos, error)]`.
+
+    Todas las hojas se cargan a la vez, en un pool de procesos, en tablas de
+    carga. Solo si todas se cargaron sus filas reemplazan las de las tablas
+    reales, en una única transacción (`publish` y `finalize`); si alguna
+    hoja falla la base queda como estaba.
+    """
+    migrations.upgrade(engine)
+    # El proceso principal no se queda con el libro abierto: los procesos hijos
+    # heredarían el mismo descriptor de archivo y se moverían el offset entre sí
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    sheet_names = set(workbook.sheetnames)
+    workbook.close()
+    sheets = {}
+    for sheet, table in SHEET_TO_TABLE_MAP.items():
+        if sheet in sheet_names:
+            sheets[table] = sheet
+        else:
+            logging.warning(f"No existe la hoja '{sheet}' en el libro.")
+    if not sheets:
+        return []
+
+    with engine.begin() as connection:
+        # Reflejar antes de crear el pool para que los procesos hereden el esquema
+        table_schema(connection, next(iter(sheets)))
+        order, cascaded = build_plan(connection, list(sheets))
+        create_staging(connection, order)
 
-# --- 5. Ejecución del Script ---
+    try:
+        workers = max(1, min(workers, len(sheets)))
+        logging.info(f"Cargando {len(sheets)} hoja(s) con {workers} proceso(s).")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(load_task, excel_path, sheets[table], table) for table in order]
+            summary = [future.result() for future in futures]
+
+        failed = [sheet for sheet, _, _, _, error in summary if error]
+        if failed:
+            logging.error(f"Fallaron {len(failed)} hoja(s) ({', '.join(failed)}): no se modificó ninguna tabla.")
+            return summary
+        with engine.begin() as connection:
+            publish(connection, order, cascaded)
+            finalize(connection, order)
+        return summary
+    finally:
+        with engine.begin() as connection:
+            drop_staging(connection, order)
+
+def log_summary(summary, elapsed):
+    total_rows = sum(rows for _, _, rows, _, _ in summary)
+    logging.info("--- RESUMEN ---")
+    for sheet, table, rows, seconds, error in summary:
+        if error:
+            logging.info(f"{sheet:<24} {table:<24} FALLÓ: {error}")
+        else:
+            logging.info(f"{sheet:<24} {table:<24} {rows:>9} filas {seconds:8.2f}s {rows / max(seconds, 1e-9):>12,.0f} filas/s")
+    logging.info(f"Total: {total_rows} filas en {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} filas/s)")
+
+# --- 9. Ejecución del Script ---
 if __name__ == "__main__":
     EXCEL_FILE_NAME = 'datos.xlsx' # El nombre de tu archivo Excel
-    
-    # --- Creación de Tablas ---
-    # Se crea una aplicación Flask temporal solo para usar su contexto y crear las tablas.
-    temp_app = Flask(__name__)
-    temp_app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-    temp_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    db.init_app(temp_app)
-
-    with temp_app.app_context():
-        logging.info("Verificando y creando tablas de la base de datos si es necesario...")
-        db.create_all()
-        logging.info("Tablas listas.")
-    # --- Fin de Creación de Tablas ---
 
     if not os.path.exists(EXCEL_FILE_NAME):
         logging.error(f"El archivo '{EXCEL_FILE_NAME}' no fue encontrado en esta carpeta.")
     else:
         logging.info("--- INICIANDO SCRIPT DE MIGRACIÓN DE DATOS DESDE EXCEL ---")
-        for sheet, table in SHEET_TO_TABLE_MAP.items():
-            try:
-                import_sheet_to_table(EXCEL_FILE_NAME, sheet, table)
-            except Exception as e:
-                 logging.warning(f"No se pudo procesar la hoja '{sheet}'. Error: {e}")
+        started = time.perf_counter()
+        results = run_import(EXCEL_FILE_NAME)
+        log_summary(results, time.perf_counter() - started)
         logging.info("--- SCRIPT DE MIGRACIÓN FINALIZADO ---")
-
@@ -0,0 +1,175 @@
+"""Libro de movimientos de los rollos de tela (`historial_telas`).
+
+Todo cambio de `llegada_telas.cantidad_value` (alta del rollo, consumo en un
+producto, reposición, salida manual, edición o borrado del rollo) agrega una
+fila al historial en la misma transacción, con la cantidad movida y el saldo
+del rollo después del movimiento. Lo hacen triggers por sentencia con tablas
+de transición: un UPDATE que toca cientos de rollos (p. ej. un lote de
+productos) agrega todos sus movimientos con un único INSERT ... SELECT. El
+historial es de solo agregar; UPDATE y DELETE sobre él fallan.
+
+Como en la vista de Inventario de Telas, `quantity_change` es la cantidad sin
+signo y el tipo indica la dirección (Ingreso / Salida / Reversión). El tipo y
+el detalle salen de `SET LOCAL damar.movement_reason` / `damar.movement_details`
+si la transacción los definió (ver `set_reason`); si no, se deducen de la
+operación.
+
+Los puntos de control (`checkpoint`) agregan una fila de tipo 'Saldo' con el
+saldo actual de cada rollo cuyo último saldo registrado falta o no coincide
+(rollos anteriores al libro o cargados por import_data.py, que desactiva los
+triggers). Con eso el stock de un rollo en una fecha es el saldo de su último
+movimiento hasta esa fecha: una sola lectura del índice (fabric_id, timestamp).
+"""
+from sqlalchemy import select, text
+
+from models import HistorialTela, LlegadaTela
+
+FUNCTION = 'damar_libro_telas'
+CHECKPOINT_TYPE = 'Saldo'
+
+_LEDGER_COLUMNS = (
+    'timestamp, fabric_id, serial_rollo, type, quantity_change, balance, details, '
+    'tipo_de_tela, referencia_de_tela, proveedor'
+)
+
+
+def function_ddl():
+    history = HistorialTela.__tablename__
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION}() RETURNS trigger AS $$
+        DECLARE
+            motivo text := NULLIF(current_setting('damar.movement_reason', true), '');
+            detalle text := NULLIF(current_setting('damar.movement_details', true), '');
+        BEGIN
+            -- clock_timestamp(): se toma con el rollo ya bloqueado, así el orden por
+            -- fecha de los movimientos de un rollo es el orden en que ocurrieron
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO {history} ({_LEDGER_COLUMNS})
+                SELECT clock_timestamp(), n.id, n.serial_rollo, COALESCE(motivo, 'Ingreso'),
+                       COALESCE(n.cantidad_value, 0), COALESCE(n.cantidad_value, 0), detalle,
+                       n.tipo_de_tela, n.referencia_de_tela, n.proveedor
+                FROM nuevas n;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO {history} ({_LEDGER_COLUMNS})
+                SELECT clock_timestamp(), n.id, n.serial_rollo,
+                       COALESCE(motivo, CASE WHEN c.delta > 0 THEN 'Ingreso (ajuste)' ELSE 'Salida (ajuste)' END),
+                       abs(c.delta), COALESCE(n.cantidad_value, 0), detalle,
+                       n.tipo_de_tela, n.referencia_de_tela, n.proveedor
+                FROM nuevas n
+                JOIN anteriores a ON a.id = n.id
+                CROSS JOIN LATERAL (
+                    SELECT COALESCE(n.cantidad_value, 0) - COALESCE(a.cantidad_value, 0) AS delta
+                ) c
+                WHERE c.delta <> 0;
+            ELSE
+                INSERT INTO {history} ({_LEDGER_COLUMNS})
+                SELECT clock_timestamp(), a.id, a.serial_rollo, COALESCE(motivo, 'Salida (rollo eliminado)'),
+                       abs(a.cantidad_value), 0, detalle,
+                       a.tipo_de_tela, a.referencia_de_tela, a.proveedor
+                FROM anteriores a
+                WHERE COALESCE(a.cantidad_value, 0) <> 0;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION}_solo_agregar() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION USING MESSAGE = 'El historial de telas es de solo agregar (' || TG_OP || ' no permitido)';
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ]
+
+
+def trigger_ddl():
+    """Sentencias que crean (o reemplazan) los triggers del libro."""
+    fabrics = LlegadaTela.__tablename__
+    history = HistorialTela.__tablename__
+    # Una tabla de transición solo se admite en triggers de un único evento
+    triggers = [
+        ('alta', 'INSERT', 'NEW TABLE AS nuevas'),
+        ('cambio', 'UPDATE', 'OLD TABLE AS anteriores NEW TABLE AS nuevas'),
+        ('baja', 'DELETE', 'OLD TABLE AS anteriores'),
+    ]
+    statements = []
+    for suffix, event, referencing in triggers:
+        statements += [
+            f"DROP TRIGGER IF EXISTS {FUNCTION}_{suffix} ON {fabrics};",
+            f"""
+            CREATE TRIGGER {FUNCTION}_{suffix}
+            AFTER {event} ON {fabrics} REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}();
+            """,
+        ]
+    statements += [
+        f"DROP TRIGGER IF EXISTS {FUNCTION}_solo_agregar ON {history};",
+        f"""
+        CREATE TRIGGER {FUNCTION}_solo_agregar
+        BEFORE UPDATE OR DELETE ON {history}
+        FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}_solo_agregar();
+        """,
+    ]
+    return statements
+
+
+def install(connection):
+    """Agrega la columna de saldo y crea las funciones y los triggers del libro."""
+    connection.exec_driver_sql(
+        f"ALTER TABLE {HistorialTela.__tablename__} ADD COLUMN IF NOT EXISTS balance DOUBLE PRECISION"
+    )
+    # El DDL no lleva el carácter de porcentaje: psycopg2 lo tomaría como marcador de parámetro
+    for statement in function_ddl() + trigger_ddl():
+        connection.exec_driver_sql(statement)
+
+
+def set_reason(session, reason, details=None):
+    """Tipo y detalle de los movimientos de tela que siga escribiendo la transacción actual.
+
+    `details` puede venir del cliente con cualquier tipo JSON: se guarda como texto.
+    """
+    session.execute(
+        text("SELECT set_config('damar.movement_reason', :reason, true), "
+             "set_config('damar.movement_details', :details, true)"),
+        {'reason': reason, 'details': ('' if details is None else str(details))[:1000]}
+    )
+
+
+def checkpoint(connection):
+    """Registra el saldo actual de los rollos sin saldo en el historial o con un saldo distinto.
+
+    Bloquea las escrituras sobre los rollos mientras dura, para que ningún
+    movimiento quede entre la lectura del saldo y el punto de control.
+    Devuelve los IDs de los rollos registrados.
+    """
+    fabrics = LlegadaTela.__tablename__
+    history = HistorialTela.__tablename__
+    connection.exec_driver_sql(f"LOCK TABLE {fabrics} IN SHARE MODE")
+    result = connection.execute(text(f"""
+        INSERT INTO {history} ({_LEDGER_COLUMNS})
+        SELECT clock_timestamp(), t.id, t.serial_rollo, :type, 0, COALESCE(t.cantidad_value, 0), NULL,
+               t.tipo_de_tela, t.referencia_de_tela, t.proveedor
+        FROM {fabrics} t
+        LEFT JOIN LATERAL (
+            SELECT h.balance FROM {history} h
+            WHERE h.fabric_id = t.id AND h.balance IS NOT NULL
+            ORDER BY h.timestamp DESC, h.id DESC
+            LIMIT 1
+        ) ultimo ON true
+        WHERE ultimo.balance IS DISTINCT FROM COALESCE(t.cantidad_value, 0)
+        RETURNING fabric_id
+    """), {'type': CHECKPOINT_TYPE})
+    return sorted(row[0] for row in result)
+
+
+def balance_query(fabric_id, at=None):
+    """Último movimiento con saldo del rollo hasta `at` (excluido); sin `at`, el último registrado."""
+    bound = HistorialTela.timestamp.isnot(None) if at is None else HistorialTela.timestamp < at
+    return (
+        select(HistorialTela.id, HistorialTela.timestamp, HistorialTela.balance)
+        .where(HistorialTela.fabric_id == fabric_id, bound, HistorialTela.balance.isnot(None))
+        .order_by(HistorialTela.timestamp.desc(), HistorialTela.id.desc())
+        .limit(1)
+    )
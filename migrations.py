@@ -0,0 +1,311 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada migración es una función `(connection) -> None` con un número de versión;
+las aplicadas quedan registradas en `schema_migrations`. `upgrade` aplica las
+pendientes en orden, cada una en su propia transacción y bajo un candado
+consultivo para que varios procesos puedan llamarla a la vez sin pisarse. Las
+migraciones son idempotentes (IF NOT EXISTS) porque la migración base crea las
+tablas a partir de los modelos actuales.
+
+También contiene las comprobaciones EXPLAIN que verifican que las consultas
+frecuentes de app.py siguen usando sus índices.
+"""
+import datetime
+import json
+import logging
+
+from sqlalchemy import create_engine, select, func, text, tuple_
+from sqlalchemy.pool import NullPool
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+import aggregates
+import filters
+import ledger
+import sales
+import sync
+import usage
+import versions
+from models import (
+    db, HistorialTela, ProveedorHistorial, DynamicCode, Venta, AsignacionSatelite,
+    ProgramacionCorte, LlegadaMaterial, LlegadaTela, EntregaSatelite, PagoSatelite, VentaLinea,
+    ProductoTerminado,
+)
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_ID_SEQUENCE = 'productos_terminados_id_seq'
+
+
+# --- Utilidades para las migraciones ---
+def create_indexes(connection, names):
+    """Crea (si no existen) los índices declarados en models.py con esos nombres."""
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        connection.execute(CreateIndex(indexes[name], if_not_exists=True))
+
+
+def sync_product_id_sequence(connection):
+    """Alinea la secuencia de IDs de productos con los IDs existentes."""
+    connection.exec_driver_sql(f"CREATE SEQUENCE IF NOT EXISTS {PRODUCT_ID_SEQUENCE} OWNED BY productos_terminados.id")
+    connection.exec_driver_sql(
+        f"SELECT setval('{PRODUCT_ID_SEQUENCE}', GREATEST("
+        f"(SELECT COALESCE(MAX(id), 0) FROM productos_terminados), (SELECT last_value FROM {PRODUCT_ID_SEQUENCE})))"
+    )
+    connection.exec_driver_sql(
+        f"ALTER TABLE productos_terminados ALTER COLUMN id SET DEFAULT nextval('{PRODUCT_ID_SEQUENCE}'::regclass)"
+    )
+
+
+# --- Migraciones ---
+def m0001_esquema_base(connection):
+    db.metadata.create_all(bind=connection, checkfirst=True)
+
+
+def m0002_secuencia_ids_productos(connection):
+    sync_product_id_sequence(connection)
+
+
+def m0003_agregados_dashboard(connection):
+    aggregates.install(connection)
+    aggregates.rebuild(connection)
+
+
+def m0004_indices_consultas_frecuentes(connection):
+    create_indexes(connection, [
+        'ix_dynamic_codes_type_category',
+        'ix_historial_telas_timestamp_id',
+        'ix_historial_telas_fabric_id',
+        'ix_proveedores_historial_timestamp_id',
+        'ix_ventas_sale_date',
+        'ix_asignaciones_satelites_status',
+        'ix_asignaciones_satelites_satellite_name',
+        'ix_programacion_cortes_status',
+        'ix_llegada_material_barcode',
+        'ix_llegada_material_identidad',
+        'ix_llegada_telas_barcode',
+        'ix_entregas_satelites_satellite_name',
+        'ix_pagos_satelites_satellite_name',
+    ])
+
+
+def m0005_versiones_tablas(connection):
+    versions.install(connection)
+
+
+def m0006_sincronizacion_incremental(connection):
+    sync.install(connection)
+
+
+def m0007_libro_movimientos_telas(connection):
+    ledger.install(connection)
+    create_indexes(connection, ['ix_historial_telas_rollo_timestamp'])
+    ledger.checkpoint(connection)
+
+
+def m0008_saldos_material(connection):
+    db.metadata.tables['saldos_material'].create(bind=connection, checkfirst=True)
+    aggregates.install(connection)
+    aggregates.rebuild(connection, ['saldos_material'])
+    versions.install(connection)
+
+
+def m0009_tablas_uso_productos(connection):
+    for name in ('producto_materiales', 'producto_telas'):
+        db.metadata.tables[name].create(bind=connection, checkfirst=True)
+    processed, skipped = usage.backfill(connection)
+    logger.info(f"Consumos de {processed} producto(s) copiados a las tablas de uso; {len(skipped)} omitido(s).")
+    versions.install(connection)
+
+
+def m0010_lineas_venta(connection):
+    db.metadata.tables['venta_lineas'].create(bind=connection, checkfirst=True)
+    processed, skipped = sales.backfill(connection)
+    logger.info(f"Líneas de {processed} venta(s) copiadas a venta_lineas; {len(skipped)} omitida(s).")
+    versions.install(connection)
+
+
+def m0011_busqueda_trigramas(connection):
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for model in filters.SEARCH_COLUMNS:
+        connection.exec_driver_sql(filters.search_index_ddl(model))
+
+
+def m0012_resumenes_por_sentencia(connection):
+    # Reemplaza los triggers por fila de los resúmenes por triggers por sentencia
+    aggregates.install(connection)
+
+
+def m0013_cambios_por_transaccion(connection):
+    # Las versiones pasan de una fila por tabla (bloqueada por cada escritor
+    # hasta su commit) a una fila por tabla y transacción en table_changes
+    versions.install(connection)
+    connection.exec_driver_sql("DROP TABLE IF EXISTS table_versions")
+
+
+MIGRATIONS = [
+    (1, 'esquema_base', m0001_esquema_base),
+    (2, 'secuencia_ids_productos', m0002_secuencia_ids_productos),
+    (3, 'agregados_dashboard', m0003_agregados_dashboard),
+    (4, 'indices_consultas_frecuentes', m0004_indices_consultas_frecuentes),
+    (5, 'versiones_tablas', m0005_versiones_tablas),
+    (6, 'sincronizacion_incremental', m0006_sincronizacion_incremental),
+    (7, 'libro_movimientos_telas', m0007_libro_movimientos_telas),
+    (8, 'saldos_material', m0008_saldos_material),
+    (9, 'tablas_uso_productos', m0009_tablas_uso_productos),
+    (10, 'lineas_venta', m0010_lineas_venta),
+    (11, 'busqueda_trigramas', m0011_busqueda_trigramas),
+    (12, 'resumenes_por_sentencia', m0012_resumenes_por_sentencia),
+    (13, 'cambios_por_transaccion', m0013_cambios_por_transaccion),
+]
+
+
+# --- Ejecución ---
+def _ensure_version_table(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(150) NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        )
+
+
+def applied_versions(connection):
+    return {row[0] for row in connection.exec_driver_sql("SELECT version FROM schema_migrations")}
+
+
+def pending_migrations(engine):
+    """Lista `(versión, nombre)` de las migraciones aún no aplicadas."""
+    _ensure_version_table(engine)
+    with engine.connect() as connection:
+        applied = applied_versions(connection)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def upgrade(engine, target=None):
+    """Aplica las migraciones pendientes hasta `target` (todas si es None). Devuelve las aplicadas."""
+    _ensure_version_table(engine)
+    applied_now = []
+    for version, name, migrate in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with engine.begin() as connection:
+            # Las migraciones pueden tardar más que el statement_timeout de las peticiones
+            connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('damar_migrations'))"))
+            if version in applied_versions(connection):
+                continue
+            logger.info(f"Aplicando migración {version:04d}_{name}...")
+            migrate(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {'version': version, 'name': name}
+            )
+            applied_now.append((version, name))
+    return applied_now
+
+
+def upgrade_from_url(database_url, target=None):
+    """Aplica las migraciones con un engine propio, sin la app Flask (p. ej. desde gunicorn)."""
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    engine = create_engine(database_url, poolclass=NullPool)
+    try:
+        return upgrade(engine, target)
+    finally:
+        engine.dispose()
+
+
+# --- Comprobaciones EXPLAIN de índices ---
+# Cada consulta frecuente de app.py se explica con los escaneos secuenciales
+# desactivados: si el planificador aun así no puede usar el índice esperado,
+# la consulta dejó de estar cubierta por él.
+def hot_queries():
+    """Lista `(nombre, sentencia, índice esperado)` de las consultas a verificar."""
+    return [
+        ('dynamic_codes por tipo y categoría',
+         select(DynamicCode).where(DynamicCode.type == 'reference', DynamicCode.category == 'products'),
+         'ix_dynamic_codes_type_category'),
+        ('historial de telas por cursor',
+         select(HistorialTela).order_by(HistorialTela.timestamp.desc().nullslast(), HistorialTela.id.desc()).limit(500),
+         'ix_historial_telas_timestamp_id'),
+        ('historial de telas, página profunda',
+         select(HistorialTela)
+         .where(tuple_(HistorialTela.timestamp, HistorialTela.id) < tuple_(datetime.datetime(2024, 1, 1), 1000))
+         .order_by(HistorialTela.timestamp.desc().nullslast(), HistorialTela.id.desc()).limit(500),
+         'ix_historial_telas_timestamp_id'),
+        ('saldo de un rollo a una fecha',
+         ledger.balance_query(1, func.date('2024-01-01')),
+         'ix_historial_telas_rollo_timestamp'),
+        ('productos que usaron un rollo',
+         usage.consumers_query('fabrics_used', 1),
+         'ix_producto_telas_fabric_id'),
+        ('historial de proveedores por cursor',
+         select(ProveedorHistorial).order_by(ProveedorHistorial.timestamp.desc().nullslast(), ProveedorHistorial.id.desc()).limit(500),
+         'ix_proveedores_historial_timestamp_id'),
+        ('ventas por rango de fechas',
+         select(Venta).where(Venta.sale_date >= func.date('2024-01-01'), Venta.sale_date < func.date('2024-02-01')),
+         'ix_ventas_sale_date'),
+        ('ventas de un producto por fecha',
+         select(func.sum(VentaLinea.quantity)).where(VentaLinea.product_id == 1, VentaLinea.sale_date >= func.date('2024-01-01')),
+         'ix_venta_lineas_producto_fecha'),
+        ('asignaciones por estado',
+         select(func.sum(AsignacionSatelite.total_price)).where(AsignacionSatelite.status == 'Asignado'),
+         'ix_asignaciones_satelites_status'),
+        ('asignaciones por satélite',
+         select(AsignacionSatelite).where(AsignacionSatelite.satellite_name == 'Satélite'),
+         'ix_asignaciones_satelites_satellite_name'),
+        ('cortes por estado',
+         select(func.count(ProgramacionCorte.id)).where(ProgramacionCorte.status == 'Pendiente'),
+         'ix_programacion_cortes_status'),
+        ('búsqueda de productos por texto',
+         select(ProductoTerminado).where(filters.search_condition(ProductoTerminado, 'REF-001')),
+         filters.search_index_name(ProductoTerminado)),
+        ('materiales por código de barras',
+         select(LlegadaMaterial).where(LlegadaMaterial.barcode == '7700000000000'),
+         'ix_llegada_material_barcode'),
+        ('telas por código de barras',
+         select(LlegadaTela).where(LlegadaTela.barcode == '7700000000000'),
+         'ix_llegada_telas_barcode'),
+        ('entregas por satélite',
+         select(EntregaSatelite).where(EntregaSatelite.satellite_name == 'Satélite'),
+         'ix_entregas_satelites_satellite_name'),
+        ('pagos por satélite',
+         select(PagoSatelite).where(PagoSatelite.satellite_name == 'Satélite'),
+         'ix_pagos_satelites_satellite_name'),
+    ]
+
+
+def _plan_indexes(plan):
+    names = set()
+    if isinstance(plan, dict):
+        if 'Index Name' in plan:
+            names.add(plan['Index Name'])
+        for value in plan.values():
+            names |= _plan_indexes(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            names |= _plan_indexes(value)
+    return names
+
+
+def check_indexes(engine):
+    """Ejecuta EXPLAIN sobre las consultas frecuentes.
+
+    Devuelve una lista de `(nombre, índice esperado, índices usados)`, un
+    elemento por consulta; la comprobación falla si el esperado no está entre
+    los usados.
+    """
+    results = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for name, statement, expected in hot_queries():
+                compiled = statement.compile(dialect=postgresql.dialect())
+                row = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+                plan = json.loads(row) if isinstance(row, str) else row
+                results.append((name, expected, sorted(_plan_indexes(plan))))
+        finally:
+            transaction.rollback()
+    return results
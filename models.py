@@ -3,14 +3,21 @@ from sqlalchemy import Text, JSON
 
 db = SQLAlchemy()
 
-class Usuario(db.Model):
+# --- Sincronización incremental ---
+# Los modelos de datos registran cuándo y en qué transacción se escribió cada
+# fila; triggers BEFORE INSERT/UPDATE mantienen ambas columnas (ver sync.py).
+class Sincronizable:
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    updated_xid = db.Column(db.BigInteger, nullable=False, server_default='0', index=True)
+
+class Usuario(Sincronizable, db.Model):
     __tablename__ = 'usuarios'
     id = db.Column(db.Integer, primary_key=True)
     usuario = db.Column(db.String(80), unique=True, nullable=False)
     contraseña = db.Column(db.String(255), nullable=False)
     rol = db.Column(db.String(50))
 
-class Empleado(db.Model):
+class Empleado(Sincronizable, db.Model):
     __tablename__ = 'empleados'
     codigo_empleado = db.Column(db.String(50), primary_key=True)
     name = db.Column(db.String(150), nullable=False)
@@ -38,7 +45,7 @@ class Empleado(db.Model):
     emergencia2_telefono = db.Column(db.String(20))
     emergencia2_parentesco = db.Column(db.String(50))
 
-class Cliente(db.Model):
+class Cliente(Sincronizable, db.Model):
     __tablename__ = 'clientes'
     id = db.Column(db.Integer, primary_key=True)
     fecha = db.Column(db.Date)
@@ -47,7 +54,7 @@ class Cliente(db.Model):
     valor = db.Column(db.Float)
     abono = db.Column(db.Float)
 
-class Proveedor(db.Model):
+class Proveedor(Sincronizable, db.Model):
     __tablename__ = 'proveedores'
     id = db.Column(db.Integer, primary_key=True)
     fecha = db.Column(db.Date)
@@ -59,7 +66,7 @@ class Proveedor(db.Model):
     vencimiento = db.Column(db.Date)
     pdf_path = db.Column(db.String(255))
 
-class Banco(db.Model):
+class Banco(Sincronizable, db.Model):
     __tablename__ = 'bancos'
     id = db.Column(db.Integer, primary_key=True)
     fecha = db.Column(db.Date)
@@ -72,11 +79,14 @@ class Banco(db.Model):
     descripcion = db.Column(Text)
     fecha_registro = db.Column(db.DateTime)
 
-class LlegadaMaterial(db.Model):
+class LlegadaMaterial(Sincronizable, db.Model):
     __tablename__ = 'llegada_material'
+    __table_args__ = (
+        db.Index('ix_llegada_material_identidad', 'material_name', 'size_value', 'size_unit', 'quantity_type'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     entry_date = db.Column(db.Date)
-    barcode = db.Column(db.String(150))
+    barcode = db.Column(db.String(150), index=True)
     material_name = db.Column(db.String(150))
     size_value = db.Column(db.String(50))
     size_unit = db.Column(db.String(50))
@@ -87,13 +97,13 @@ class LlegadaMaterial(db.Model):
     unit_value = db.Column(db.Float)
     image_path = db.Column(db.String(255))
 
-class LlegadaTela(db.Model):
+class LlegadaTela(Sincronizable, db.Model):
     __tablename__ = 'llegada_telas'
     id = db.Column(db.Integer, primary_key=True)
     entry_date = db.Column(db.Date)
     invoice_number = db.Column(db.String(100))
     serial_rollo = db.Column(db.String(100), unique=True)
-    barcode = db.Column(db.String(150))
+    barcode = db.Column(db.String(150), index=True)
     tipo_de_tela = db.Column(db.String(150))
     referencia_de_tela = db.Column(db.String(150))
     proveedor = db.Column(db.String(150))
@@ -107,25 +117,26 @@ class LlegadaTela(db.Model):
     qr_image_path = db.Column(db.String(255))
     pdf_path = db.Column(db.String(255))
 
-class HistorialTela(db.Model):
+class HistorialTela(Sincronizable, db.Model):
     __tablename__ = 'historial_telas'
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime)
-    fabric_id = db.Column(db.Integer)
+    fabric_id = db.Column(db.Integer, index=True)
     serial_rollo = db.Column(db.String(100))
     type = db.Column(db.String(50))
     quantity_change = db.Column(db.Float)
+    # Saldo del rollo después del movimiento (lo escriben los triggers de ledger.py)
+    balance = db.Column(db.Float)
     details = db.Column(Text)
     # Campos adicionales para consistencia de datos en historial
     tipo_de_tela = db.Column(db.String(150))
     referencia_de_tela = db.Column(db.String(150))
     proveedor = db.Column(db.String(150))
 
-class ProductoTerminado(db.Model):
+class ProductoTerminado(Sincronizable, db.Model):
     __tablename__ = 'productos_terminados'
-    # --- INICIO DE LA CORRECCIÓN CRÍTICA ---
-    id = db.Column(db.Integer, primary_key=True)
-    # --- FIN DE LA CORRECCIÓN CRÍTICA ---
+    # Los IDs salen de una secuencia real de la base de datos (ver app.reserve_product_ids)
+    id = db.Column(db.Integer, db.Sequence('productos_terminados_id_seq'), primary_key=True)
     lote = db.Column(db.String(100))
     fecha = db.Column(db.Date)
     referencia = db.Column(db.String(150))
@@ -146,7 +157,25 @@ class ProductoTerminado(db.Model):
     has_sample = db.Column(db.Boolean)
     sample_code = db.Column(db.String(100))
 
-class ProgramacionCorte(db.Model):
+# --- Consumo de insumos por producto ---
+# Una fila por elemento de `materials_used` / `fabrics_used` (ver usage.py). Los
+# IDs de material y de rollo no son llaves foráneas: los insumos se pueden
+# borrar y el consumo del producto se conserva.
+class ProductoMaterial(db.Model):
+    __tablename__ = 'producto_materiales'
+    product_id = db.Column(db.Integer, db.ForeignKey('productos_terminados.id', ondelete='CASCADE'), primary_key=True)
+    posicion = db.Column(db.Integer, primary_key=True)
+    material_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity_used = db.Column(db.Float, nullable=False, server_default='0')
+
+class ProductoTela(db.Model):
+    __tablename__ = 'producto_telas'
+    product_id = db.Column(db.Integer, db.ForeignKey('productos_terminados.id', ondelete='CASCADE'), primary_key=True)
+    posicion = db.Column(db.Integer, primary_key=True)
+    fabric_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity_used = db.Column(db.Float, nullable=False, server_default='0')
+
+class ProgramacionCorte(Sincronizable, db.Model):
     __tablename__ = 'programacion_cortes'
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date)
@@ -155,37 +184,37 @@ class ProgramacionCorte(db.Model):
     colors = db.Column(db.String(255))
     size = db.Column(db.String(50))
     distribute_to = db.Column(db.String(150))
-    status = db.Column(db.String(50))
+    status = db.Column(db.String(50), index=True)
     terminado = db.Column(db.Float)
     restantes = db.Column(db.Float)
 
-class AsignacionSatelite(db.Model):
+class AsignacionSatelite(Sincronizable, db.Model):
     __tablename__ = 'asignaciones_satelites'
     id = db.Column(db.Integer, primary_key=True)
     assignment_date = db.Column(db.Date)
-    satellite_name = db.Column(db.String(150))
+    satellite_name = db.Column(db.String(150), index=True)
     product_lote = db.Column(db.String(100))
     assigned_quantity = db.Column(db.Float)
     unit_price = db.Column(db.Float)
     total_price = db.Column(db.Float)
-    status = db.Column(db.String(50))
+    status = db.Column(db.String(50), index=True)
     has_sample = db.Column(db.Boolean)
     sample_code = db.Column(db.String(100))
 
-class EntregaSatelite(db.Model):
+class EntregaSatelite(Sincronizable, db.Model):
     __tablename__ = 'entregas_satelites'
     id = db.Column(db.Integer, primary_key=True)
     delivery_date = db.Column(db.Date)
     product_serial = db.Column(db.String(100))
     product_lote = db.Column(db.String(100))
     delivered_quantity = db.Column(db.Float)
-    satellite_name = db.Column(db.String(150))
+    satellite_name = db.Column(db.String(150), index=True)
 
-class PagoSatelite(db.Model):
+class PagoSatelite(Sincronizable, db.Model):
     __tablename__ = 'pagos_satelites'
     id = db.Column(db.Integer, primary_key=True)
     payment_date = db.Column(db.Date)
-    satellite_name = db.Column(db.String(150))
+    satellite_name = db.Column(db.String(150), index=True)
     payment_amount = db.Column(db.Float)
     payment_method = db.Column(db.String(50))
     details = db.Column(Text)
@@ -196,10 +225,10 @@ class PagoSatelite(db.Model):
     total_payment_amount = db.Column(db.Float)
     reference = db.Column(db.String(150))
 
-class Venta(db.Model):
+class Venta(Sincronizable, db.Model):
     __tablename__ = 'ventas'
     id = db.Column(db.Integer, primary_key=True)
-    sale_date = db.Column(db.Date)
+    sale_date = db.Column(db.Date, index=True)
     invoice_number = db.Column(db.String(100), unique=True)
     punto_venta = db.Column(db.String(100))
     products_sold = db.Column(JSON)
@@ -208,7 +237,27 @@ class Venta(db.Model):
     banco_consignacion = db.Column(db.String(100))
     total_sale = db.Column(db.Float)
 
-class ProveedorHistorial(db.Model):
+# --- Líneas de venta ---
+# Una fila por elemento de `Venta.products_sold` (ver sales.py). `referencia` y
+# `lote` se copian del producto al vender y `sale_date` de la venta, para
+# consultar ventas por producto, referencia, lote o fecha sin unir tablas
+# (y aunque el producto se borre después).
+class VentaLinea(db.Model):
+    __tablename__ = 'venta_lineas'
+    __table_args__ = (
+        db.Index('ix_venta_lineas_producto_fecha', 'product_id', 'sale_date'),
+        db.Index('ix_venta_lineas_referencia_fecha', 'referencia', 'sale_date'),
+    )
+    venta_id = db.Column(db.Integer, db.ForeignKey('ventas.id', ondelete='CASCADE'), primary_key=True)
+    posicion = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    referencia = db.Column(db.String(150))
+    lote = db.Column(db.String(100))
+    sale_date = db.Column(db.Date, index=True)
+    quantity = db.Column(db.Float, nullable=False, server_default='0')
+    price = db.Column(db.Float)
+
+class ProveedorHistorial(Sincronizable, db.Model):
     __tablename__ = 'proveedores_historial'
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime)
@@ -217,8 +266,9 @@ class ProveedorHistorial(db.Model):
     type = db.Column(db.String(50))
     details = db.Column(Text)
 
-class DynamicCode(db.Model):
+class DynamicCode(Sincronizable, db.Model):
     __tablename__ = 'dynamic_codes'
+    __table_args__ = (db.Index('ix_dynamic_codes_type_category', 'type', 'category'),)
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50)) # 'reference' or 'barcode'
     category = db.Column(db.String(50)) # 'products', 'fabrics', 'materials'
@@ -226,3 +276,78 @@ class DynamicCode(db.Model):
     description = db.Column(Text)
     costo_venta = db.Column(db.Float)
     costo_confeccion = db.Column(db.Float)
+
+# --- Índices de las consultas por cursor de los historiales ---
+# Coinciden con el orden de la paginación (timestamp DESC NULLS LAST, id DESC).
+db.Index('ix_historial_telas_timestamp_id', HistorialTela.timestamp.desc().nullslast(), HistorialTela.id.desc())
+db.Index('ix_proveedores_historial_timestamp_id', ProveedorHistorial.timestamp.desc().nullslast(), ProveedorHistorial.id.desc())
+# Movimientos de un rollo en orden: historial por rollo y saldo a una fecha.
+db.Index('ix_historial_telas_rollo_timestamp', HistorialTela.fabric_id, HistorialTela.timestamp, HistorialTela.id)
+
+# --- Tablas de resumen del Dashboard ---
+# Se mantienen de forma incremental con triggers (ver aggregates.py). La clave
+# vacía ('') agrupa los registros sin valor; `filas` cuenta los registros de
+# origen para ocultar los grupos que quedaron vacíos.
+class ResumenVentasMes(db.Model):
+    __tablename__ = 'resumen_ventas_mes'
+    mes = db.Column(db.String(7), primary_key=True)
+    total = db.Column(db.Float, nullable=False, server_default='0')
+    filas = db.Column(db.Integer, nullable=False, server_default='0')
+
+class ResumenSatelite(db.Model):
+    __tablename__ = 'resumen_satelites'
+    satellite_name = db.Column(db.String(150), primary_key=True)
+    total = db.Column(db.Float, nullable=False, server_default='0')
+    filas = db.Column(db.Integer, nullable=False, server_default='0')
+
+class ResumenTipoTela(db.Model):
+    __tablename__ = 'resumen_tipos_tela'
+    tipo_de_tela = db.Column(db.String(150), primary_key=True)
+    total = db.Column(db.Float, nullable=False, server_default='0')
+    filas = db.Column(db.Integer, nullable=False, server_default='0')
+
+class ResumenProveedor(db.Model):
+    __tablename__ = 'resumen_proveedores'
+    proveedor = db.Column(db.String(150), primary_key=True)
+    total_telas = db.Column(db.Float, nullable=False, server_default='0')
+    filas_telas = db.Column(db.Integer, nullable=False, server_default='0')
+    total_materiales = db.Column(db.Float, nullable=False, server_default='0')
+    filas_materiales = db.Column(db.Integer, nullable=False, server_default='0')
+
+# --- Saldos de materiales ---
+# Stock total por identidad de material (nombre, medida, unidad de medida y
+# unidad de cantidad); lo mantienen los triggers de aggregates.py en cada
+# llegada, consumo o reposición y alimenta /inventory/summary.
+class SaldoMaterial(db.Model):
+    __tablename__ = 'saldos_material'
+    material_name = db.Column(db.String(150), primary_key=True)
+    size_value = db.Column(db.String(50), primary_key=True)
+    size_unit = db.Column(db.String(50), primary_key=True)
+    quantity_type = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Float, nullable=False, server_default='0')
+    filas = db.Column(db.Integer, nullable=False, server_default='0')
+
+# --- Cambios de las tablas ---
+# Una fila por tabla y por transacción que la escribió; las agregan triggers por
+# sentencia (ver versions.py) y de ellas sale la versión que alimenta los ETag
+# de las rutas de colecciones.
+class CambioTabla(db.Model):
+    __tablename__ = 'table_changes'
+    id = db.Column(db.BigInteger, primary_key=True)
+    table_name = db.Column(db.String(100), nullable=False)
+    xid = db.Column(db.BigInteger, nullable=False)
+    __table_args__ = (
+        db.Index('ix_table_changes_tabla_xid', 'table_name', 'xid', unique=True, postgresql_include=['id']),
+    )
+
+# --- Registros eliminados ---
+# Lápidas de las filas borradas para el feed `?since=`; `record_id` NULL marca
+# un TRUNCATE o una poda del historial (el cliente debe recargar la tabla).
+class RegistroEliminado(db.Model):
+    __tablename__ = 'registros_eliminados'
+    id = db.Column(db.BigInteger, primary_key=True)
+    table_name = db.Column(db.String(100), nullable=False)
+    record_id = db.Column(db.String(100))
+    deleted_xid = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    __table_args__ = (db.Index('ix_registros_eliminados_tabla_xid', 'table_name', 'deleted_xid'),)
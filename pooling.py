@@ -0,0 +1,59 @@
+"""Pool de conexiones instrumentado.
+
+`InstrumentedQueuePool` es un `QueuePool` que mide cuánto espera cada petición
+para obtener una conexión; junto con los contadores del propio pool permite
+dimensionar el pool por worker y el `max_connections` de PostgreSQL (ver
+`/api/pool-stats` y gunicorn.conf.py).
+"""
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'waited': 0}
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self._stats['timeouts'] += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['wait_total'] += waited
+            # Menos de 1 ms es tomar una conexión libre; no cuenta como espera
+            if waited >= 0.001:
+                stats['waited'] += 1
+            if waited > stats['wait_max']:
+                stats['wait_max'] = waited
+        return connection
+
+    def stats(self):
+        """Estado actual del pool y tiempos de espera acumulados desde el arranque del proceso."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats['checkouts']
+        return {
+            'pool_size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'max_overflow': self._max_overflow,
+            'timeout_s': self._timeout,
+            'checkouts': checkouts,
+            'checkouts_waited': stats['waited'],
+            'timeouts': stats['timeouts'],
+            'wait_avg_ms': round(stats['wait_total'] / checkouts * 1000, 3) if checkouts else 0.0,
+            'wait_max_ms': round(stats['wait_max'] * 1000, 3),
+        }
@@ -0,0 +1,125 @@
+"""Líneas de venta normalizadas (`venta_lineas`).
+
+`Venta.products_sold` conserva la lista tal como la envió el cliente (la API la
+devuelve igual) y cada elemento queda además como una fila de `venta_lineas`,
+escrita en la misma transacción que la venta, con la referencia y el lote del
+producto y la fecha de la venta. Las ventas por producto, referencia, lote o
+período (y sus márgenes, uniendo con los costos del producto) son consultas
+indexadas sobre esa tabla, sin leer ni interpretar cada venta.
+"""
+import json
+import logging
+
+from sqlalchemy import bindparam, delete, func, select
+
+from models import ProductoTerminado, Venta, VentaLinea
+
+logger = logging.getLogger(__name__)
+
+# Agrupaciones del reporte de ventas: parámetro `group` -> columna de venta_lineas
+GROUPS = {
+    'product': VentaLinea.product_id,
+    'referencia': VentaLinea.referencia,
+    'lote': VentaLinea.lote,
+}
+
+
+def parse_items(value):
+    """Valida los productos vendidos (`[{id, quantity, price}]`, o su JSON) con IDs y cantidades numéricos."""
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ValueError('Se esperaba una lista de productos vendidos.')
+    return [{
+        **item,
+        'id': int(item['id']),
+        'quantity': float(item['quantity']),
+        'price': float(item['price']) if item.get('price') not in (None, '') else None,
+    } for item in value]
+
+
+def insert(session, sales):
+    """Agrega las líneas de ventas nuevas con un INSERT.
+
+    `sales` es `[(venta_id, sale_date, items)]` con items validados por
+    `parse_items`; la referencia y el lote se leen de los productos en una
+    sola consulta (los productos que ya no existen quedan sin ellos).
+    """
+    product_ids = {item['id'] for _, _, items in sales for item in items}
+    if not product_ids:
+        return
+    products = {
+        row.id: row for row in session.execute(
+            select(ProductoTerminado.id, ProductoTerminado.referencia, ProductoTerminado.lote)
+            .where(ProductoTerminado.id.in_(list(product_ids)))
+        )
+    }
+    rows = []
+    for venta_id, sale_date, items in sales:
+        for index, item in enumerate(items):
+            product = products.get(item['id'])
+            rows.append({
+                'venta_id': venta_id, 'posicion': index, 'product_id': item['id'],
+                'referencia': product.referencia if product else None, 'lote': product.lote if product else None,
+                'sale_date': sale_date, 'quantity': item['quantity'], 'price': item['price'],
+            })
+    session.execute(VentaLinea.__table__.insert(), rows)
+
+
+def report_query(group, date_from=None, date_to=None):
+    """Unidades e ingresos por `group` (ver GROUPS) entre dos fechas de venta (inclusive)."""
+    key = GROUPS[group]
+    revenue = func.sum(VentaLinea.quantity * func.coalesce(VentaLinea.price, 0))
+    query = (
+        select(
+            key.label('key'), func.sum(VentaLinea.quantity).label('quantity'), revenue.label('revenue'),
+            func.count(func.distinct(VentaLinea.venta_id)).label('sales'),
+        )
+        .group_by(key)
+        .order_by(revenue.desc())
+    )
+    if date_from is not None:
+        query = query.where(VentaLinea.sale_date >= date_from)
+    if date_to is not None:
+        query = query.where(VentaLinea.sale_date <= date_to)
+    return query
+
+
+def _decoded(value):
+    if isinstance(value, str):
+        return json.loads(value) if value else None
+    return value
+
+
+def backfill(connection, batch_size=2000):
+    """Reconstruye `venta_lineas` desde `products_sold` de todas las ventas.
+
+    De paso guarda como listas JSON los `products_sold` que estaban guardados
+    como cadenas `json.dumps`. Las ventas mal formadas se omiten (se registran
+    en el log). Devuelve `(ventas procesadas, IDs omitidos)`.
+    """
+    connection.execute(delete(VentaLinea))
+    ventas = Venta.__table__
+    normalize = ventas.update().where(ventas.c.id == bindparam('vid')).values(products_sold=bindparam('sold'))
+    result = connection.execution_options(stream_results=True).execute(
+        select(ventas.c.id, ventas.c.sale_date, ventas.c.products_sold).order_by(ventas.c.id)
+    )
+    processed, skipped = 0, []
+    for partition in result.partitions(batch_size):
+        batch, legacy = [], []
+        for venta_id, sale_date, products_sold in partition:
+            try:
+                batch.append((venta_id, sale_date, parse_items(products_sold)))
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Productos vendidos mal formados en la venta ID {venta_id}; se omite: {e}")
+                skipped.append(venta_id)
+                continue
+            if isinstance(products_sold, str):
+                legacy.append({'vid': venta_id, 'sold': _decoded(products_sold)})
+        insert(connection, batch)
+        if legacy:
+            connection.execute(normalize, legacy)
+        processed += len(batch)
+    return processed, skipped
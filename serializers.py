@@ -0,0 +1,93 @@
+"""Serializadores precompilados por modelo.
+
+Cada serializador se construye una sola vez por modelo a partir de los tipos de
+sus columnas: las fechas salen como cadenas ISO, las columnas JSON se decodifican
+(la app históricamente guardaba en ellas cadenas `json.dumps`) y el texto plano
+se devuelve tal cual, sin intentar interpretarlo como JSON.
+"""
+import json
+from operator import attrgetter
+
+from sqlalchemy import JSON, Date, DateTime
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+_SERIALIZERS = {}
+
+
+def _iso(value):
+    return value.isoformat()
+
+
+def _decode_json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _converter_for(column_type):
+    if isinstance(column_type, (Date, DateTime)):
+        return _iso
+    if isinstance(column_type, JSON):
+        return _decode_json
+    return None
+
+
+def build_serializer(model):
+    """Construye la función `instancia -> dict` de un modelo."""
+    names = []
+    attrs = []
+    converters = []
+    for column in model.__table__.columns:
+        names.append(column.name)
+        attrs.append(model.__mapper__.get_property_by_column(column).key)
+        converter = _converter_for(column.type)
+        if converter is not None:
+            converters.append((column.name, converter))
+
+    getter = attrgetter(*attrs)
+    single = len(attrs) == 1
+
+    def serialize(instance):
+        if instance is None:
+            return None
+        values = getter(instance)
+        data = dict(zip(names, (values,) if single else values))
+        for name, converter in converters:
+            value = data[name]
+            if value is not None:
+                data[name] = converter(value)
+        return data
+
+    serialize.__name__ = f'serialize_{model.__name__}'
+    return serialize
+
+
+def serializer_for(model):
+    """Devuelve (y memoriza) el serializador precompilado de un modelo."""
+    serializer = _SERIALIZERS.get(model)
+    if serializer is None:
+        serializer = _SERIALIZERS[model] = build_serializer(model)
+    return serializer
+
+
+def build_all(base_model):
+    """Precompila los serializadores de todos los modelos mapeados en `base_model`."""
+    for mapper in base_model.registry.mappers:
+        serializer_for(mapper.class_)
+
+
+if orjson is not None:
+    def dumps(obj, default=None):
+        """Codifica a JSON compacto usando orjson."""
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    def dumps(obj, default=None):
+        """Codifica a JSON compacto (sin orjson instalado)."""
+        return json.dumps(obj, default=default, separators=(',', ':'))
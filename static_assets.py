@@ -0,0 +1,180 @@
+"""Entrega de las páginas estáticas del front-end.
+
+Las páginas se leen una vez por proceso y se sirven desde memoria con:
+
+- ETag fuerte derivado del contenido servido (sha256), distinto por codificación.
+- Variantes gzip/brotli precomprimidas, calculadas una sola vez por página (o
+  leídas del directorio generado por `flask build-static`).
+- URLs versionadas: las referencias locales (`src`, `href`, `data-src`) se
+  reescriben como `Pagina.html?v=<hash>`. Lo pedido con la versión vigente se
+  marca `immutable` por un año, así navegar entre módulos desde index.html no
+  vuelve a tocar la red; la página de entrada se revalida siempre (`no-cache`)
+  y responde 304 si no cambió.
+
+Solo se sirven archivos con extensiones del front-end; el código y los datos del
+directorio (app.py, datos.xlsx, ...) ya no son accesibles por HTTP.
+
+Para no ocupar un worker de la aplicación, `flask build-static --out DIR` deja
+cada archivo con sus variantes `.gz`/`.br` para nginx o una CDN:
+
+    location /static-build/ { internal; alias DIR/; gzip_static on; brotli_static on; }
+
+y con STATIC_ACCEL_PREFIX=/static-build/ la app solo responde la cabecera
+`X-Accel-Redirect` (con las mismas cabeceras de caché) y nginx envía el archivo.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+import compression
+
+STATIC_EXTENSIONS = frozenset({
+    '.html', '.css', '.js', '.svg', '.ico', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff2', '.pdf',
+})
+COMPRESSIBLE_EXTENSIONS = frozenset({'.html', '.css', '.js', '.svg'})
+SKIPPED_DIRECTORIES = frozenset({'__pycache__', 'benchmarks', 'node_modules', 'venv', '.venv'})
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+MANIFEST_NAME = 'manifest.json'
+_SUFFIXES = {'gzip': 'gz', 'br': 'br'}
+
+# Referencias locales a reescribir con la versión: atributo="archivo.ext"
+_REFERENCE = re.compile(r'\b(src|href|data-src)="([A-Za-z0-9_\-./]+\.[A-Za-z0-9]+)"')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:20]
+
+
+class Asset:
+    """Una página o recurso con su contenido final y sus variantes comprimidas."""
+
+    def __init__(self, name, content, version, variants=None):
+        self.name = name
+        self.content = content
+        # `version` es el hash del archivo fuente (el de las URLs `?v=`); el ETag
+        # usa el del contenido servido, que incluye las referencias reescritas.
+        self.version = version
+        self.digest = _digest(content)
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.mimetype.startswith('text/') or self.mimetype in ('application/javascript', 'image/svg+xml'):
+            self.mimetype += '; charset=utf-8'
+        self.compressible = os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        self._variants = dict(variants or {})
+        self._lock = threading.Lock()
+
+    def offered_encodings(self):
+        if not self.compressible:
+            return []
+        return [e for e in compression.PREFERENCE if e in self._variants or e in compression.COMPRESSORS]
+
+    def body(self, encoding):
+        """Contenido para `encoding` (None = sin comprimir), comprimido una sola vez."""
+        if encoding is None:
+            return self.content
+        variant = self._variants.get(encoding)
+        if variant is None:
+            with self._lock:
+                variant = self._variants.get(encoding)
+                if variant is None:
+                    variant = self._variants[encoding] = compression.compress(self.content, encoding)
+        return variant
+
+    def etag(self, encoding):
+        return self.digest if encoding is None else f'{self.digest}-{encoding}'
+
+
+class AssetStore:
+    """Índice de los archivos estáticos de `root`, cargado una vez por proceso."""
+
+    def __init__(self, root, build_dir=None):
+        self.root = os.path.abspath(root)
+        self.build_dir = os.path.abspath(build_dir) if build_dir else None
+        self._assets = None
+        self._lock = threading.Lock()
+
+    def _source_files(self, exclude):
+        excluded = {os.path.abspath(path) for path in exclude if path}
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = [
+                d for d in subdirectories
+                if not d.startswith(('.', '_')) and d not in SKIPPED_DIRECTORIES
+                and os.path.join(directory, d) not in excluded
+            ]
+            for filename in files:
+                if filename.startswith(('.', '~')) or os.path.splitext(filename)[1].lower() not in STATIC_EXTENSIONS:
+                    continue
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), path
+
+    def _load_sources(self, exclude=()):
+        raw = {}
+        for name, path in self._source_files([self.build_dir, *exclude]):
+            with open(path, 'rb') as f:
+                raw[name] = f.read()
+        versions = {name: _digest(content) for name, content in raw.items()}
+
+        def versioned(match):
+            attribute, target = match.groups()
+            version = versions.get(target)
+            return f'{attribute}="{target}?v={version}"' if version else match.group(0)
+
+        assets = {}
+        for name, content in raw.items():
+            if os.path.splitext(name)[1].lower() in ('.html', '.css', '.js'):
+                content = _REFERENCE.sub(versioned, content.decode('utf-8')).encode('utf-8')
+            assets[name] = Asset(name, content, versions[name])
+        return assets
+
+    def _load_build(self):
+        with open(os.path.join(self.build_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assets = {}
+        for name, entry in manifest['files'].items():
+            path = os.path.join(self.build_dir, name)
+            with open(path, 'rb') as f:
+                content = f.read()
+            variants = {}
+            for encoding in entry['encodings']:
+                with open(f'{path}.{_SUFFIXES[encoding]}', 'rb') as f:
+                    variants[encoding] = f.read()
+            assets[name] = Asset(name, content, entry['version'], variants)
+        return assets
+
+    def assets(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    use_build = self.build_dir and os.path.exists(os.path.join(self.build_dir, MANIFEST_NAME))
+                    self._assets = self._load_build() if use_build else self._load_sources()
+        return self._assets
+
+    def get(self, name):
+        return self.assets().get(name)
+
+    def build(self, out_dir):
+        """Escribe cada archivo (ya versionado) con sus variantes `.gz`/`.br` y un manifiesto."""
+        manifest = {'files': {}}
+        for name, asset in self._load_sources(exclude=[out_dir]).items():
+            path = os.path.join(out_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(asset.content)
+            encodings = []
+            for encoding in asset.offered_encodings():
+                body = asset.body(encoding)
+                # Una variante que no ahorra nada solo ocupa disco
+                if len(body) >= len(asset.content):
+                    continue
+                with open(f'{path}.{_SUFFIXES[encoding]}', 'wb') as f:
+                    f.write(body)
+                encodings.append(encoding)
+            manifest['files'][name] = {'version': asset.version, 'encodings': encodings}
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return manifest['files']
+
@@ -0,0 +1,157 @@
+"""Sincronización incremental de colecciones (`?since=`).
+
+Cada fila de un modelo `Sincronizable` guarda en `updated_xid` el identificador
+de la transacción que la escribió por última vez (`txid_current()`) y en
+`updated_at` la hora; los borrados dejan una lápida en `registros_eliminados`.
+Todo lo mantienen triggers, así que también cubre import_data.py y psql.
+
+El cursor que se entrega al cliente es el `xmin` de una instantánea tomada
+antes de leer los cambios: toda transacción con identificador menor ya había
+terminado, de modo que sus filas quedaron incluidas en la respuesta. Las filas
+de transacciones aún abiertas (identificador >= cursor) se vuelven a enviar en
+la siguiente consulta; el cliente las aplica de forma idempotente.
+"""
+from sqlalchemy import select, text
+from sqlalchemy.schema import CreateIndex
+
+from models import db, Sincronizable, RegistroEliminado
+
+FUNCTION = 'damar_sync'
+
+
+def synced_models():
+    return sorted(
+        (mapper.class_ for mapper in db.Model.registry.mappers if issubclass(mapper.class_, Sincronizable)),
+        key=lambda model: model.__tablename__
+    )
+
+
+def function_ddl():
+    tombstones = RegistroEliminado.__tablename__
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION}_marca() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            NEW.updated_xid := txid_current();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION}_lapidas() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {tombstones} (table_name, record_id, deleted_xid)
+            SELECT TG_TABLE_NAME, to_jsonb(e) ->> TG_ARGV[0], txid_current() FROM eliminadas e;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION}_truncate() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {tombstones} (table_name, record_id, deleted_xid)
+            VALUES (TG_TABLE_NAME, NULL, txid_current());
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ]
+
+
+def trigger_ddl(model):
+    """Sentencias que agregan las columnas y crean los triggers de un modelo."""
+    table = model.__tablename__
+    pk = model.__table__.primary_key.columns.values()[0].name
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now();",
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_xid BIGINT NOT NULL DEFAULT 0;",
+        f"DROP TRIGGER IF EXISTS {FUNCTION}_marca ON {table};",
+        f"""
+        CREATE TRIGGER {FUNCTION}_marca
+        BEFORE INSERT OR UPDATE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {FUNCTION}_marca();
+        """,
+        f"DROP TRIGGER IF EXISTS {FUNCTION}_lapidas ON {table};",
+        f"""
+        CREATE TRIGGER {FUNCTION}_lapidas
+        AFTER DELETE ON {table} REFERENCING OLD TABLE AS eliminadas
+        FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}_lapidas('{pk}');
+        """,
+        f"DROP TRIGGER IF EXISTS {FUNCTION}_truncate ON {table};",
+        f"""
+        CREATE TRIGGER {FUNCTION}_truncate
+        AFTER TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}_truncate();
+        """,
+    ]
+
+
+def _xid_index(model):
+    """Índice de `updated_xid` que declara `Sincronizable` (index=True) en la tabla del modelo."""
+    return next(index for index in model.__table__.indexes if index.columns.keys() == ['updated_xid'])
+
+
+def install(connection):
+    """Crea la tabla de lápidas, las columnas de seguimiento y los triggers."""
+    RegistroEliminado.__table__.create(bind=connection, checkfirst=True)
+    for statement in function_ddl():
+        connection.exec_driver_sql(statement)
+    for model in synced_models():
+        for statement in trigger_ddl(model):
+            connection.exec_driver_sql(statement)
+        connection.execute(CreateIndex(_xid_index(model), if_not_exists=True))
+
+
+def snapshot_cursor(session):
+    """`xmin` de la instantánea actual: el cursor a entregar al cliente."""
+    return session.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+
+def needs_reset(session, model, since):
+    """True si hubo un TRUNCATE o una poda de lápidas posterior al cursor."""
+    return session.execute(select(RegistroEliminado.id).where(
+        RegistroEliminado.table_name == model.__tablename__,
+        RegistroEliminado.record_id.is_(None),
+        RegistroEliminado.deleted_xid >= since,
+    ).limit(1)).first() is not None
+
+
+def deleted_ids(session, model, since):
+    """Claves primarias (con su tipo) de las filas borradas desde el cursor."""
+    pk = model.__table__.primary_key.columns.values()[0]
+    python_type = pk.type.python_type
+    rows = session.execute(select(RegistroEliminado.record_id).where(
+        RegistroEliminado.table_name == model.__tablename__,
+        RegistroEliminado.record_id.isnot(None),
+        RegistroEliminado.deleted_xid >= since,
+    ).order_by(RegistroEliminado.deleted_xid, RegistroEliminado.id)).scalars()
+    return [python_type(record_id) for record_id in dict.fromkeys(rows)]
+
+
+def prune(connection, older_than_days):
+    """Borra las lápidas más viejas que `older_than_days` días.
+
+    Deja por cada tabla podada una marca de recarga con el mayor identificador
+    borrado, así los clientes con un cursor anterior recargan la tabla completa.
+    """
+    tombstones = RegistroEliminado.__tablename__
+    result = connection.execute(text(f"""
+        WITH podadas AS (
+            DELETE FROM {tombstones}
+            WHERE deleted_at < now() - make_interval(days => :days)
+            RETURNING table_name, deleted_xid
+        )
+        INSERT INTO {tombstones} (table_name, record_id, deleted_xid)
+        SELECT table_name, NULL, MAX(deleted_xid) FROM podadas GROUP BY table_name
+        RETURNING table_name
+    """), {'days': older_than_days})
+    pruned = [row[0] for row in result]
+    # Solo hace falta la marca de recarga más reciente de cada tabla
+    connection.exec_driver_sql(f"""
+        DELETE FROM {tombstones} t WHERE record_id IS NULL AND EXISTS (
+            SELECT 1 FROM {tombstones} m
+            WHERE m.table_name = t.table_name AND m.record_id IS NULL AND m.deleted_xid > t.deleted_xid
+        )
+    """)
+    return pruned
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# app.py exige DATABASE_URL al importarse; las pruebas no abren conexiones
+os.environ.setdefault('DATABASE_URL', 'postgresql://damar@127.0.0.1:1/damar_pruebas')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
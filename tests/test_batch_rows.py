@@ -0,0 +1,50 @@
+"""Pruebas de la conversión de tipos de las filas de los lotes (app.coerce_row) sin base de datos."""
+import datetime
+
+import pytest
+
+import app as damar
+from models import Cliente, LlegadaTela, ProductoTerminado
+
+
+def test_values_follow_column_type():
+    row = damar.coerce_row(LlegadaTela.__table__, {
+        'id': '7', 'cantidad_value': '12.5', 'entry_date': '2024-03-01', 'serial_rollo': 12345, 'extra': 'x',
+    })
+    assert row == {
+        'id': 7, 'cantidad_value': 12.5, 'entry_date': datetime.date(2024, 3, 1), 'serial_rollo': '12345',
+        'extra': 'x',
+    }
+
+
+def test_nulls_and_json_columns_pass_through():
+    row = damar.coerce_row(ProductoTerminado.__table__, {'lote': None, 'materials_used': [{'id': 1}]})
+    assert row == {'lote': None, 'materials_used': [{'id': 1}]}
+
+
+@pytest.mark.parametrize('model, key, value', [
+    (LlegadaTela, 'cantidad_value', 'mucho'),
+    (LlegadaTela, 'cantidad_value', True),
+    (LlegadaTela, 'id', '1.5'),
+    (LlegadaTela, 'id', 2**31),
+    (Cliente, 'fecha', '2024-02-30'),
+    (Cliente, 'fecha', 20240201),
+    (Cliente, 'factura', {'numero': 1}),
+])
+def test_invalid_values_name_the_column(model, key, value):
+    with pytest.raises(ValueError, match=f'"{key}"'):
+        damar.coerce_row(model.__table__, {key: value})
+
+
+def test_text_longer_than_the_column_is_rejected():
+    with pytest.raises(ValueError, match='supera los 100 caracteres'):
+        damar.coerce_row(Cliente.__table__, {'factura': 'X' * 101})
+
+
+def test_product_rows_validate_numbers_and_dates():
+    row, _, _ = damar.normalize_product_row({'cantidad': '10', 'fecha': '2024-03-01', 'id': '4', 'lote': None})
+    assert row['cantidad'] == 10.0 and row['fecha'] == datetime.date(2024, 3, 1) and row['id'] == 4
+    assert 'lote' not in row
+    for bad in ({'cantidad': 'diez'}, {'fecha': '2024-13-01'}):
+        with pytest.raises(ValueError):
+            damar.normalize_product_row(bad)
@@ -0,0 +1,210 @@
+"""Pruebas de la gramática de filtros, orden y búsqueda (filters.py) sin base de datos."""
+import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+import app as damar
+import filters
+from models import HistorialTela, ProductoTerminado, Usuario, Venta, VentaLinea
+
+
+def compiled(condition):
+    result = condition.compile(dialect=postgresql.dialect())
+    return str(result), result.params
+
+
+def single(model, *pairs):
+    (condition,) = filters.conditions(model, MultiDict(pairs))
+    return compiled(condition)
+
+
+# --- Operadores ---
+@pytest.mark.parametrize('suffix, operator', [
+    ('', '='), ('__eq', '='), ('__gte', '>='), ('__gt', '>'), ('__lte', '<='), ('__lt', '<'),
+])
+def test_comparisons(suffix, operator):
+    sql, params = single(Venta, (f'total_sale{suffix}', '150.5'))
+    assert sql == f'ventas.total_sale {operator} %(total_sale_1)s'
+    assert params == {'total_sale_1': 150.5}
+
+
+def test_in_list_converts_each_value():
+    sql, params = single(HistorialTela, ('fabric_id__in', '3, 7,,9'))
+    assert 'historial_telas.fabric_id IN' in sql
+    assert params == {'fabric_id_1': [3, 7, 9]}
+
+
+def test_values_follow_column_type():
+    assert single(ProductoTerminado, ('has_sample', 'sí'))[0] == 'productos_terminados.has_sample = true'
+    assert single(ProductoTerminado, ('has_sample', 'false'))[0] == 'productos_terminados.has_sample = false'
+    assert single(Venta, ('sale_date__gte', '2024-03-01'))[1] == {'sale_date_1': datetime.date(2024, 3, 1)}
+    assert single(ProductoTerminado, ('referencia', '00123'))[1] == {'referencia_1': '00123'}
+
+
+def test_repeated_parameter_adds_one_condition_per_value():
+    conditions = filters.conditions(Venta, MultiDict([('total_sale__gte', '1'), ('total_sale__gte', '2')]))
+    assert len(conditions) == 2
+
+
+def test_ignored_and_reserved_parameters_are_skipped():
+    args = MultiDict([('limit', '5'), ('after', 'x'), ('order_by', 'id'), ('q', 'tela'), ('_', '1700000000000')])
+    assert filters.conditions(Venta, args, ignore=('limit', 'after')) == []
+
+
+def test_underscore_parameters_do_not_count_as_filters():
+    assert not filters.requested(MultiDict([('since', '0'), ('_', '1700000000000')]), ignore=('since',))
+    assert filters.requested(MultiDict([('since', '0'), ('total_sale__eq', '1')]), ignore=('since',))
+
+
+# --- Errores ---
+@pytest.mark.parametrize('model, key, value', [
+    (Venta, 'no_existe', '1'),
+    (Usuario, 'contraseña', 'secreta'),
+    (ProductoTerminado, 'materials_used', '[]'),
+    (Venta, 'total_sale__like', '1'),
+    (Venta, 'total_sale', 'mucho'),
+    (HistorialTela, 'fabric_id__in', ' , '),
+    (ProductoTerminado, 'has_sample', 'quizás'),
+    (Venta, 'sale_date', '01/02/2024'),
+])
+def test_invalid_filters_raise(model, key, value):
+    with pytest.raises(filters.FilterError):
+        filters.conditions(model, MultiDict([(key, value)]))
+
+
+def test_hidden_and_json_columns_cannot_be_ordered():
+    with pytest.raises(filters.FilterError):
+        filters.ordering(Usuario, 'contraseña')
+    with pytest.raises(filters.FilterError):
+        filters.ordering(ProductoTerminado, '-fabrics_used')
+
+
+# --- Fechas solas en columnas de fecha y hora ---
+START = datetime.datetime(2024, 1, 2)
+END = datetime.datetime(2024, 1, 3)
+
+
+@pytest.mark.parametrize('suffix, expected', [
+    ('', [('>=', START), ('<', END)]),
+    ('__gte', [('>=', START)]),
+    ('__gt', [('>=', END)]),
+    ('__lte', [('<', END)]),
+    ('__lt', [('<', START)]),
+])
+def test_bare_date_covers_the_whole_day(suffix, expected):
+    sql, params = single(HistorialTela, (f'timestamp{suffix}', '2024-01-02'))
+    assert [value for value in params.values()] == [value for _, value in expected]
+    for operator, _ in expected:
+        assert f'historial_telas.timestamp {operator} ' in sql
+
+
+def test_full_datetime_is_compared_as_is():
+    sql, params = single(HistorialTela, ('timestamp__lt', '2024-01-02T10:30:00'))
+    assert sql == 'historial_telas.timestamp < %(timestamp_1)s'
+    assert params == {'timestamp_1': datetime.datetime(2024, 1, 2, 10, 30)}
+
+
+def test_in_list_of_bare_dates_expands_each_day():
+    sql, params = single(HistorialTela, ('timestamp__in', '2024-01-02,2024-01-05'))
+    assert sql.count(' OR ') == 1
+    assert sorted(params.values()) == [
+        START, END, datetime.datetime(2024, 1, 5), datetime.datetime(2024, 1, 6),
+    ]
+
+
+# --- Búsqueda de texto ---
+def test_search_escapes_like_wildcards():
+    sql, params = compiled(filters.search_condition(ProductoTerminado, '10%_a\\b'))
+    patterns = [value for value in params.values() if isinstance(value, str) and value.startswith('%')]
+    assert patterns == ['%10\\%\\_a\\\\b%']
+    assert ' ILIKE ' in sql and '%%>' in sql
+
+
+def test_search_requires_every_term():
+    sql, params = compiled(filters.search_condition(ProductoTerminado, 'rollo  azul'))
+    assert sql.count(' ILIKE ') == 2
+    assert {'%rollo%', '%azul%', 'rollo', 'azul'} <= set(params.values())
+
+
+def test_search_blank_and_unsupported_models():
+    assert filters.search_condition(ProductoTerminado, '   ') is None
+    with pytest.raises(filters.FilterError):
+        filters.search_condition(VentaLinea, 'algo')
+
+
+def test_search_index_matches_query_expression():
+    ddl = filters.search_index_ddl(ProductoTerminado)
+    assert ddl.startswith('CREATE INDEX IF NOT EXISTS ix_productos_terminados_busqueda ON productos_terminados')
+    assert "coalesce(referencia, '') || ' ' || coalesce(serial, '')" in ddl
+    assert ddl.endswith('gin_trgm_ops)')
+
+
+# --- Integración con las rutas de colecciones ---
+class RecordingQuery:
+    """Imita la Query de SQLAlchemy: registra filtros y orden y no devuelve filas."""
+
+    def __init__(self):
+        self.filters, self.order = [], []
+
+    def filter(self, *conditions):
+        self.filters += conditions
+        return self
+
+    def order_by(self, *clauses):
+        self.order += clauses
+        return self
+
+    def limit(self, _):
+        return self
+
+    def all(self):
+        return []
+
+
+def collection_body(url, model, **kwargs):
+    query = RecordingQuery()
+    with damar.app.test_request_context(url):
+        response = damar._collection_body(
+            query, model, kwargs.get('order_column'), kwargs.get('descending', False), damar.model_to_dict
+        )
+    return query, response
+
+
+def test_since_with_filters_is_rejected():
+    with pytest.raises(filters.FilterError):
+        collection_body('/sales?since=0&punto_venta=Centro', Venta)
+    with pytest.raises(filters.FilterError):
+        collection_body('/sales?since=0&order_by=-sale_date', Venta)
+    with damar.app.app_context():
+        response, status = damar.handle_filter_error(filters.FilterError('x'))
+    assert status == 400 and response.get_json() == {'success': False, 'message': 'x'}
+
+
+def test_since_ignores_cache_buster(monkeypatch):
+    monkeypatch.setattr(damar, 'sync_response', lambda *args: 'sincronizado')
+    _, response = collection_body('/sales?since=0&_=1700000000000', Venta)
+    assert response == 'sincronizado'
+
+
+def test_cache_buster_is_not_a_filter():
+    query, response = collection_body('/sales?_=1700000000000&total_sale__eq=10', Venta)
+    assert response.status_code == 200
+    assert [compiled(condition)[0] for condition in query.filters] == ['ventas.total_sale = %(total_sale_1)s']
+
+
+@pytest.mark.parametrize('order_by, direction', [('id', 'ASC'), ('-id', 'DESC')])
+def test_order_by_primary_key_pages_by_key_alone(order_by, direction):
+    query, response = collection_body(
+        f'/inventory/fabrics-history?order_by={order_by}', HistorialTela,
+        order_column=HistorialTela.timestamp, descending=True,
+    )
+    assert response.status_code == 200
+    assert [str(clause) for clause in query.order] == [f'historial_telas.id {direction}']
+
+
+def test_order_by_column_replaces_route_order():
+    query, _ = collection_body('/sales?order_by=-sale_date&punto_venta=Centro', Venta)
+    assert [str(clause) for clause in query.order] == ['ventas.sale_date DESC NULLS LAST', 'ventas.id DESC']
+    assert [compiled(condition)[0] for condition in query.filters] == ['ventas.punto_venta = %(punto_venta_1)s']
@@ -0,0 +1,139 @@
+"""Consumo de materiales y telas por producto en tablas relacionales.
+
+`ProductoTerminado.materials_used` / `fabrics_used` conservan la lista tal como
+la envió el cliente (la API la devuelve igual), y además cada elemento queda
+como una fila de `producto_materiales` / `producto_telas`, escrita en la misma
+transacción que el producto. Las preguntas por insumo ("qué productos usaron
+el rollo X", "cuánto se consumió del material Y este mes") y la reposición de
+stock al borrar productos son consultas indexadas sobre esas tablas, sin leer
+ni interpretar el JSON de cada producto.
+"""
+import json
+import logging
+
+from sqlalchemy import bindparam, delete, func, select
+
+from models import ProductoTerminado, ProductoMaterial, ProductoTela
+
+logger = logging.getLogger(__name__)
+
+# Columna JSON del producto -> (modelo de uso, columna con el ID del insumo)
+KINDS = {
+    'materials_used': (ProductoMaterial, 'material_id'),
+    'fabrics_used': (ProductoTela, 'fabric_id'),
+}
+
+
+def parse_list(value):
+    """Valida una lista de consumos (`[{id, quantity_used, ...}]`, o su JSON) con IDs y cantidades numéricos."""
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ValueError('Se esperaba una lista de consumos.')
+    return [{**item, 'id': int(item['id']), 'quantity_used': float(item.get('quantity_used', 0) or 0)} for item in value]
+
+
+def insert(session, products):
+    """Agrega las filas de uso de productos nuevos.
+
+    `products` es `[(product_id, materials_used, fabrics_used)]` con listas ya
+    validadas por `parse_list`; una sentencia INSERT por tabla.
+    """
+    for position, (model, id_column) in enumerate(KINDS.values()):
+        rows = [
+            {'product_id': product[0], 'posicion': index, id_column: item['id'], 'quantity_used': item['quantity_used']}
+            for product in products
+            for index, item in enumerate(product[1 + position])
+        ]
+        if rows:
+            session.execute(model.__table__.insert(), rows)
+
+
+def replace(session, products):
+    """Como `insert`, para productos que ya tenían filas de uso (p. ej. tras editarlos)."""
+    ids = [product[0] for product in products]
+    for model, _ in KINDS.values():
+        session.execute(delete(model).where(model.product_id.in_(ids)))
+    insert(session, products)
+
+
+def totals(session, product_ids):
+    """Consumo total de `product_ids` por insumo: `({material_id: cantidad}, {fabric_id: cantidad})`."""
+    result = []
+    for model, id_column in KINDS.values():
+        item_id = getattr(model, id_column)
+        rows = session.execute(
+            select(item_id, func.sum(model.quantity_used))
+            .where(model.product_id.in_(list(product_ids)))
+            .group_by(item_id)
+        )
+        result.append({row[0]: float(row[1] or 0) for row in rows})
+    return tuple(result)
+
+
+def consumers_query(field, item_id, date_from=None, date_to=None):
+    """Productos que consumieron el insumo `item_id` (`field`: 'materials_used' o 'fabrics_used').
+
+    Una fila por producto con la cantidad total usada, más recientes primero;
+    `date_from` / `date_to` filtran por la fecha del producto (inclusive).
+    """
+    model, id_column = KINDS[field]
+    quantity = func.sum(model.quantity_used).label('quantity_used')
+    query = (
+        select(
+            ProductoTerminado.id, ProductoTerminado.serial, ProductoTerminado.referencia,
+            ProductoTerminado.lote, ProductoTerminado.fecha, quantity,
+        )
+        .join(ProductoTerminado, ProductoTerminado.id == model.product_id)
+        .where(getattr(model, id_column) == item_id)
+        .group_by(ProductoTerminado.id)
+        .order_by(ProductoTerminado.fecha.desc().nullslast(), ProductoTerminado.id.desc())
+    )
+    if date_from is not None:
+        query = query.where(ProductoTerminado.fecha >= date_from)
+    if date_to is not None:
+        query = query.where(ProductoTerminado.fecha <= date_to)
+    return query
+
+
+def _decoded(value):
+    if isinstance(value, str):
+        return json.loads(value) if value else None
+    return value
+
+
+def backfill(connection, batch_size=2000):
+    """Reconstruye las tablas de uso desde el JSON de todos los productos.
+
+    De paso guarda como listas JSON los consumos que estaban guardados como
+    cadenas `json.dumps`. Los productos con consumos mal formados se omiten
+    (se registran en el log). Devuelve `(productos procesados, IDs omitidos)`.
+    """
+    for model, _ in KINDS.values():
+        connection.execute(delete(model))
+    products = ProductoTerminado.__table__
+    normalize = products.update().where(products.c.id == bindparam('pid')).values(
+        materials_used=bindparam('mats'), fabrics_used=bindparam('fabs')
+    )
+    result = connection.execution_options(stream_results=True).execute(
+        select(products.c.id, products.c.materials_used, products.c.fabrics_used).order_by(products.c.id)
+    )
+    processed, skipped = 0, []
+    for partition in result.partitions(batch_size):
+        batch, legacy = [], []
+        for product_id, materials_used, fabrics_used in partition:
+            try:
+                batch.append((product_id, parse_list(materials_used), parse_list(fabrics_used)))
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Consumos mal formados en el producto ID {product_id}; se omite: {e}")
+                skipped.append(product_id)
+                continue
+            if isinstance(materials_used, str) or isinstance(fabrics_used, str):
+                legacy.append({'pid': product_id, 'mats': _decoded(materials_used), 'fabs': _decoded(fabrics_used)})
+        insert(connection, batch)
+        if legacy:
+            connection.execute(normalize, legacy)
+        processed += len(batch)
+    return processed, skipped
@@ -0,0 +1,112 @@
+"""Versiones de cambio por tabla para las respuestas condicionales (ETag).
+
+Cada tabla de datos tiene un trigger por sentencia que, tras cualquier
+INSERT/UPDATE/DELETE/TRUNCATE, agrega a `table_changes` una fila con la tabla y
+el identificador de la transacción (`txid_current()`); las sentencias
+siguientes de la misma transacción chocan con esa fila y no agregan nada. Cada
+transacción escribe su propia clave, así que los escritores de una misma tabla
+no se esperan entre sí. Los triggers cubren también las escrituras hechas fuera
+de la API (import_data.py, psql).
+
+La versión de una tabla se arma al leer con el mayor `xid`, el mayor `id` y la
+cantidad de filas visibles. Mientras no se compacte, las filas solo se agregan
+y cada commit que escribió la tabla suma una, aunque haya empezado antes que
+otro ya confirmado; `compact` reemplaza las filas viejas por una sola con un
+`id` nuevo, mayor que todos los asignados, así que tampoco repite una versión
+anterior. El `xid` crece durante toda la vida del clúster: ni recreando la
+tabla de cambios se repite una versión.
+"""
+from sqlalchemy import func, select, text
+
+from models import db, CambioTabla, RegistroEliminado
+
+FUNCTION = 'damar_version_tabla'
+
+# Tablas que no llevan versión: la propia tabla de cambios, la de migraciones
+# y las lápidas de sync.py (cada borrado ya cambia la versión de su tabla)
+EXCLUDED_TABLES = frozenset({CambioTabla.__tablename__, RegistroEliminado.__tablename__, 'schema_migrations'})
+
+
+def versioned_tables():
+    return sorted(name for name in db.metadata.tables if name not in EXCLUDED_TABLES)
+
+
+def function_ddl():
+    return f"""
+    CREATE OR REPLACE FUNCTION {FUNCTION}() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {CambioTabla.__tablename__} (table_name, xid)
+        VALUES (TG_TABLE_NAME, txid_current())
+        ON CONFLICT (table_name, xid) DO NOTHING;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """
+
+
+def trigger_ddl(table):
+    """Sentencias que crean (o reemplazan) el trigger de versión de una tabla."""
+    trigger = f"{FUNCTION}_{table}"
+    return [
+        f"DROP TRIGGER IF EXISTS {trigger} ON {table};",
+        f"""
+        CREATE TRIGGER {trigger}
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}();
+        """,
+    ]
+
+
+def install(connection):
+    """Crea la tabla de cambios y los triggers de todas las tablas de datos.
+
+    Las migraciones que agregan tablas deben volver a llamarla.
+    """
+    CambioTabla.__table__.create(bind=connection, checkfirst=True)
+    connection.exec_driver_sql(function_ddl())
+    for table in versioned_tables():
+        for statement in trigger_ddl(table):
+            connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(
+        f"INSERT INTO {CambioTabla.__tablename__} (table_name, xid) "
+        f"SELECT unnest(%(tables)s::text[]), txid_current() ON CONFLICT (table_name, xid) DO NOTHING",
+        {'tables': versioned_tables()}
+    )
+
+
+def current_versions(session, tables):
+    """Devuelve `{tabla: versión}` para las tablas pedidas ('0' si aún no tiene cambios)."""
+    rows = session.execute(
+        select(CambioTabla.table_name, func.max(CambioTabla.xid), func.max(CambioTabla.id), func.count())
+        .where(CambioTabla.table_name.in_(list(tables)))
+        .group_by(CambioTabla.table_name)
+    ).all()
+    versions = dict.fromkeys(tables, '0')
+    versions.update((table, f'{xid}.{change_id}.{count}') for table, xid, change_id, count in rows)
+    return versions
+
+
+def compact(connection):
+    """Reduce a una sola fila los cambios terminados de cada tabla que tenga varios.
+
+    Solo toca las filas de transacciones anteriores al `xmin` de la instantánea
+    (ya confirmadas o abortadas); las de transacciones abiertas siguen sumando
+    al confirmarse. Devuelve las tablas compactadas.
+    """
+    changes = CambioTabla.__tablename__
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': changes})
+    result = connection.exec_driver_sql(f"""
+        WITH terminadas AS (
+            SELECT table_name FROM {changes}
+            WHERE xid < txid_snapshot_xmin(txid_current_snapshot())
+            GROUP BY table_name HAVING count(*) > 1
+        ), borradas AS (
+            DELETE FROM {changes} c USING terminadas t
+            WHERE c.table_name = t.table_name AND c.xid < txid_snapshot_xmin(txid_current_snapshot())
+            RETURNING c.table_name
+        )
+        INSERT INTO {changes} (table_name, xid)
+        SELECT DISTINCT table_name, txid_current() FROM borradas
+        RETURNING table_name
+    """)
+    return sorted(row[0] for row in result)